@@ -0,0 +1,28 @@
+"""Compares the vectorized nfirst merge with the legacy per-user loop.
+
+Run from the repository root: PYTHONPATH=src python benchmarks/nfirst_merge.py
+"""
+import time
+
+import numpy as np
+
+from modelapi.hybrid_models.nfirst import NfirstHybrid
+from tests.test_hybrid_models import legacy_nfirst_merge, make_candidates
+
+
+def benchmark_nfirst_merge(users_num=1000, N=10, n=0.2, repeats=5):
+    rng = np.random.default_rng(0)
+    n_collab = max(int(n * N), 1)
+    collab = make_candidates(rng, users_num, 3000, n_collab)
+    content = make_candidates(rng, users_num, 3000, N)
+
+    for name, merge in [("legacy", legacy_nfirst_merge), ("vectorized", NfirstHybrid.merge_recs)]:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            merge(*collab, *content, N - n_collab)
+        print(f"{name:>10}: {(time.perf_counter() - start) / repeats * 1000:.2f} ms per batch of {users_num} users")
+
+
+if __name__ == "__main__":
+    for users_num in [1, 100, 1000]:
+        benchmark_nfirst_merge(users_num)
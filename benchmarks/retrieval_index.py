@@ -0,0 +1,42 @@
+"""Compares the retrieval indexes with implicit's recommend on synthetic ALS-like factors.
+
+Run from the repository root: PYTHONPATH=src python benchmarks/retrieval_index.py
+"""
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from implicit.cpu.als import AlternatingLeastSquares as ALS
+
+from modelapi.retrieval_index import ExactIndex, IVFIndex
+from tests.test_retrieval_index import make_factors, recall
+
+
+def benchmark_recall(users_num=500, items_num=50000, N=50, clusters_num=256):
+    rng = np.random.default_rng(0)
+    user_factors, item_factors = make_factors(rng, users_num, items_num, 64)
+    model = ALS(factors=64)
+    model.user_factors, model.item_factors = user_factors, item_factors
+    user_items = sp.csr_matrix((users_num, items_num), dtype=np.float32)
+
+    start = time.perf_counter()
+    model.recommend(np.arange(users_num), user_items, N, filter_already_liked_items=False)
+    model_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = ExactIndex(item_factors).search(user_factors, N)[0]
+    print(f"exact: {(time.perf_counter() - start) / model_seconds:.2f} of model.recommend time")
+
+    index = IVFIndex(item_factors, clusters_num=clusters_num)
+    for probes in [1, 2, 4, 8, 16, 32, 64]:
+        index.set_probes(probes)
+        start = time.perf_counter()
+        recs = index.search(user_factors, N)[0]
+        seconds = time.perf_counter() - start
+        print(f"probes {probes:>3}: recall@{N} {recall(recs, expected):.3f}, {seconds / model_seconds:.2f} of model.recommend time")
+
+
+if __name__ == "__main__":
+    for items_num in [5000, 50000]:
+        print(f"{items_num} items")
+        benchmark_recall(items_num=items_num)
@@ -0,0 +1,42 @@
+import contextlib
+import json
+
+import clickhouse_connect
+import numpy as np
+import pytest
+
+from modelapi.config import config
+from modelapi.data_manager import DataManager
+
+
+@pytest.fixture
+def make_data_manager(monkeypatch, tmp_path):
+    monkeypatch.setattr(clickhouse_connect, 'get_client', lambda **kwargs: None)
+    monkeypatch.setitem(config['paths'], 'temp', str(tmp_path))
+    return DataManager
+
+
+class FakeClient():
+    """ClickHouse client streaming the given raw blocks for any query."""
+
+    def __init__(self, blocks) -> None:
+        self.blocks = blocks
+
+    def query_np_stream(self, query):
+        return contextlib.nullcontext(np.array(block, dtype=object) for block in self.blocks)
+
+
+@pytest.fixture
+def fake_client():
+    return FakeClient
+
+
+@pytest.fixture
+def recorded_blocks():
+    with open('src/tests/data/raw_interactions_blocks.json') as json_file:
+        return json.load(json_file)
+
+
+@pytest.fixture
+def all_ids():
+    return lambda converter: converter.backward_many(np.arange(converter.get_count())).tolist()
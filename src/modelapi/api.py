@@ -1,18 +1,44 @@
 import logging
 import json
+import time
+from typing import List
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
 
 import modelapi.logger
+from modelapi import metrics
 from modelapi.config import config
-from modelapi.processor import Processor
+from modelapi.leader import get_serving_directory, start_processor
+from modelapi.processor import ModelType, Processor
+from modelapi.shared_snapshot import SnapshotReader
 
 app = FastAPI()
 HOME_PAGE = 'https://www.hse.ru/edu/dpo/'
 
 
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.request_seconds.observe(
+              time.perf_counter() - start
+            , method=request.method
+            , route=route.path if route is not None else "unmatched"
+            , status=status
+        )
+
+
+if metrics.is_enabled():
+    app.middleware("http")(record_request_latency)
+
+
 def courseid_to_link(courseid):
     if courseid is None:
         return None
@@ -30,22 +56,31 @@ def get_rec(userid: str, fields_num: int = 10, adv_perc: float = 0, bottom_perc:
     return JSONResponse(content=recommendation, status_code=200)
 
 
+class BatchRecommendationRequest(BaseModel):
+    userids: List[str]
+    fields_num: int = 10
+    adv_perc: float = 0
+    bottom_perc: float = 0
+    as_link: bool = False
+
+
+@app.post("/recomendation/batch")
+def get_rec_batch(request: BatchRecommendationRequest):
+    recommendations = app.processor.recommend_batch(request.userids, request.fields_num, request.adv_perc, request.bottom_perc)
+    if request.as_link:
+        recommendations = [
+            None if recommendation is None else [courseid_to_link(courseid) for courseid in recommendation]
+            for recommendation in recommendations
+        ]
+    return JSONResponse(content=dict(zip(request.userids, recommendations)), status_code=200)
+
+
 @app.get("/recently_viewed/")
 def get_recently_viewed(userid: str, fields_num: int = 10, as_link: bool = False):
     if app.processor.check_userid(userid):
         return JSONResponse(content="User not found", status_code=404)
     
-    viewed = app.processor._data_manager._client.query(
-        f'''
-            SELECT extract(current_location, '([0-9]+)')
-            FROM raw_interactions
-            WHERE user_id LIKE '%|{userid}|%|%'
-            GROUP BY extract(current_location, '([0-9]+)')
-            ORDER BY MAX(event_timestamp) DESC
-            LIMIT {fields_num}
-        '''
-    )
-    viewed = viewed.result_columns[0]
+    viewed = app.processor.get_recently_viewed(userid, fields_num)
     if as_link:
         viewed = [courseid_to_link(courseid) for courseid in viewed]
     return JSONResponse(content=viewed, status_code=200)
@@ -59,13 +94,15 @@ def get_viewed(userid: str, fields_num: int = 0, as_link: bool = False):
     if app.processor.check_userid(userid):
         return JSONResponse(content="User not found", status_code=404)
     
-    interactions = app.processor._data_manager.get_interaction_csr_matrix()
-    userid_in_csr = app.processor._data_manager._users_id_converter.get_forward(userid)
+    snapshot = app.processor.get_snapshot()
+    userid_in_csr = snapshot.users_id_converter.get_forward(userid)
+    if userid_in_csr is None:
+        return JSONResponse(content="User not found", status_code=404)
 
     import numpy as np
 
-    user_interactions = np.where(interactions.getrow(userid_in_csr).getnnz(axis=0) > 0)[0]
-    viewed = [app.processor._data_manager._courses_id_converter.get_backward(courseid_in_csr) for courseid_in_csr in user_interactions]
+    user_interactions = np.where(snapshot.interactions.getrow(userid_in_csr).getnnz(axis=0) > 0)[0]
+    viewed = snapshot.courses_id_converter.backward_many(user_interactions).tolist()
     if as_link:
         viewed = [courseid_to_link(courseid) for courseid in viewed]
     return JSONResponse(content=viewed, status_code=200)
@@ -93,25 +130,31 @@ def get_rec_and_viewed(userid: str, rec_fields_num: int = 10, viewed_fields_coun
 
 @app.get("/user_course_coefficient/")
 def read_item(userid: str, courseid: str):
-    content = {"coefficient": app.processor._data_manager.get_user_course_coefficient(userid, courseid)}
+    content = {"coefficient": app.processor.get_user_course_coefficient(userid, courseid)}
     if content is None:
         return JSONResponse(content="User or course not found in system", status_code=404)
     return JSONResponse(content=content, status_code=200)
 
 
 @app.get("/top_courses/")
-def get_top(fields_num: int = 10, as_link: bool = False):
-    courses = app.processor.get_top_courses(fields_num)
+def get_top(fields_num: int = 10, as_link: bool = False, window_hours: int = 0, decayed: bool = False):
+    try:
+        courses = app.processor.get_top_courses(fields_num, window_hours, decayed)
+    except ValueError as e:
+        return JSONResponse(content=str(e), status_code=400)
     if as_link:
-        courses = [(courseid_to_link(courseid), n) for [courseid, n] in courses]
+        courses = [courseid_to_link(courseid) for courseid in courses]
     return JSONResponse(content=courses, status_code=200)
 
 
 @app.get("/bottom_courses/")
-def get_bottom(fields_num: int = 10, as_link: bool = False):
-    courses = app.processor.get_bottom_courses(fields_num)
+def get_bottom(fields_num: int = 10, as_link: bool = False, window_hours: int = 0, decayed: bool = False):
+    try:
+        courses = app.processor.get_bottom_courses(fields_num, window_hours, decayed)
+    except ValueError as e:
+        return JSONResponse(content=str(e), status_code=400)
     if as_link:
-        courses = [(courseid_to_link(courseid), n) for [courseid, n] in courses]
+        courses = [courseid_to_link(courseid) for courseid in courses]
     return JSONResponse(content=courses, status_code=200)
 
 
@@ -123,8 +166,34 @@ def get_adv(as_link: bool = False):
     return JSONResponse(content=courses, status_code=200)
 
 
+@app.get("/stats/")
+def get_stats():
+    content = {
+          "recommendation_cache": app.processor.get_recommendation_cache_stats()
+        , "fold_in_cache": app.processor.get_fold_in_cache_stats()
+        , "latency": app.processor.get_latency_stats()
+        , "ingestion": app.processor.get_ingestion_stats()
+        , "retention": app.processor.get_retention_stats()
+    }
+    return JSONResponse(content=content, status_code=200)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Metrics of this process in the Prometheus text format.
+
+    With several workers ingestion and training run in the leader process, so a worker reports its requests only.
+    """
+    if not metrics.is_enabled():
+        return JSONResponse(content="Metrics are disabled", status_code=404)
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/force_load_updates_and_full_retrain/")
 async def force_retrain():
+    if app.scheduler is None:
+        return JSONResponse(content="Retraining is done by the leader process", status_code=409)
+
     app.scheduler.pause()
     temp, app.processor._last_full_fit_timestemp = app.processor._last_full_fit_timestemp, 0
     app.processor._full_incoming_updates = 1
@@ -142,17 +211,17 @@ async def startup():
     app.logger = logging.getLogger('main')
     app.logger.info("Application initialization")
 
-    app.processor = Processor()
-    await app.processor.load_cosine_model()
-    await app.processor.load_updates_and_retrain()
-
-    app.scheduler = AsyncIOScheduler()
-    app.scheduler.add_job(app.processor.load_updates_and_retrain, 'interval', seconds=int(config["jobs_threshold"]["load_updates"]))
-    app.scheduler.start()
+    if int(config["serving"]["workers"]) > 1:
+        app.processor = Processor(snapshot_reader=SnapshotReader(get_serving_directory(), ModelType, float(config["serving"]["refresh_seconds"])))
+        app.scheduler = None
+    else:
+        app.processor, app.scheduler = await start_processor()
 
     app.logger.info("Application started")
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    app.scheduler.shutdown()
\ No newline at end of file
+    if app.scheduler is not None:
+        app.scheduler.shutdown()
+    app.processor.close()
\ No newline at end of file
@@ -0,0 +1,140 @@
+import json
+import os
+import os.path
+import shutil
+import time
+import numpy as np
+
+from modelapi.helpers import csr_from_arrays, csr_to_arrays
+
+MANIFEST_NAME = 'manifest.json'
+POINTER_NAME = 'current'
+
+
+def write_version(directory, arrays, metadata = None, previous = None, reused = ()):
+    """Writes arrays as a new version directory of .npy files and a manifest, then makes it current.
+
+    The reused arrays of the previous version are hard-linked instead of written again.
+    The version is complete on disk before the pointer file is atomically replaced,
+    so readers see either the previous or the new version.
+    """
+    os.makedirs(directory, exist_ok=True)
+    version = '%020d' % time.time_ns()
+    temp_path = os.path.join(directory, version + '.tmp')
+    os.makedirs(temp_path)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(temp_path, name + '.npy'), array)
+    described = {name: {'dtype': np.asarray(array).dtype.str, 'shape': list(np.shape(array))} for name, array in arrays.items()}
+    if reused:
+        previous_path = os.path.join(directory, previous)
+        previous_arrays = _read_manifest(previous_path)['arrays']
+        for name in reused:
+            _link(os.path.join(previous_path, name + '.npy'), os.path.join(temp_path, name + '.npy'))
+            described[name] = previous_arrays[name]
+    manifest = {
+          'version': version
+        , 'arrays': described
+        , 'metadata': metadata or dict()
+    }
+    with open(os.path.join(temp_path, MANIFEST_NAME), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(temp_path, os.path.join(directory, version))
+
+    pointer_path = os.path.join(directory, POINTER_NAME + '.tmp')
+    with open(pointer_path, 'w') as pointer_file:
+        pointer_file.write(version)
+    os.replace(pointer_path, os.path.join(directory, POINTER_NAME))
+    return version
+
+
+def _read_manifest(path):
+    with open(os.path.join(path, MANIFEST_NAME)) as manifest_file:
+        return json.load(manifest_file)
+
+
+def _link(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def get_current_version(directory):
+    try:
+        with open(os.path.join(directory, POINTER_NAME)) as pointer_file:
+            return pointer_file.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def read_version(directory, version):
+    """Returns the arrays and metadata of a version.
+
+    Arrays are memory-mapped copy-on-write: pages are shared between processes until written,
+    and implicit gets the writable buffers it requires.
+    """
+    path = os.path.join(directory, version)
+    manifest = _read_manifest(path)
+    arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='c') for name in manifest['arrays']}
+    return arrays, manifest['metadata']
+
+
+def reclaim_versions(directory, keep_versions):
+    """Removes all but the newest keep_versions versions.
+
+    Processes that still map a removed version keep their pages, the files are freed when the last
+    mapping is closed.
+    """
+    current = get_current_version(directory)
+    versions = sorted(name for name in os.listdir(directory) if name.isdigit())
+    for version in versions[:-keep_versions]:
+        if version != current:
+            shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+
+
+def save_hybrid_models(path, model_collaborative, model_content, keep_versions = 2, retrieval_index = None, users_only = False):
+    """Saves the fitted factors of an ALS model, their retrieval index and the similarity of an item-item model under path + 'hybrid'.
+
+    users_only writes the user factors only and links the other arrays from the current version, e.g. after a partial fit.
+    """
+    directory = path + 'hybrid'
+    previous = get_current_version(directory) if users_only else None
+    if previous is not None and model_collaborative.user_factors is not None:
+        reused = [name for name in _read_manifest(os.path.join(directory, previous))['arrays'] if name != 'user_factors']
+        version = write_version(directory, {'user_factors': model_collaborative.user_factors}, previous=previous, reused=reused)
+        reclaim_versions(directory, keep_versions)
+        return version
+
+    arrays = dict()
+    if model_collaborative.user_factors is not None:
+        arrays['user_factors'] = model_collaborative.user_factors
+        arrays['item_factors'] = model_collaborative.item_factors
+    if retrieval_index is not None:
+        arrays.update({'retrieval_' + name: array for name, array in retrieval_index.get_state().items()})
+    if getattr(model_content, 'similarity', None) is not None:
+        arrays.update(csr_to_arrays(model_content.similarity, 'similarity_'))
+
+    version = write_version(directory, arrays)
+    reclaim_versions(directory, keep_versions)
+    return version
+
+
+def load_hybrid_models(path, model_collaborative, model_content):
+    """Attaches the models to the current version saved by save_hybrid_models.
+
+    Returns the saved retrieval index state, None if there is no version.
+    """
+    directory = path + 'hybrid'
+    version = get_current_version(directory)
+    if version is None:
+        return None
+
+    arrays, _ = read_version(directory, version)
+    if 'user_factors' in arrays:
+        model_collaborative.user_factors = arrays['user_factors']
+        model_collaborative.item_factors = arrays['item_factors']
+    if 'similarity_data' in arrays:
+        model_content.__setstate__(dict(model_content.__getstate__(), similarity=csr_from_arrays(arrays, 'similarity_')))
+    prefix = 'retrieval_'
+    return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+from itertools import chain, zip_longest
+
+import numpy as np
+
+
+class FoldInCache():
+    """LRU cache of user factors folded in by the collaborative model, keyed by user and model version.
+
+    Users whose interactions changed since the last fit are not in the model factors and are solved
+    from their interactions on request. Their factors are kept until the user's interactions change
+    or a new model version is loaded. Like in RecommendationCache a put given a version read before the
+    factors were solved is skipped if an invalidation happened meanwhile. A size of 0 disables the cache.
+    """
+
+    def __init__(self, size) -> None:
+        self._size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._model_version = 0
+        self._version = 0
+
+        self._hits = 0
+        self._misses = 0
+
+    def get_many(self, userids):
+        """Returns the cached factors of every user, None for the users that are not cached."""
+        with self._lock:
+            factors = [self._entries.get((self._model_version, userid), None) for userid in userids]
+            for userid, user_factors in zip(userids, factors):
+                if user_factors is not None:
+                    self._entries.move_to_end((self._model_version, userid))
+            self._hits += sum(user_factors is not None for user_factors in factors)
+            self._misses += sum(user_factors is None for user_factors in factors)
+            return factors
+
+    def get_version(self):
+        return self._version
+
+    def put_many(self, userids, factors, version = None):
+        if self._size <= 0:
+            return
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            for userid, user_factors in zip(userids, factors):
+                self._entries[(self._model_version, userid)] = user_factors
+                self._entries.move_to_end((self._model_version, userid))
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    def invalidate_users(self, userids):
+        if len(userids) == 0:
+            return
+        with self._lock:
+            self._version += 1
+            for userid in userids:
+                self._entries.pop((self._model_version, userid), None)
+
+    def invalidate_model(self):
+        with self._lock:
+            self._version += 1
+            self._model_version += 1
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self._size, "hits": self._hits, "misses": self._misses}
+
+
+def recommend_fallback(similar_items, popular, user_items, N):
+    """Recommends to users with few interactions without the model.
+
+    The precomputed similar courses of the user's courses are taken in turn, the table pads them with
+    popular courses, then popular is used as is. Courses of the user are skipped. Returns a list of arrays.
+    """
+    recommendations = list()
+    for i in range(user_items.shape[0]):
+        seen = user_items.indices[user_items.indptr[i]:user_items.indptr[i + 1]]
+        rows = similar_items.lookup(seen, N + len(seen)) if similar_items is not None and len(seen) else []
+        recommendation, skipped = list(), set(seen.tolist())
+        for course in chain(chain.from_iterable(zip_longest(*rows)), popular):
+            if len(recommendation) == N:
+                break
+            if course is not None and course not in skipped:
+                skipped.add(course)
+                recommendation.append(course)
+        recommendations.append(np.array(recommendation, dtype=np.int64))
+    return recommendations
@@ -1,59 +1,97 @@
 import asyncio
-import scipy
-import os.path
+import hashlib
 import logging
+import os.path
 import numpy as np
+import pandas as pd
 import scipy.sparse as sp
 
 from concurrent.futures import ProcessPoolExecutor
 from implicit.nearest_neighbours import CosineRecommender
 
+from modelapi import artifacts
+from modelapi.helpers import csr_from_arrays, csr_to_arrays
+
 class CosineContent:
     __logger = logging.getLogger("CosineModel")
         
-    def load_courses_features(data_manager):
+    features_path = "datasets/courses_features.csv"
+    _chunk_rows = 10000
+    _neighbours_num = 131
+
+    def load_courses_features(data_manager, cache_path):
+        """Adds the feature csv course ids to the data manager and returns the cached features version.
+
+        The csv is converted once into memory-mapped arrays under cache_path, keyed by its sha256.
+        """
         CosineContent.__logger.info('Start setup courses features')
 
-        with open("datasets/courses_features.csv", "rb") as file:
-            courses_ids_in_csr_ids_order = np.loadtxt(file, usecols=1, dtype=np.str_, delimiter="^", skiprows=1)
-            file.seek(0)
-            courses_features_with_embeddings = np.loadtxt(file, delimiter="^", skiprows=1)  
-        np.vectorize(data_manager._courses_id_converter.add)((courses_ids_in_csr_ids_order).astype(np.int32))
-        courses_features_with_embeddings = np.delete(courses_features_with_embeddings, [0, 1], 1)
-        courses_features_with_embeddings = sp.csr_matrix(courses_features_with_embeddings)
+        file_hash = CosineContent._file_hash(CosineContent.features_path)
+        version = artifacts.get_current_version(cache_path)
+        if version is None or artifacts.read_version(cache_path, version)[1].get('sha256') != file_hash:
+            CosineContent.__logger.info('Start convert courses features')
+            ids, embeddings = CosineContent._parse_features(CosineContent.features_path)
+            version = artifacts.write_version(cache_path, {'ids': ids, 'embeddings': embeddings}, {'sha256': file_hash})
+            artifacts.reclaim_versions(cache_path, 1)
+
+        arrays, _ = artifacts.read_version(cache_path, version)
+        data_manager._courses_id_converter.add_many(arrays['ids'])
 
         CosineContent.__logger.info('Finished setup courses features')
-        return courses_features_with_embeddings
+        return version
 
-    def _fit_cos(path):
-        with open("temp.npz", 'rb') as f:
-            courses_features_with_embeddings = scipy.sparse.load_npz(f)
+    def _file_hash(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
 
-        item_item_model = CosineRecommender(K=131)
-        item_item_model.fit(courses_features_with_embeddings,True)
+    def _parse_features(path):
+        """Parses the csv by chunks of rows, returns the course ids and the embeddings that follow them."""
+        ids, embeddings = list(), list()
+        for chunk in pd.read_csv(path, sep="^", chunksize=CosineContent._chunk_rows):
+            ids.append(chunk.iloc[:, 1].to_numpy(dtype=np.int64))
+            embeddings.append(chunk.iloc[:, 2:].to_numpy(dtype=np.float32))
+        return np.concatenate(ids), np.concatenate(embeddings)
 
-        with open(path, 'wb') as f:
-            item_item_model.save(f)
+    def _fit_cos(cache_path, features_version, path):
+        arrays, _ = artifacts.read_version(cache_path, features_version)
 
-    async def load(data_manager, path):
+        item_item_model = CosineRecommender(K=CosineContent._neighbours_num)
+        item_item_model.fit(sp.csr_matrix(arrays['embeddings']),True)
+
+        artifacts.write_version(path, csr_to_arrays(item_item_model.similarity, 'similarity_'))
+        artifacts.reclaim_versions(path, 1)
+
+    async def load(data_manager, path, cache_path):
+        """Loads the model saved under path, a legacy path + '.npz' file when there is no version, or trains it."""
         CosineContent.__logger.info("Start load CosineContent")
-        if not os.path.exists(path):
+        if artifacts.get_current_version(path) is None and os.path.exists(path + '.npz'):
+            with open(path + '.npz', 'rb') as f:
+                model = CosineRecommender(K=CosineContent._neighbours_num).load(f)
+            CosineContent.__logger.info("Finished load legacy CosineContent")
+            return model
+
+        if artifacts.get_current_version(path) is None:
             CosineContent.__logger.info("Start train CosineContent")
 
-            with open("temp.npz", 'wb') as f:
-                scipy.sparse.save_npz(f, CosineContent.load_courses_features(data_manager))
-            
-            with ProcessPoolExecutor() as executor:
+            features_version = CosineContent.load_courses_features(data_manager, cache_path)
+            with ProcessPoolExecutor(1) as executor:
                 loop = asyncio.get_running_loop()
-                await loop.run_in_executor(executor, CosineContent._fit_cos, path)
-
-            os.remove("temp.npz")
+                await loop.run_in_executor(executor, CosineContent._fit_cos, cache_path, features_version, path)
 
             CosineContent.__logger.info("Finished train CosineContent")
 
-        with open(path, 'rb') as f:
-            model = CosineRecommender(K=131).load(f)
+        arrays, _ = artifacts.read_version(path, artifacts.get_current_version(path))
+        model = CosineContent.from_similarity(csr_from_arrays(arrays, 'similarity_'))
 
         CosineContent.__logger.info("Finished load CosineContent")
 
         return model
+
+    def from_similarity(similarity):
+        """Returns the cosine model with a ready similarity matrix, as load and the snapshot reader attach it."""
+        model = CosineRecommender(K=CosineContent._neighbours_num)
+        model.__setstate__(dict(model.__getstate__(), similarity=similarity))
+        return model
@@ -2,14 +2,24 @@ import time
 import clickhouse_connect
 import re
 import numpy as np
+import pandas as pd
 import scipy.sparse as sp
 import logging
+import multiprocessing
+import os
 import os.path
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from json import load as jsonload
-from collections import Counter
 
-from modelapi.config import sensitive_config
-from modelapi.helpers import IdConverter
+from modelapi import metrics
+from modelapi.config import config, sensitive_config
+from modelapi.helpers import IdConverter, IdConverterView, get_resident_memory, update_csr_matrix, with_prefix
+from modelapi.interaction_store import InteractionStore
+from modelapi.popularity_index import PopularityIndex
+from modelapi.prefetcher import BlockPrefetcher
+from modelapi.refit_queue import RefitQueue
+from modelapi.serving_snapshot import ServingSnapshot
 
 HOME_PAGE = 'https://www.hse.ru/edu/dpo/'
 browser_events = ['start_session', 'fingerprint', 'tracker_created', 'dom_content_loaded']
@@ -27,149 +37,439 @@ class DataManager():
         )
         self._last_read_time = 0
         
-        self._changed_users = set()
-        self._user_courses_interaction_info = dict()
+        self._ingestion_mode = config['ingestion']['mode']
+        self._queue_depth = int(config['ingestion']['queue_depth'])
+        self._parse_workers = int(config['ingestion']['parse_workers'])
+        self._parse_executor = None
+        self._ingestion_stats = dict()
+
+        self._refit_queue = RefitQueue()
+        self._last_changed_users = set()
+        self._interactions = InteractionStore()
+        self._interactions_lock = threading.Lock()
+        self._updated_interactions = list()
         self._interaction_csr_matrix = sp.csr_matrix((0, 0), dtype=np.float32)
 
         self._users_id_converter = IdConverter()
         self._courses_id_converter = IdConverter()
 
-        self._courses_top_list = Counter()
+        self._popularity_half_life = int(config['popularity']['half_life'])
+        self._popularity_index = PopularityIndex(int(config['popularity']['window_hours']), self._popularity_half_life)
+
+        self._checkpoint_path = os.path.join(config['paths']['temp'], 'data_manager_checkpoint.npz')
+        if os.path.exists(self._checkpoint_path):
+            self._restore_checkpoint(self._checkpoint_path)
         
         self._adv_courses = list()
         if os.path.exists("adv_courses.json"):
             with open("adv_courses.json") as json_file:
                 adv = jsonload(json_file)
-            self._adv_courses = [self._courses_id_converter.add(courseid) for courseid in adv]
+            self._adv_courses = self._courses_id_converter.add_many(adv).tolist()
         
 
     def load_updates(self):
         logger.info('Start loading updates')
-
-        with self._get_raw_updates_stream() as raw_stream:
-            for raw_data in raw_stream:
-                logger.info('Trying to update the data with a block of size ' + str(len(raw_data)))
-
-                transformed_data = self._tranform_raw_data(raw_data)
-                self._recalculate_interactions(transformed_data)
-                
-                def add_pop(x):
-                    self._courses_top_list[x] += 1
-                
-                np.vectorize(add_pop)(transformed_data[:, 1])
+        self._last_changed_users = set()
+        stats = {'blocks': 0, 'rows': 0, 'parse_seconds': 0, 'update_seconds': 0}
+        start = time.perf_counter()
+
+        is_aggregated = self._ingestion_mode == 'aggregated'
+        submit = None
+        if not is_aggregated and self._parse_workers > 0:
+            if self._parse_executor is None:
+                self._parse_executor = ProcessPoolExecutor(self._parse_workers, mp_context=multiprocessing.get_context('spawn'))
+            submit = lambda raw_data: self._parse_executor.submit(DataManager._parse_raw_data, raw_data)
+
+        with self._get_raw_updates_stream() as raw_stream, BlockPrefetcher(raw_stream, self._queue_depth, submit) as blocks:
+            for block in blocks:
+                stage_start = time.perf_counter()
+                if is_aggregated:
+                    data = block
+                elif submit is None:
+                    data = DataManager._parse_raw_data(block)
+                else:
+                    data = block.result()
+                parse_seconds = time.perf_counter() - stage_start
+                stats['parse_seconds'] += parse_seconds
+                metrics.stage_seconds.observe(parse_seconds, stage='transform')
+                logger.info('Trying to update the data with a block of size ' + str(len(data)))
+
+                stage_start = time.perf_counter()
+                if is_aggregated:
+                    with metrics.stage_seconds.time(stage='load_aggregated'):
+                        self._load_aggregated_data(data)
+                else:
+                    transformed_data = self._convert_parsed_data(data)
+                    with metrics.stage_seconds.time(stage='recalculate_interactions'):
+                        self._recalculate_interactions(transformed_data)
+                    with metrics.stage_seconds.time(stage='popularity_update'):
+                        self._popularity_index.add(transformed_data[:, 1].astype(np.int64), transformed_data[:, 4].astype(np.int64))
+                stats['update_seconds'] += time.perf_counter() - stage_start
+                stats['blocks'] += 1
+                stats['rows'] += len(data)
+                metrics.ingested_blocks.inc()
+                metrics.ingested_rows.inc(len(data))
 
                 logger.info('Finished updating data with the block')
 
-        dok_matrix = sp.dok_matrix(
-            (
-                  self._users_id_converter.get_count()
-                , self._courses_id_converter.get_count()
-            )
-            , dtype=np.float32
-        )
-
-        for (user_id, course_id), info in self._user_courses_interaction_info.items():
-            dok_matrix[user_id, course_id] = info.coefficient
-
-        self._interaction_csr_matrix = dok_matrix.tocsr()
-
-        logger.info('Finished loading updates')
+        stage_start = time.perf_counter()
+        self._apply_interaction_updates()
+        stats['apply_seconds'] = time.perf_counter() - stage_start
+        metrics.stage_seconds.observe(stats['apply_seconds'], stage='csr_build')
+
+        stats['fetch_seconds'] = blocks.fetch_seconds
+        stats['wait_seconds'] = blocks.wait_seconds
+        stats['max_queue_size'] = blocks.max_queue_size
+        stats['total_seconds'] = time.perf_counter() - start
+        self._ingestion_stats = stats
+        metrics.stage_seconds.observe(blocks.fetch_seconds, stage='clickhouse_fetch')
+        metrics.stage_seconds.observe(stats['total_seconds'], stage='load_updates')
+
+        logger.info('Finished loading updates: ' + ', '.join(f'{name}={value:.3f}' if isinstance(value, float) else f'{name}={value}' for name, value in stats.items()))
+
+    def get_ingestion_stats(self):
+        """Returns the stage timings of the latest load_updates, see load_updates."""
+        return dict(self._ingestion_stats)
+
+    def close(self):
+        if self._parse_executor is not None:
+            self._parse_executor.shutdown()
+            self._parse_executor = None
     
     def get_user_course_coefficient(self, userid, courseid):
-        userid_in_csr = self._users_id_converter.get_forward(userid)
-        courseid_in_csr = self._courses_id_converter.get_forward(courseid)
-        if userid_in_csr is None or courseid_in_csr is None:
-            return None
-        return self._user_courses_interaction_info.get((userid_in_csr, courseid_in_csr), self._UserCourseInteractionInfo()).coefficient
+        with self._interactions_lock:
+            userid_in_csr = self._users_id_converter.get_forward(userid)
+            courseid_in_csr = self._courses_id_converter.get_forward(courseid)
+            if userid_in_csr is None or courseid_in_csr is None:
+                return None
+            [row] = self._interactions.find([userid_in_csr], [courseid_in_csr])
+            return float(self._interactions.column('coefficient')[row]) if row >= 0 else 0
     
+    def get_recently_viewed(self, userid, N):
+        """Returns up to N course ids the user interacted with, most recent first."""
+        with self._interactions_lock:
+            userid_in_csr = self._users_id_converter.get_forward(userid)
+            if userid_in_csr is None:
+                return None
+            rows = self._interactions.user_rows(userid_in_csr)
+            rows = rows[np.argsort(-self._interactions.column('last_timestamp')[rows], kind='stable')]
+            courses_in_csr = self._interactions.column('courses')[rows]
+
+        return [courseid for courseid in self._courses_id_converter.backward_many(courses_in_csr) if courseid][:N]
+
+    def make_snapshot(self, model):
+        """Builds a ServingSnapshot of the current state. Must not run concurrently with load_updates."""
+        return ServingSnapshot(
+              interactions=self._interaction_csr_matrix
+            , users_id_converter=IdConverterView(self._users_id_converter, self._interaction_csr_matrix.shape[0])
+            , courses_id_converter=IdConverterView(self._courses_id_converter, self._courses_id_converter.get_count())
+            , popularity_index=self._popularity_index.copy()
+            , changed_users=self.get_changed_users()
+            , adv_courses=list(self._adv_courses)
+            , model=model
+        )
+
+    def evict_inactive_users(self, horizon, now = None):
+        """Drops the users without events in the last horizon seconds and compacts the user ids.
+
+        Kept users are renumbered in their order, so the rows of the interaction matrix and the user
+        factors of a model are compacted by indexing them with the returned sorted old ids of the kept users.
+        None is returned when no user is evicted. Must not run concurrently with load_updates.
+        """
+        kept_users = self.get_kept_users(horizon, now)
+        if kept_users is not None:
+            self.compact_users(kept_users)
+        return kept_users
+
+    def get_kept_users(self, horizon, now = None):
+        """Returns the sorted users with events in the last horizon seconds, None when every user is kept."""
+        now = int(time.time()) if now is None else now
+        users_num = self._users_id_converter.get_count()
+        with self._interactions_lock:
+            last_activity = np.full(users_num, np.iinfo(np.int64).min, dtype=np.int64)
+            np.maximum.at(last_activity, self._interactions.column('users'), self._interactions.column('last_timestamp'))
+        kept_users = np.flatnonzero(last_activity >= now - horizon)
+        if len(kept_users) == users_num:
+            return None
+        return kept_users
+
+    def compact_users(self, kept_users):
+        """Keeps the sorted users of get_kept_users only, renumbered in their order. Must not run concurrently with load_updates."""
+        users_num = self._users_id_converter.get_count()
+        new_users = np.full(users_num, -1, dtype=np.int64)
+        new_users[kept_users] = np.arange(len(kept_users))
+        ids, kinds = self._users_id_converter.to_arrays()
+        users_id_converter = IdConverter.from_arrays(ids[kept_users], kinds[kept_users])
+        interactions = self._interactions.compact_users(kept_users)
+        interaction_csr_matrix = self._interaction_csr_matrix[kept_users]
+        interaction_csr_matrix.sort_indices()
+
+        with self._interactions_lock:
+            self._users_id_converter = users_id_converter
+            self._interactions = interactions
+        self._interaction_csr_matrix = interaction_csr_matrix
+        self._refit_queue.compact_users(new_users)
+        self._last_changed_users = DataManager._compact_users_set(self._last_changed_users, new_users)
+
+        logger.info('Evicted ' + str(users_num - len(kept_users)) + ' of ' + str(users_num) + ' users')
+
+    def _compact_users_set(users, new_users):
+        users = new_users[np.array(sorted(users), dtype=np.int64)]
+        return set(users[users >= 0].tolist())
+
+    def get_memory_usage(self):
+        """Returns the bytes held by the main structures and the resident memory of the process."""
+        matrix = self._interaction_csr_matrix
+        return {
+              'interactions': self._interactions.nbytes()
+            , 'interaction_matrix': matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+            , 'users_id_converter': self._users_id_converter.nbytes()
+            , 'courses_id_converter': self._courses_id_converter.nbytes()
+            , 'popularity_index': sum(array.nbytes for array in self._popularity_index.get_state().values())
+            , 'resident': get_resident_memory()
+        }
+
+    def get_changed_users(self):
+        """Returns the users whose interactions changed since their factors were last fitted."""
+        return frozenset(self._refit_queue.get_users().tolist())
+
+    def take_refit_users(self, batch_size = None):
+        """Returns up to batch_size changed users to refit, most recently active first, and the generation for commit_refit."""
+        return self._refit_queue.take(batch_size)
+
+    def commit_refit(self, users, generation):
+        """Drains the users of take_refit_users once their fit is committed, None drains every user after a full fit."""
+        self._refit_queue.commit(users, generation)
+
+    def get_last_timestamps(self, matrix):
+        """Returns the last event timestamp of every nonzero of an interaction matrix of this manager."""
+        users = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        with self._interactions_lock:
+            rows = self._interactions.find(users, matrix.indices)
+            return self._interactions.column('last_timestamp')[rows]
+
+    def get_checkpoint_state(self):
+        """Returns copies of the state needed for a warm restart, see save_checkpoint."""
+        users_ids, users_kinds = self._users_id_converter.to_arrays()
+        courses_ids, courses_kinds = self._courses_id_converter.to_arrays()
+        return {
+              'last_read_time': np.array(self._last_read_time, dtype=np.int64)
+            , **{'refit_' + name: array.copy() for name, array in self._refit_queue.get_state().items()}
+            , 'users_ids': users_ids
+            , 'users_kinds': users_kinds
+            , 'courses_ids': courses_ids
+            , 'courses_kinds': courses_kinds
+            , **{'popularity_' + name: array.copy() for name, array in self._popularity_index.get_state().items()}
+            , **{'interactions_' + name: array for name, array in self._interactions.get_state().items()}
+        }
+
+    def save_checkpoint(state, path):
+        """Atomically writes a state from get_checkpoint_state: a reader sees either the old or the new file."""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as checkpoint_file:
+            np.savez(checkpoint_file, **state)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, path)
+
+    def _restore_checkpoint(self, path):
+        logger.info('Restoring data from the checkpoint ' + path)
+        with np.load(path, allow_pickle=False) as checkpoint:
+            state = {name: checkpoint[name] for name in checkpoint.files}
+
+        self._last_read_time = int(state['last_read_time'])
+        if 'changed_users' in state:
+            self._refit_queue = RefitQueue()
+            self._refit_queue.push(state['changed_users'], np.zeros(len(state['changed_users']), dtype=np.int64))
+        else:
+            self._refit_queue = RefitQueue.from_state(with_prefix(state, 'refit_'))
+        self._users_id_converter = IdConverter.from_arrays(state['users_ids'], state['users_kinds'])
+        self._courses_id_converter = IdConverter.from_arrays(state['courses_ids'], state['courses_kinds'])
+        self._popularity_index = PopularityIndex.from_state(with_prefix(state, 'popularity_'), self._popularity_half_life)
+        self._interactions = InteractionStore.from_state(with_prefix(state, 'interactions_'))
+        self._interaction_csr_matrix = sp.csr_matrix(
+              (
+                  self._interactions.column('coefficient').astype(np.float32)
+                , (self._interactions.column('users'), self._interactions.column('courses'))
+              )
+            , shape=(self._users_id_converter.get_count(), self._courses_id_converter.get_count())
+        )
+        self._interaction_csr_matrix.sort_indices()
+        logger.info('Restored ' + str(len(self._interactions)) + ' interactions read before ' + str(self._last_read_time))
+
     def get_interaction_csr_matrix(self):
         return self._interaction_csr_matrix
 
-    class _UserCourseInteractionInfo():
-        def __init__(self) -> None:
-            self.events_num = 0
-            self.coefficient = 0
-
-            self.anchors = set()
-            self.has_submit_form_event = False
-        
     def _get_raw_updates_stream(self):
         current_time = int(time.time())
 
         logger.info('Sending a query to clickhouse')
-        raw_stream = self._client.query_np_stream(
-            f'''
-                SELECT event_name, current_location, user_id
+        if self._ingestion_mode == 'aggregated':
+            query = DataManager._aggregated_updates_query(self._last_read_time, current_time)
+        else:
+            query = f'''
+                SELECT event_name, current_location, user_id, toUnixTimestamp(event_timestamp)
                 FROM raw_interactions
                 WHERE event_timestamp >= {self._last_read_time}
                 AND event_timestamp < {current_time}
             '''
-        )
+        with metrics.stage_seconds.time(stage='clickhouse_query'):
+            raw_stream = self._client.query_np_stream(query)
         logger.info('Received a response from clickhouse')
 
         self._last_read_time = current_time
         return raw_stream
     
-    def _clear_link(x):
-        x = x.split('?')[0]
-        x = x.split(':~:text')[0]
-        x = re.sub('/#', '#', x)
-        x = re.sub('[#/]$', '', x)
-        x = re.sub('%23', '#', x)
-        return x
-
-    _clear_links_column = np.vectorize(_clear_link)
+    def _aggregated_updates_query(start_time, end_time):
+        """Builds the query of the aggregated ingestion mode.
+
+        ClickHouse repeats _tranform_raw_data and returns one row per (user, course, anchor, hour):
+        user, course, anchor, counted events, submit flag, all events, last event timestamp, hour.
+        """
+        browser_events_list = ', '.join(f"'{event}'" for event in browser_events)
+        return f'''
+            SELECT user, course, anchor
+                , countIf(event_name NOT IN ({browser_events_list})) AS events_num
+                , max(event_name IN ('submit_form', 'form_submit')) AS has_submit_form_event
+                , count() AS events_total
+                , max(timestamp) AS last_timestamp
+                , hour
+            FROM (
+                SELECT event_name, user, timestamp
+                    , intDiv(timestamp, 3600) * 3600 AS hour
+                    , if(position(link, '#') > 0, extract(link, '#([^#]*)'), NULL) AS anchor
+                    , if(startsWith(link, '{HOME_PAGE}'), extract(substring(link, {len(HOME_PAGE) + 1}), '^(\\d*)'), NULL) AS course
+                FROM (
+                    SELECT event_name
+                        , toUnixTimestamp(event_timestamp) AS timestamp
+                        , replaceAll(replaceRegexpOne(replaceAll(replaceRegexpOne(
+                            current_location, '(?s)(\\?|:~:text).*', ''), '/#', '#'), '[#/]$', ''), '%23', '#') AS link
+                        , splitByChar('|', assumeNotNull(user_id)) AS user_parts
+                        , if(isNull(user_id) OR length(user_parts) < 2, NULL, user_parts[2]) AS user
+                    FROM raw_interactions
+                    WHERE event_timestamp >= {start_time}
+                    AND event_timestamp < {end_time}
+                )
+                WHERE isNotNull(event_name) AND event_name NOT IN ('nan', 'none')
+                AND isNotNull(link) AND link NOT IN ('nan', 'none')
+                AND isNotNull(user) AND user NOT IN ('nan', 'none')
+            )
+            GROUP BY user, course, anchor, hour
+            ORDER BY min(timestamp), user, course, anchor
+        '''
+
+    _link_tail_pattern = re.compile(r'(?:\?|:~:text).*', re.S)
+    _anchor_pattern = re.compile(r'#([^#]*)')
+    _course_id_pattern = re.compile('^' + re.escape(HOME_PAGE) + r'(\d*)')
+
+    def _clear_links_column(links):
+        links = links.str.replace(DataManager._link_tail_pattern, '', regex=True)
+        links = links.str.replace('/#', '#', regex=False)
+        links = links.str.replace(r'[#/]$', '', regex=True)
+        links = links.str.replace('%23', '#', regex=False)
+        return links
+
+    def _none_if_missing(column):
+        column = np.array(column, dtype=object)
+        column[pd.isna(column)] = None
+        return column
 
     def _tranform_raw_data(self, raw_data):
-        raw_data[:, 1] = self._clear_links_column(raw_data[:, 1])
-
-        def get_anchor(link):
-            arr = link.split(sep='#')
-            arr.append(None)
-            return arr[1]
-
-        def get_course_id_from_link(link: str):
-            if link.find(HOME_PAGE) != 0:
-                return None
-            start = len(HOME_PAGE)
-            end = start
-            while end != len(link) and link[end].isnumeric():
-                end += 1
-            return link[start:end]
-
-        raw_data[:, 2] = np.vectorize(lambda x: x.split('|')[1])(raw_data[:, 2])
-        raw_data = raw_data[~np.any((raw_data == 'nan') | (raw_data == 'none') | (raw_data == None), axis=1)]
-
-        raw_data = np.concatenate((raw_data, np.vectorize(get_anchor)(raw_data[:, 1]).reshape(-1, 1)), axis=1)
-        raw_data[:, 1] = np.vectorize(get_course_id_from_link)(raw_data[:, 1])
-
-        raw_data[:, 2] = np.vectorize(self._users_id_converter.add)(raw_data[:, 2]).astype(np.int32)
-        raw_data[:, 1] = np.vectorize(self._courses_id_converter.add)(raw_data[:, 1]).astype(np.int16)
-
-        return raw_data
+        return self._convert_parsed_data(DataManager._parse_raw_data(raw_data))
+
+    def _parse_raw_data(raw_data):
+        """Stateless part of _tranform_raw_data, can run in another thread or process.
+
+        Returns the transformed layout with user and course ids not converted yet.
+        """
+        events = pd.Series(raw_data[:, 0], dtype=object)
+        links = DataManager._clear_links_column(pd.Series(raw_data[:, 1], dtype=object))
+        users = pd.Series(raw_data[:, 2], dtype=object).str.split('|', n=2).str[1]
+
+        is_missing = np.zeros(len(raw_data), dtype=bool)
+        for column in (events, links, users):
+            is_missing |= (column.isna() | column.isin(['nan', 'none'])).to_numpy()
+        events, links, users = (column[~is_missing] for column in (events, links, users))
+        timestamps = raw_data[~is_missing, 3].astype(np.int64)
+
+        parsed_data = np.empty((len(events), 5), dtype=object)
+        parsed_data[:, 0] = events.to_numpy(dtype=object)
+        parsed_data[:, 1] = DataManager._none_if_missing(links.str.extract(DataManager._course_id_pattern, expand=False))
+        parsed_data[:, 2] = users.to_numpy(dtype=object)
+        parsed_data[:, 3] = DataManager._none_if_missing(links.str.extract(DataManager._anchor_pattern, expand=False))
+        parsed_data[:, 4] = timestamps
+
+        return parsed_data
+
+    def _convert_parsed_data(self, parsed_data):
+        parsed_data[:, 2] = self._users_id_converter.add_many(parsed_data[:, 2]).astype(np.int32)
+        parsed_data[:, 1] = self._courses_id_converter.add_many(parsed_data[:, 1]).astype(np.int16)
+        return parsed_data
     
-    def _recalculate_interactions(self, transformed_data):
-        for [event, courseid, userid, anchor] in transformed_data:
-            key = (userid, courseid)
-            info = self._user_courses_interaction_info.get(key, self._UserCourseInteractionInfo())
-            
-            info.events_num += 1 if event not in browser_events else 0
+    def _load_aggregated_data(self, aggregated_data):
+        """Applies a block of rows returned by _aggregated_updates_query."""
+        if len(aggregated_data) == 0:
+            return
+
+        users = self._users_id_converter.add_many(DataManager._none_if_missing(aggregated_data[:, 0])).astype(np.int32)
+        courses = self._courses_id_converter.add_many(DataManager._none_if_missing(aggregated_data[:, 1])).astype(np.int16)
+        self._add_interactions(
+              users.astype(np.int64)
+            , courses.astype(np.int64)
+            , aggregated_data[:, 3].astype(np.int64)
+            , aggregated_data[:, 4].astype(bool)
+            , DataManager._none_if_missing(aggregated_data[:, 2])
+            , aggregated_data[:, 6].astype(np.int64)
+        )
+        self._popularity_index.add(courses.astype(np.int64), aggregated_data[:, 7].astype(np.int64), aggregated_data[:, 5].astype(np.int64))
 
-            if anchor is not None:
-                info.anchors.add(anchor)
+    def _recalculate_interactions(self, transformed_data):
+        if len(transformed_data) == 0:
+            return
+
+        events = transformed_data[:, 0]
+        self._add_interactions(
+              transformed_data[:, 2].astype(np.int64)
+            , transformed_data[:, 1].astype(np.int64)
+            , ~np.isin(events, browser_events)
+            , np.isin(events, ['submit_form', 'form_submit'])
+            , transformed_data[:, 3]
+            , transformed_data[:, 4]
+        )
 
-            if 'submit_form' == event or 'form_submit' == event:
-                info.has_submit_form_event = True
+    def _add_interactions(self, users, courses, counted_events, submit_events, anchors, timestamps):
+        with self._interactions_lock:
+            rows = self._interactions.add_pairs(users, courses)
+            touched_rows = self._interactions.add_events(rows, counted_events, submit_events, anchors, timestamps)
 
-            new_coefficient = self._calculate_coefficient(info)
+            coefficients = self._interactions.column('coefficient')
+            new_coefficients = self._calculate_coefficient(
+                  self._interactions.column('events_num')[touched_rows]
+                , self._interactions.column('anchors_num')[touched_rows]
+                , self._interactions.column('has_submit_form_event')[touched_rows]
+            )
 
-            if info.coefficient != new_coefficient:
-                info.coefficient = new_coefficient
-                self._changed_users.add(userid)
-                self._user_courses_interaction_info[key] = info
+            changed_rows = touched_rows[coefficients[touched_rows] != new_coefficients]
+            coefficients[touched_rows] = new_coefficients
+            changed_users = self._interactions.column('users')[changed_rows]
+            self._refit_queue.push(changed_users, self._interactions.column('last_timestamp')[changed_rows])
+        self._last_changed_users.update(changed_users.tolist())
+        self._updated_interactions.append(changed_rows)
+
+    def _apply_interaction_updates(self):
+        rows = np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] + self._updated_interactions))
+
+        self._interaction_csr_matrix = update_csr_matrix(
+              self._interaction_csr_matrix
+            , self._interactions.column('users')[rows]
+            , self._interactions.column('courses')[rows]
+            , self._interactions.column('coefficient')[rows]
+            , (self._users_id_converter.get_count(), self._courses_id_converter.get_count())
+        )
+        self._updated_interactions.clear()
 
-    def _calculate_coefficient(self, info):
-        coefficient = 0.08 + int(info.has_submit_form_event)
-        coefficient += min(0.2, np.log(info.events_num + 1) * 0.4 / np.log(100000))
-        coefficient += min(0.4, np.log(len(info.anchors) + 1) / np.log(1000))
+    def _calculate_coefficient(self, events_num, anchors_num, has_submit_form_event):
+        coefficient = 0.08 + np.asarray(has_submit_form_event, dtype=np.float64)
+        coefficient += np.minimum(0.2, np.log(events_num + 1) * 0.4 / np.log(100000))
+        coefficient += np.minimum(0.4, np.log(anchors_num + 1) / np.log(1000))
         return coefficient
@@ -1,21 +1,279 @@
+import os
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
 class IdConverter():
+    """Converts original ids (str, int or None) to consecutive ids in order of addition.
+
+    Ids are kept as utf-8 bytes in a NumPy array with a kind per id, forward lookups are binary
+    searches over sorted (kind, id) keys. Bulk methods convert whole columns: distinct ids are found
+    with a hash table and joined with the keys. The arrays are replaced, never shrunk or overwritten
+    below get_count, so an IdConverterView may read them while ids are added in another thread.
+    """
+
+    _str_kind, _int_kind, _none_kind = 0, 1, 2
+    _kind_prefixes = np.array([b'0', b'1', b'2'])
+
     def __init__(self) -> None:
-        self._forward_conversation = dict()
-        self._backward_conversation = list()
+        self._count = 0
+        self._ids = np.zeros(0, dtype='S1')
+        self._kinds = np.zeros(0, dtype=np.uint8)
+        self._index = (np.zeros(0, dtype='S1'), np.zeros(0, dtype=np.int64))
 
     def add(self, id):
-        if id not in self._forward_conversation:
-            self._forward_conversation[id] = self.get_count()
-            self._backward_conversation.append(id)
-        return self._forward_conversation[id]
+        return int(self.add_many([id])[0])
+
+    def add_many(self, column):
+        """Adds every id of the column and returns their converted values, new ids are added in order of first appearance."""
+        codes, keys, ids, kinds = IdConverter._factorize(column)
+        converted = self._find(keys)
+        is_new = converted < 0
+        if is_new.any():
+            new_ids = np.arange(self._count, self._count + np.count_nonzero(is_new))
+            self._append(ids[is_new], kinds[is_new])
+            self._insert_keys(keys[is_new], new_ids)
+            self._count += len(new_ids)
+            converted[is_new] = new_ids
+        return converted[codes]
+
+    def get_forward(self, id):
+        key = IdConverter._kind_prefixes[IdConverter.get_kind(id)] + ('' if id is None else str(id)).encode('utf-8')
+        converted = int(self._find(np.array([key]))[0])
+        return None if converted < 0 else converted
+
+    def forward_many(self, column):
+        """Returns the converted ids of the column, -1 for unknown ids."""
+        codes, keys, _, _ = IdConverter._factorize(column)
+        return self._find(keys)[codes]
+
+    def get_backward(self, id):
+        ids, kinds = self._ids, self._kinds
+        if id < 0 or id >= self.get_count():
+            return None
+        if kinds[id] == IdConverter._none_kind:
+            return None
+        original = ids[id].decode('utf-8')
+        return int(original) if kinds[id] == IdConverter._int_kind else original
+
+    def backward_many(self, ids):
+        """Returns an object array of the original ids, None for ids out of range."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        stored_ids, kinds, count = self._ids, self._kinds, self._count
+        is_valid = (ids >= 0) & (ids < count)
+
+        original = np.full(len(ids), None, dtype=object)
+        valid_kinds = kinds[ids[is_valid]]
+        valid_ids = IdConverter._decode(stored_ids[ids[is_valid]]).astype(object)
+        is_int = valid_kinds == IdConverter._int_kind
+        valid_ids[is_int] = [int(id) for id in valid_ids[is_int]]
+        valid_ids[valid_kinds == IdConverter._none_kind] = None
+        original[is_valid] = valid_ids
+        return original
+
+    def get_count(self):
+        return self._count
+
+    def nbytes(self):
+        return self._ids.nbytes + self._kinds.nbytes + self._index[0].nbytes + self._index[1].nbytes
+
+    def get_kind(id):
+        return IdConverter._none_kind if id is None else IdConverter._str_kind if isinstance(id, str) else IdConverter._int_kind
+
+    def to_arrays(self):
+        """Returns views of the ids as utf-8 bytes and of the kind per id (str, int or None), see from_arrays."""
+        return self._ids[:self._count], self._kinds[:self._count]
+
+    def get_index(self):
+        """Returns the sorted (kind, id) keys and the converted id of each key."""
+        return self._index
+
+    def from_arrays(ids, kinds, sorted_keys=None, sorted_positions=None):
+        """Returns a converter over the arrays of to_arrays and get_index without copying them,
+        the index is rebuilt when it is not given. The arrays are only replaced on additions, so they may be memory-mapped."""
+        converter = IdConverter()
+        converter._count = len(ids)
+        converter._ids = ids
+        converter._kinds = kinds
+        if sorted_keys is None:
+            keys = IdConverter._make_keys(ids, kinds)
+            sorted_positions = np.argsort(keys, kind='stable')
+            sorted_keys = keys[sorted_positions]
+        converter._index = (sorted_keys, sorted_positions)
+        return converter
+
+    def _factorize(column):
+        """Returns the codes of the column values and the keys, utf-8 ids and kinds of its distinct values."""
+        column = column if isinstance(column, np.ndarray) else np.array(column, dtype=object)
+        if column.dtype.kind in 'iu':
+            codes, uniques = pd.factorize(column)
+            kinds = np.full(len(uniques), IdConverter._int_kind, dtype=np.uint8)
+            ids = uniques.astype('S')
+        else:
+            codes, uniques = pd.factorize(column.astype(object), use_na_sentinel=False)
+            is_none = pd.isna(uniques)
+            is_str = np.array([isinstance(id, str) for id in uniques], dtype=bool)
+            kinds = np.where(is_none, IdConverter._none_kind, np.where(is_str, IdConverter._str_kind, IdConverter._int_kind)).astype(np.uint8)
+            ids = IdConverter._encode(np.where(is_none, '', uniques).astype(np.str_))
+        return codes, IdConverter._make_keys(ids, kinds), ids, kinds
+
+    def _encode(ids):
+        try:
+            return ids.astype(np.bytes_)
+        except UnicodeEncodeError:
+            return np.char.encode(ids, 'utf-8')
+
+    def _decode(ids):
+        try:
+            return ids.astype(np.str_)
+        except UnicodeDecodeError:
+            return np.char.decode(ids, 'utf-8')
+
+    def _make_keys(ids, kinds):
+        return np.char.add(IdConverter._kind_prefixes[kinds], ids)
+
+    def _find(self, keys):
+        sorted_keys, sorted_positions = self._index
+        positions = np.searchsorted(sorted_keys, keys)
+        is_found = positions < len(sorted_keys)
+        is_found[is_found] = sorted_keys[positions[is_found]] == keys[is_found]
+
+        converted = np.full(len(keys), -1, dtype=np.int64)
+        converted[is_found] = sorted_positions[positions[is_found]]
+        return converted
+
+    def _append(self, ids, kinds):
+        size = self._count + len(ids)
+        dtype = np.result_type(self._ids.dtype, ids.dtype)
+        if size > len(self._kinds) or dtype != self._ids.dtype:
+            capacity = max(size, 2 * len(self._kinds))
+            grown_ids = np.zeros(capacity, dtype=dtype)
+            grown_ids[:self._count] = self._ids[:self._count]
+            grown_kinds = np.zeros(capacity, dtype=np.uint8)
+            grown_kinds[:self._count] = self._kinds[:self._count]
+            self._ids, self._kinds = grown_ids, grown_kinds
+        self._ids[self._count:size] = ids
+        self._kinds[self._count:size] = kinds
+
+    def _insert_keys(self, keys, converted):
+        sorted_keys, sorted_positions = self._index
+        order = np.argsort(keys)
+        keys, converted = keys[order], converted[order]
+        positions = np.searchsorted(sorted_keys, keys)
+        sorted_keys = sorted_keys.astype(np.result_type(sorted_keys.dtype, keys.dtype))
+        self._index = (np.insert(sorted_keys, positions, keys), np.insert(sorted_positions, positions, converted))
+
+
+class IdConverterView():
+    """Read-only view of the first count ids of an append-only IdConverter."""
+
+    def __init__(self, converter, count) -> None:
+        self._converter = converter
+        self._count = count
 
     def get_forward(self, id):
-        return self._forward_conversation.get(id, None)
-    
+        converted = self._converter.get_forward(id)
+        if converted is None or converted >= self._count:
+            return None
+        return converted
+
+    def forward_many(self, column):
+        converted = self._converter.forward_many(column)
+        converted[converted >= self._count] = -1
+        return converted
+
     def get_backward(self, id):
-        if id < 0 or id > self.get_count():
+        if id < 0 or id >= self._count:
             return None
-        return self._backward_conversation[id]
+        return self._converter.get_backward(id)
+
+    def backward_many(self, ids):
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        return self._converter.backward_many(np.where(ids < self._count, ids, -1))
 
     def get_count(self):
-        return len(self._backward_conversation)
+        return self._count
+
+    def to_arrays(self):
+        ids, kinds = self._converter.to_arrays()
+        return ids[:self._count], kinds[:self._count]
+
+    def get_index(self):
+        sorted_keys, sorted_positions = self._converter.get_index()
+        is_visible = sorted_positions < self._count
+        return sorted_keys[is_visible], sorted_positions[is_visible]
+
+
+def get_resident_memory():
+    """Returns the resident set size of the process in bytes, None where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def csr_to_arrays(matrix, prefix):
+    return {prefix + 'data': matrix.data, prefix + 'indices': matrix.indices, prefix + 'indptr': matrix.indptr, prefix + 'shape': np.array(matrix.shape)}
+
+
+def csr_from_arrays(arrays, prefix):
+    return sp.csr_matrix((arrays[prefix + 'data'], arrays[prefix + 'indices'], arrays[prefix + 'indptr']), shape=tuple(arrays[prefix + 'shape']))
+
+
+def with_prefix(arrays, prefix):
+    """Returns the arrays whose names start with prefix, keyed by the rest of the name."""
+    return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+
+def update_csr_matrix(matrix, rows, cols, values, shape):
+    """Sets matrix[rows, cols] = values in bulk and grows the matrix to shape.
+
+    Only the nonzeros of the touched rows are searched: existing cells are overwritten,
+    new cells are inserted with a single pass over indices/data. The matrix must have sorted indices
+    and is not modified, so readers of the old matrix stay consistent. The shape may only grow.
+
+    Each update still writes new data (and, with new cells, indices and indptr) arrays, so it costs
+    O(nnz) however few cells change: serving snapshots keep the old matrix, its arrays cannot be
+    changed in place. Callers batch the cells of a whole block into one update.
+    """
+    indptr = matrix.indptr
+    if shape[0] > matrix.shape[0]:
+        indptr = np.concatenate([indptr, np.full(shape[0] - matrix.shape[0], indptr[-1], dtype=indptr.dtype)])
+    matrix = sp.csr_matrix((matrix.data, matrix.indices, indptr), shape=shape)
+    if len(rows) == 0:
+        return matrix
+
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    values = np.asarray(values, dtype=matrix.dtype)
+    order = np.lexsort((cols, rows))
+    rows, cols, values = rows[order], cols[order], values[order]
+    keys = rows * shape[1] + cols
+
+    touched_rows = np.unique(rows)
+    starts = matrix.indptr[touched_rows].astype(np.int64)
+    lengths = matrix.indptr[touched_rows + 1] - starts
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+    existing_keys = np.repeat(touched_rows, lengths) * shape[1] + matrix.indices[positions]
+
+    found = np.searchsorted(existing_keys, keys)
+    is_existing = found < len(existing_keys)
+    is_existing[is_existing] = existing_keys[found[is_existing]] == keys[is_existing]
+    overwritten = positions[found[is_existing]]
+
+    is_new = ~is_existing
+    if not is_new.any():
+        data = matrix.data.copy()
+        data[overwritten] = values[is_existing]
+        return sp.csr_matrix((data, matrix.indices, matrix.indptr), shape=shape)
+
+    row_index = np.searchsorted(touched_rows, rows[is_new])
+    insert_at = starts[row_index] + found[is_new] - offsets[row_index]
+    indices = np.insert(matrix.indices, insert_at, cols[is_new])
+    data = np.insert(matrix.data, insert_at, values[is_new])
+    data[overwritten + np.searchsorted(insert_at, overwritten, side='right')] = values[is_existing]
+    indptr = matrix.indptr + np.concatenate(([0], np.cumsum(np.bincount(rows[is_new], minlength=shape[0]))))
+    return sp.csr_matrix((data, indices, indptr), shape=shape)
@@ -1,18 +1,22 @@
-import operator
 import os.path
+import numpy as np
 
-from numpy import array as nparray
 from json import load as jsonload
 from implicit.als import AlternatingLeastSquares as ALS
 from implicit.nearest_neighbours import BM25Recommender
 
+from modelapi.artifacts import load_hybrid_models, save_hybrid_models
+from modelapi.retrieval_index import make_retrieval_index, recommend_collaborative
+
 class LinearHybrid:
-    def __init__(self,model_collaborative,collaborative_params,model_content,content_params,a):
+    def __init__(self,model_collaborative,collaborative_params,model_content,content_params,a,retrieval_params=None,retrieval_index=None):
         self.a = a
         self.model_collaborative = model_collaborative
         self.model_content = model_content
         self.collaborative_params = collaborative_params
         self.content_params = content_params
+        self.retrieval_params = retrieval_params
+        self.retrieval_index = retrieval_index
 
     def recommend(
             self,userid
@@ -22,34 +26,44 @@ class LinearHybrid:
         , filter_items = None
         , recalculate_user = False
         , items = None
+        , user_factors = None
     ):
-        def count_score(a,collab,content):
-            return collab*a + (1-a)*content
-        
-        def get_new_dict(a,collab_dict,content_dict):
-            return {k: count_score(a,collab_dict.get(k, 0),content_dict.get(k, 0)) for k in set(collab_dict) | set(content_dict)}
-        
-        def get_sorted_dict(courses_dict,N):
-            return dict(sorted(courses_dict.items(), key = operator.itemgetter(1),reverse=True)[:N])
-        
-        def get_keys_values(courses_dict):
-            recs = [list(courses_dict[i].keys()) for i in range(len(courses_dict))]
-            scores = [list(courses_dict[i].values()) for i in range(len(courses_dict))]
-            return nparray(recs), nparray(scores)
-        
         oversampled_num = min(5*N, user_items.shape[1])
-        collab_recs,collab_scores = self.model_collaborative.recommend(userid, user_items, oversampled_num, filter_already_liked_items, filter_items, recalculate_user, items)
+        collab_recs,collab_scores = recommend_collaborative(self.model_collaborative, self.retrieval_index, userid, user_items, oversampled_num, filter_already_liked_items, filter_items, recalculate_user, items, user_factors)
         content_recs,content_scores = self.model_content.recommend(userid, user_items, oversampled_num, filter_already_liked_items, filter_items, recalculate_user, items)
-        courses_list_dicts_collab = [dict(zip(collab_recs[i],collab_scores[i])) for i in range(user_items.shape[0])]
-        courses_list_dicts_content = [dict(zip(content_recs[i],content_scores[i])) for i in range(user_items.shape[0])]
-        courses_list_dicts = [get_new_dict(self.a,courses_list_dicts_collab[i],courses_list_dicts_content[i]) for i in range(user_items.shape[0])]
-        courses_list_dicts = [get_sorted_dict(courses_list_dicts[i],N) for i in range(user_items.shape[0])]
-        return get_keys_values(courses_list_dicts)
+        return LinearHybrid.fuse_scores(self.a, np.atleast_2d(collab_recs), np.atleast_2d(collab_scores), np.atleast_2d(content_recs), np.atleast_2d(content_scores), N)
+
+    def fuse_scores(a, collab_recs, collab_scores, content_recs, content_scores, N):
+        """Ranks the union of both candidate lists of every user by collab*a + (1-a)*content.
+
+        Candidates are scattered into dense (users, items) score rows, -inf marks items that are in
+        neither list. Rows with fewer than N candidates are padded with id -1 and score -inf.
+        """
+        users_num = collab_recs.shape[0]
+        items_num = max(collab_recs.max(initial=-1), content_recs.max(initial=-1)) + 1
+        N = max(min(N, items_num), 0)
+
+        scores = np.full((users_num, items_num), -np.inf)
+        for recs in [collab_recs, content_recs]:
+            rows, columns = np.nonzero(recs >= 0)
+            scores[rows, recs[rows, columns]] = 0
+        for recs, recs_scores, weight in [(collab_recs, collab_scores, a), (content_recs, content_scores, 1 - a)]:
+            rows, columns = np.nonzero(recs >= 0)
+            scores[rows, recs[rows, columns]] += weight * recs_scores[rows, columns]
+
+        top = np.argpartition(-scores, N - 1, axis=1)[:, :N] if N else np.zeros((users_num, 0), dtype=np.int64)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        recs = np.take_along_axis(top, order, axis=1).astype(np.int32)
+        recs_scores = np.take_along_axis(top_scores, order, axis=1)
+        recs[np.isneginf(recs_scores)] = -1
+        return recs, recs_scores
     
     def fit(self,content_features, user_items, show_progress=True, callback=None):
         if(user_items != None):
             self.model_collaborative = self.model_collaborative.__class__(**self.collaborative_params)
             self.model_collaborative.fit(user_items,show_progress,callback)
+            self.retrieval_index = make_retrieval_index(self.model_collaborative.item_factors, self.retrieval_params)
         if(content_features != None):
             self.model_content = self.model_content.__class__(**self.content_params)
             self.model_content.fit(content_features,show_progress,callback)
@@ -57,11 +71,18 @@ class LinearHybrid:
     def partial_fit(self, users, user_items):
         self.model_collaborative.partial_fit_users(users,user_items)
 
-    def save(self, path):
-        with open(path + "model_content.npz", 'wb') as f:
-            self.model_content.save(f)
-        with open(path + "model_collaborative.npz", 'wb') as f:
-            self.model_collaborative.save(f)
+    def compact_users(self, users):
+        """Keeps the factors of the sorted users only, renumbered in their order, see DataManager.evict_inactive_users."""
+        user_factors = self.model_collaborative.user_factors
+        if user_factors is None:
+            return
+        users = np.asarray(users, dtype=np.int64)
+        self.model_collaborative.user_factors = np.ascontiguousarray(user_factors[users[users < len(user_factors)]])
+        self.model_collaborative._user_norms = None
+        self.model_collaborative._XtX = None
+
+    def save(self, path, keep_versions = 2, users_only = False):
+        save_hybrid_models(path, self.model_collaborative, self.model_content, keep_versions, self.retrieval_index, users_only)
 
     def load(path = None):
         with open('src/modelapi/hybrid_models/linear_params.json') as json_file:
@@ -72,7 +93,9 @@ class LinearHybrid:
         content_params = data["BM25Recommender"]
         model_content = BM25Recommender(**content_params)
 
-        if path is not None:
+        retrieval_params = data.get("RetrievalIndex")
+        retrieval_state = None if path is None else load_hybrid_models(path, model_collaborative, model_content)
+        if path is not None and retrieval_state is None:
             if os.path.exists(path + "model_content.npz"):
                 with open(path + "model_content.npz", 'rb') as f:
                     model_content = model_content.load(f)
@@ -80,4 +103,4 @@ class LinearHybrid:
                 with open(path + "model_collaborative.npz", 'rb') as f:
                     model_collaborative = model_collaborative.load(f)
         
-        return LinearHybrid(model_collaborative, collaborative_params, model_content, content_params, data["LinearHybrid"]["n"])
+        return LinearHybrid(model_collaborative, collaborative_params, model_content, content_params, data["LinearHybrid"]["n"], retrieval_params, make_retrieval_index(model_collaborative.item_factors, retrieval_params, retrieval_state))
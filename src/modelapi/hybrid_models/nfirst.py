@@ -1,18 +1,22 @@
 import os.path
+import numpy as np
 
-from itertools import chain, zip_longest
-from numpy import array as nparray
 from json import load as jsonload
 from implicit.als import AlternatingLeastSquares as ALS
 from implicit.nearest_neighbours import BM25Recommender
 
+from modelapi.artifacts import load_hybrid_models, save_hybrid_models
+from modelapi.retrieval_index import make_retrieval_index, recommend_collaborative
+
 class NfirstHybrid:
-    def __init__(self, model_collaborative, collaborative_params, model_content, content_params, n):
+    def __init__(self, model_collaborative, collaborative_params, model_content, content_params, n, retrieval_params=None, retrieval_index=None):
         self.collaborative_params = collaborative_params
         self.model_collaborative = model_collaborative
         self.content_params = content_params
         self.model_content = model_content
         self.n = n
+        self.retrieval_params = retrieval_params
+        self.retrieval_index = retrieval_index
 
     def recommend(
           self
@@ -23,34 +27,22 @@ class NfirstHybrid:
         , filter_items = None
         , recalculate_user = False
         , items = None
+        , user_factors = None
     ):
 
-        def get_unique_recs(recs_main, recs_score, recs_2, number_of_recs):
-            return [[item,recs_score[i]] for i,item in enumerate(recs_main) if item not in recs_2][:number_of_recs]
-        
-        def get_recs(recs_scores):
-            return [item[0] for item in recs_scores]
-        
-        def get_scores(recs_scores):
-            return [item[1] for item in recs_scores]
-
-        def predicator(x):
-            return x != None
-
-        def merge_two_recs(collab, content):
-            merged = list((chain.from_iterable(zip_longest(collab,content))))
-            return [*filter(predicator, merged)]
-        
         n_collab = max(int(self.n * N),1)
 
-        collab = self.model_collaborative.recommend(
-              userid
+        collab = recommend_collaborative(
+              self.model_collaborative
+            , self.retrieval_index
+            , userid
             , user_items
             , n_collab
             , filter_already_liked_items
             , filter_items
             , recalculate_user
             , items
+            , user_factors
         )
     
         content = self.model_content.recommend(
@@ -63,18 +55,51 @@ class NfirstHybrid:
             , items
         )
         
-        content = [get_unique_recs(content[0][i],content[1][i],collab[0][i],N-n_collab) for i in range(len(content[0]))]
-        content_recs =  [get_recs(content[i]) for i in range(len(content))]
-        content_scores =  [get_scores(content[i]) for i in range(len(content))]
-        result_items = [merge_two_recs(collab[0][i], content_recs[i]) for i in range(len(content_recs))]
-        
-        result_scores = [merge_two_recs(collab[1][i], content_scores[i]) for i in range(len(content_scores))]
-        return nparray(result_items), nparray(result_scores)
+        return NfirstHybrid.merge_recs(
+              np.atleast_2d(collab[0])
+            , np.atleast_2d(collab[1])
+            , np.atleast_2d(content[0])
+            , np.atleast_2d(content[1])
+            , N - n_collab
+        )
+
+    def merge_recs(collab_recs, collab_scores, content_recs, content_scores, content_num):
+        """Interleaves collaborative recommendations with the first content_num content ones not among them.
+
+        Works on whole (users, N) arrays: c0, t0, c1, t1, ... and the rest of the longer list after the
+        shorter one runs out. Ids < 0 are treated as padding; output rows are padded with id -1 and score -inf.
+        """
+        users_num = collab_recs.shape[0]
+        content_num = max(content_num, 0)
+
+        is_collab = collab_recs >= 0
+        is_content = (content_recs >= 0) & ~(content_recs[:, :, None] == collab_recs[:, None, :]).any(axis=2)
+        is_content &= np.cumsum(is_content, axis=1) <= content_num
+        collab_len = is_collab.sum(axis=1, keepdims=True)
+        content_len = is_content.sum(axis=1, keepdims=True)
+
+        collab_k = np.cumsum(is_collab, axis=1) - 1
+        content_k = np.cumsum(is_content, axis=1) - 1
+        collab_positions = collab_k + np.minimum(collab_k, content_len)
+        content_positions = content_k + np.minimum(content_k + 1, collab_len)
+
+        width = collab_recs.shape[1] + min(content_num, content_recs.shape[1])
+        recs = np.full((users_num, width), -1, dtype=np.int32)
+        scores = np.full((users_num, width), -np.inf)
+        for is_valid, positions, items, items_scores in [
+              (is_collab, collab_positions, collab_recs, collab_scores)
+            , (is_content, content_positions, content_recs, content_scores)
+        ]:
+            rows, columns = np.nonzero(is_valid)
+            recs[rows, positions[rows, columns]] = items[rows, columns]
+            scores[rows, positions[rows, columns]] = items_scores[rows, columns]
+        return recs, scores
     
     def fit(self, content_features, user_items, show_progress=True, callback=None):
         if(user_items is not None):
             self.model_collaborative = self.model_collaborative.__class__(**self.collaborative_params)
             self.model_collaborative.fit(user_items,show_progress,callback)
+            self.retrieval_index = make_retrieval_index(self.model_collaborative.item_factors, self.retrieval_params)
         if(content_features is not None):
             self.model_content = self.model_content.__class__(**self.content_params)
             self.model_content.fit(content_features,show_progress,callback)
@@ -82,11 +107,18 @@ class NfirstHybrid:
     def partial_fit(self, users, user_items):
         self.model_collaborative.partial_fit_users(users,user_items)
 
-    def save(self, path):
-        with open(path + "model_content.npz", 'wb') as f:
-            self.model_content.save(f)
-        with open(path + "model_collaborative.npz", 'wb') as f:
-            self.model_collaborative.save(f)
+    def compact_users(self, users):
+        """Keeps the factors of the sorted users only, renumbered in their order, see DataManager.evict_inactive_users."""
+        user_factors = self.model_collaborative.user_factors
+        if user_factors is None:
+            return
+        users = np.asarray(users, dtype=np.int64)
+        self.model_collaborative.user_factors = np.ascontiguousarray(user_factors[users[users < len(user_factors)]])
+        self.model_collaborative._user_norms = None
+        self.model_collaborative._XtX = None
+
+    def save(self, path, keep_versions = 2, users_only = False):
+        save_hybrid_models(path, self.model_collaborative, self.model_content, keep_versions, self.retrieval_index, users_only)
 
     def load(path = None):
             with open('src/modelapi/hybrid_models/nfirst_params.json') as json_file:
@@ -97,7 +129,9 @@ class NfirstHybrid:
             content_params = data["BM25Recommender"]
             model_content = BM25Recommender(**content_params)
 
-            if path is not None:
+            retrieval_params = data.get("RetrievalIndex")
+            retrieval_state = None if path is None else load_hybrid_models(path, model_collaborative, model_content)
+            if path is not None and retrieval_state is None:
                 if os.path.exists(path + "model_content.npz"):
                     with open(path + "model_content.npz", 'rb') as f:
                         model_content = model_content.load(f)
@@ -105,4 +139,4 @@ class NfirstHybrid:
                     with open(path + "model_collaborative.npz", 'rb') as f:
                         model_collaborative = model_collaborative.load(f)
             
-            return NfirstHybrid(model_collaborative, collaborative_params, model_content, content_params, data["NfirstHybrid"]["n"])
\ No newline at end of file
+            return NfirstHybrid(model_collaborative, collaborative_params, model_content, content_params, data["NfirstHybrid"]["n"], retrieval_params, make_retrieval_index(model_collaborative.item_factors, retrieval_params, retrieval_state))
\ No newline at end of file
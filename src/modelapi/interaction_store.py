@@ -0,0 +1,179 @@
+import numpy as np
+
+from modelapi.helpers import IdConverter
+
+
+class InteractionStore():
+    """Columnar per-(user, course) interaction state.
+
+    Every pair owns one row in a set of NumPy columns. Pairs are found through a sorted array of
+    (user << 32 | course) keys, distinct anchors through a sorted array of (row << 32 | anchor) keys.
+    """
+
+    _columns_dtypes = {
+          'users': np.int32
+        , 'courses': np.int32
+        , 'events_num': np.int64
+        , 'anchors_num': np.int32
+        , 'has_submit_form_event': np.bool_
+        , 'coefficient': np.float64
+        , 'last_timestamp': np.int64
+    }
+
+    def __init__(self) -> None:
+        self._size = 0
+        self._columns = {name: np.zeros(0, dtype=dtype) for name, dtype in self._columns_dtypes.items()}
+
+        self._sorted_keys = np.zeros(0, dtype=np.int64)
+        self._sorted_rows = np.zeros(0, dtype=np.int64)
+
+        self._anchor_keys = np.zeros(0, dtype=np.int64)
+        self._anchors_id_converter = IdConverter()
+
+    def __len__(self):
+        return self._size
+
+    def column(self, name):
+        return self._columns[name][:self._size]
+
+    def find(self, users, courses):
+        keys = InteractionStore._make_keys(users, courses)
+        positions = np.searchsorted(self._sorted_keys, keys)
+        is_found = positions < len(self._sorted_keys)
+        is_found[is_found] = self._sorted_keys[positions[is_found]] == keys[is_found]
+
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        rows[is_found] = self._sorted_rows[positions[is_found]]
+        return rows
+
+    def add_pairs(self, users, courses):
+        rows = self.find(users, courses)
+        is_missing = rows < 0
+        if not is_missing.any():
+            return rows
+
+        new_keys, first_index, inverse = np.unique(
+              InteractionStore._make_keys(users, courses)[is_missing]
+            , return_index=True
+            , return_inverse=True
+        )
+        new_rows = np.arange(self._size, self._size + len(new_keys))
+        self._reserve(self._size + len(new_keys))
+        self._columns['users'][new_rows] = np.asarray(users)[is_missing][first_index]
+        self._columns['courses'][new_rows] = np.asarray(courses)[is_missing][first_index]
+        self._size += len(new_keys)
+
+        positions = np.searchsorted(self._sorted_keys, new_keys)
+        self._sorted_keys = np.insert(self._sorted_keys, positions, new_keys)
+        self._sorted_rows = np.insert(self._sorted_rows, positions, new_rows)
+
+        rows[is_missing] = new_rows[inverse.reshape(-1)]
+        return rows
+
+    def user_rows(self, user):
+        start, end = np.searchsorted(self._sorted_keys, InteractionStore._make_keys([user, user + 1], [0, 0]))
+        return self._sorted_rows[start:end]
+
+    def add_events(self, rows, counted_events, submit_events, anchors, timestamps):
+        """Aggregates a block of events by pair and applies it to the columns.
+
+        rows, counted_events, submit_events, anchors and timestamps are parallel per-event arrays,
+        anchors holds None for events without an anchor. Events may come pre-aggregated, then
+        counted_events holds the number of counted events of a row. Returns the sorted rows touched by the block.
+        """
+        touched_rows, inverse = np.unique(rows, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        order = np.argsort(inverse, kind='stable')
+        group_starts = np.flatnonzero(np.diff(inverse[order], prepend=-1))
+        last_timestamps = np.maximum.reduceat(np.asarray(timestamps, dtype=np.int64)[order], group_starts)
+        self._columns['last_timestamp'][touched_rows] = np.maximum(self._columns['last_timestamp'][touched_rows], last_timestamps)
+
+        self._columns['events_num'][touched_rows] += np.bincount(inverse, weights=counted_events, minlength=len(touched_rows)).astype(np.int64)
+        self._columns['has_submit_form_event'][touched_rows] |= np.bincount(inverse, weights=submit_events, minlength=len(touched_rows)) > 0
+
+        has_anchor = np.asarray(anchors != None, dtype=bool)
+        if has_anchor.any():
+            anchor_ids = self._anchors_id_converter.add_many(anchors[has_anchor])
+            anchor_keys = np.unique((rows[has_anchor].astype(np.int64) << 32) | anchor_ids)
+
+            positions = np.searchsorted(self._anchor_keys, anchor_keys)
+            is_new = positions == len(self._anchor_keys)
+            is_new[~is_new] = self._anchor_keys[positions[~is_new]] != anchor_keys[~is_new]
+
+            self._anchor_keys = np.insert(self._anchor_keys, positions[is_new], anchor_keys[is_new])
+            np.add.at(self._columns['anchors_num'], anchor_keys[is_new] >> 32, 1)
+
+        return touched_rows
+
+    def compact_users(self, users):
+        """Returns a store with the pairs of the sorted users only, the users are renumbered in their order.
+
+        Anchors no pair refers to anymore are dropped as well. The store is not modified.
+        """
+        users = np.asarray(users, dtype=np.int64)
+        new_users = np.searchsorted(users, self.column('users'))
+        is_kept = new_users < len(users)
+        is_kept[is_kept] = users[new_users[is_kept]] == self.column('users')[is_kept]
+        kept_rows = np.flatnonzero(is_kept)
+        new_rows = np.full(self._size, -1, dtype=np.int64)
+        new_rows[kept_rows] = np.arange(len(kept_rows))
+
+        store = InteractionStore()
+        store._size = len(kept_rows)
+        store._columns = {name: self.column(name)[kept_rows] for name in self._columns}
+        store._columns['users'] = new_users[kept_rows].astype(np.int32)
+
+        sorted_rows = new_rows[self._sorted_rows]
+        store._sorted_rows = sorted_rows[sorted_rows >= 0]
+        store._sorted_keys = InteractionStore._make_keys(store.column('users')[store._sorted_rows], store.column('courses')[store._sorted_rows])
+
+        anchor_rows = new_rows[self._anchor_keys >> 32]
+        anchor_ids = self._anchor_keys[anchor_rows >= 0] & 0xffffffff
+        anchor_rows = anchor_rows[anchor_rows >= 0]
+        kept_anchors = np.unique(anchor_ids)
+        ids, kinds = self._anchors_id_converter.to_arrays()
+        store._anchors_id_converter = IdConverter.from_arrays(ids[kept_anchors], kinds[kept_anchors])
+        store._anchor_keys = np.sort((anchor_rows << 32) | np.searchsorted(kept_anchors, anchor_ids))
+        return store
+
+    def nbytes(self):
+        return (
+              sum(column.nbytes for column in self._columns.values())
+            + self._sorted_keys.nbytes + self._sorted_rows.nbytes + self._anchor_keys.nbytes
+            + self._anchors_id_converter.nbytes()
+        )
+
+    def get_state(self):
+        anchors_ids, anchors_kinds = self._anchors_id_converter.to_arrays()
+        return {
+              **{'column_' + name: self.column(name).copy() for name in self._columns}
+            , 'sorted_keys': self._sorted_keys
+            , 'sorted_rows': self._sorted_rows
+            , 'anchor_keys': self._anchor_keys
+            , 'anchors_ids': anchors_ids
+            , 'anchors_kinds': anchors_kinds
+        }
+
+    def from_state(state):
+        store = InteractionStore()
+        store._size = len(state['column_users'])
+        store._columns = {name: np.array(state['column_' + name], dtype=dtype) for name, dtype in InteractionStore._columns_dtypes.items()}
+        store._sorted_keys = np.array(state['sorted_keys'])
+        store._sorted_rows = np.array(state['sorted_rows'])
+        store._anchor_keys = np.array(state['anchor_keys'])
+        store._anchors_id_converter = IdConverter.from_arrays(state['anchors_ids'], state['anchors_kinds'])
+        return store
+
+    def _reserve(self, size):
+        capacity = len(self._columns['users'])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        for name, column in self._columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def _make_keys(users, courses):
+        return (np.asarray(users, dtype=np.int64) << 32) | np.asarray(courses, dtype=np.int64)
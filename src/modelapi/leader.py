@@ -0,0 +1,53 @@
+import asyncio
+import logging
+import signal
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+import modelapi.logger
+from modelapi.config import config
+from modelapi.processor import Processor
+from modelapi.shared_snapshot import SnapshotPublisher
+
+logger = logging.getLogger('leader')
+
+
+def get_serving_directory():
+    return config['paths']['temp'] + '/serving'
+
+
+async def start_processor(snapshot_publisher = None):
+    """Creates the ingesting and training processor and schedules its jobs."""
+    processor = Processor(snapshot_publisher=snapshot_publisher)
+    await processor.load_cosine_model()
+    await processor.load_updates_and_retrain()
+
+    scheduler = AsyncIOScheduler()
+    scheduler.add_job(processor.load_updates_and_retrain, 'interval', seconds=int(config["jobs_threshold"]["load_updates"]))
+    scheduler.add_job(processor.save_checkpoint, 'interval', seconds=int(config["jobs_threshold"]["checkpoint"]))
+    if int(config["retention"]["horizon"]) > 0:
+        scheduler.add_job(processor.evict_inactive_users, 'interval', seconds=int(config["jobs_threshold"]["retention"]))
+    scheduler.start()
+
+    return processor, scheduler
+
+
+def run():
+    """Entry point of the leader process of the multi-worker mode, see server.py."""
+    async def main():
+        logger.info("Leader initialization")
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in [signal.SIGTERM, signal.SIGINT]:
+            loop.add_signal_handler(signal_number, stopped.set)
+
+        publisher = SnapshotPublisher(get_serving_directory(), int(config['serving']['keep_versions']))
+        processor, scheduler = await start_processor(publisher)
+        logger.info("Leader started")
+
+        await stopped.wait()
+        scheduler.shutdown()
+        processor.close()
+        logger.info("Leader stopped")
+
+    asyncio.run(main())
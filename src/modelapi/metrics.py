@@ -0,0 +1,146 @@
+import bisect
+import contextlib
+import math
+import threading
+import time
+
+from modelapi.config import config
+
+_enabled = bool(int(config['metrics']['enabled']))
+_null_timer = contextlib.nullcontext()
+
+
+def is_enabled():
+    return _enabled
+
+
+class Counter():
+    """Monotonic count per combination of label values, rendered in the Prometheus text format."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = dict()
+
+    def inc(self, amount=1, **labels):
+        if not _enabled:
+            return
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram():
+    """Distribution of observed values per combination of label values in cumulative le buckets."""
+
+    kind = 'histogram'
+    default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=default_buckets) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = dict()
+
+    def observe(self, value, **labels):
+        if not _enabled:
+            return
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        bucket = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self._buckets) + 1), 0.0))
+            counts[bucket] += 1
+            self._values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        """Returns a context manager observing the seconds spent in its block, a shared no-op one while metrics are disabled."""
+        return Timer(self, labels) if _enabled else _null_timer
+
+    def collect(self):
+        samples = list()
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for le, count in zip(self._buckets + (math.inf,), counts):
+                    cumulative += count
+                    samples.append((self.name + '_bucket', key + (_format_value(le),), cumulative))
+                samples.append((self.name + '_sum', key, total))
+                samples.append((self.name + '_count', key, cumulative))
+        return samples
+
+
+class Timer():
+    def __init__(self, histogram, labels) -> None:
+        self._histogram = histogram
+        self._labels = labels
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+
+
+class Registry():
+    def __init__(self) -> None:
+        self._metrics = list()
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format 0.0.4."""
+        lines = list()
+        for metric in self._metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            labelnames = metric.labelnames + (('le',) if metric.kind == 'histogram' else ())
+            for name, key, value in metric.collect():
+                labels = ','.join('%s="%s"' % (label, _escape(label_value)) for label, label_value in zip(labelnames, key))
+                lines.append('%s%s %s' % (name, '{' + labels + '}' if labels else '', _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(label_value):
+    return label_value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+      'modelapi_stage_seconds'
+    , 'Seconds spent in an ingestion or training stage'
+    , ['stage']
+))
+ingested_rows = registry.register(Counter('modelapi_ingested_rows_total', 'Rows read from ClickHouse'))
+ingested_blocks = registry.register(Counter('modelapi_ingested_blocks_total', 'Blocks read from ClickHouse'))
+recommendation_seconds = registry.register(Histogram(
+      'modelapi_recommendation_seconds'
+    , 'Seconds spent recommending to a group of users by a branch'
+    , ['branch']
+))
+recommended_users = registry.register(Counter('modelapi_recommended_users_total', 'Users recommended to by a branch', ['branch']))
+request_seconds = registry.register(Histogram(
+      'modelapi_request_seconds'
+    , 'Seconds spent handling an HTTP request'
+    , ['method', 'route', 'status']
+))
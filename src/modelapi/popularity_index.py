@@ -0,0 +1,146 @@
+import numpy as np
+
+
+class PopularityIndex():
+    """Per-course event counts kept in arrays indexed by the course id in csr.
+
+    Besides the all-time counts the index keeps hourly buckets for windowed popularity and
+    exponentially decayed counts, both are updated per block without rescanning history.
+    The ranking is sorted on the first read after a block, so blocks are counted without sorting the
+    catalogue and top and bottom views are slices of it.
+    Courses without events are not ranked, ties are broken by the course id in csr.
+    """
+
+    _bucket_seconds = 3600
+
+    def __init__(self, window_hours=7 * 24, half_life=24 * 3600) -> None:
+        self._half_life = half_life
+
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._bucket_counts = np.zeros((window_hours, 0), dtype=np.int32)
+        self._bucket_hours = np.full(window_hours, -1, dtype=np.int64)
+        self._decayed_counts = np.zeros(0, dtype=np.float64)
+        self._decay_timestamp = 0
+
+        self._ranking = None
+
+    def add(self, courses, timestamps, events_num=None):
+        """Counts a block of events given as parallel course and unix timestamp arrays.
+
+        events_num holds the number of events of each row for pre-aggregated blocks.
+        """
+        courses = np.asarray(courses, dtype=np.int64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if len(courses) == 0:
+            return
+        events_num = np.ones(len(courses), dtype=np.int64) if events_num is None else np.asarray(events_num, dtype=np.int64)
+        self._reserve(courses.max() + 1)
+
+        self._counts += np.bincount(courses, weights=events_num, minlength=len(self._counts)).astype(np.int64)
+        self._add_to_buckets(courses, timestamps, events_num)
+        self._add_decayed(courses, timestamps, events_num)
+        self._ranking = None
+
+    def get_counts(self, courses):
+        return self._counts[np.asarray(courses, dtype=np.int64)]
+
+    def top(self, N, window_hours=0, decayed=False):
+        """Returns up to N course ids in csr, most popular first.
+
+        window_hours > 0 counts only the events of the last window_hours hours, at most get_window_hours,
+        decayed ranks courses by exponentially decayed counts.
+        """
+        if decayed:
+            return PopularityIndex._rank(self._decayed_counts)[:N]
+        if window_hours > 0:
+            return PopularityIndex._rank(self._window_counts(window_hours))[:N]
+        return self._get_ranking()[:N]
+
+    def bottom(self, N, window_hours=0, decayed=False):
+        """Returns up to N course ids in csr, least popular first."""
+        if decayed:
+            return PopularityIndex._rank(self._decayed_counts)[::-1][:N]
+        if window_hours > 0:
+            return PopularityIndex._rank(self._window_counts(window_hours))[::-1][:N]
+        return self._get_ranking()[::-1][:N]
+
+    def get_window_hours(self):
+        return len(self._bucket_hours)
+
+    def get_state(self):
+        return {
+              'counts': self._counts
+            , 'bucket_counts': self._bucket_counts
+            , 'bucket_hours': self._bucket_hours
+            , 'decayed_counts': self._decayed_counts
+            , 'decay_timestamp': np.array(self._decay_timestamp, dtype=np.int64)
+        }
+
+    def copy(self):
+        index = PopularityIndex.from_state({name: array.copy() for name, array in self.get_state().items()}, self._half_life)
+        index._ranking = self._ranking
+        return index
+
+    def from_state(state, half_life=24 * 3600):
+        """Attaches the state arrays without copying them, add changes them in place."""
+        index = PopularityIndex(len(state['bucket_hours']), half_life)
+        index._counts = np.asarray(state['counts'])
+        index._bucket_counts = np.asarray(state['bucket_counts'])
+        index._bucket_hours = np.asarray(state['bucket_hours'])
+        index._decayed_counts = np.asarray(state['decayed_counts'])
+        index._decay_timestamp = int(state['decay_timestamp'])
+        return index
+
+    def _get_ranking(self):
+        ranking = self._ranking
+        if ranking is None:
+            ranking = self._ranking = PopularityIndex._rank(self._counts)
+        return ranking
+
+    def _window_counts(self, window_hours):
+        if window_hours > len(self._bucket_hours):
+            raise ValueError('window_hours must not exceed the popularity window of ' + str(len(self._bucket_hours)) + ' hours')
+        last_hour = self._bucket_hours.max()
+        in_window = (self._bucket_hours >= 0) & (self._bucket_hours > last_hour - window_hours)
+        return self._bucket_counts[in_window].sum(axis=0)
+
+    def _add_to_buckets(self, courses, timestamps, events_num):
+        hours = timestamps // PopularityIndex._bucket_seconds
+        window_hours = len(self._bucket_hours)
+        last_hour = max(hours.max(), self._bucket_hours.max())
+
+        is_recent = hours > last_hour - window_hours
+        hours, courses, events_num = hours[is_recent], courses[is_recent], events_num[is_recent]
+        for hour in np.unique(hours):
+            slot = hour % window_hours
+            if self._bucket_hours[slot] != hour:
+                self._bucket_counts[slot] = 0
+                self._bucket_hours[slot] = hour
+            in_hour = hours == hour
+            self._bucket_counts[slot] += np.bincount(courses[in_hour], weights=events_num[in_hour], minlength=self._bucket_counts.shape[1]).astype(np.int32)
+
+        is_stale = self._bucket_hours <= last_hour - window_hours
+        self._bucket_counts[is_stale] = 0
+        self._bucket_hours[is_stale] = -1
+
+    def _add_decayed(self, courses, timestamps, events_num):
+        decay_timestamp = max(int(timestamps.max()), self._decay_timestamp)
+        self._decayed_counts *= np.exp2((self._decay_timestamp - decay_timestamp) / self._half_life)
+        self._decayed_counts += np.bincount(
+              courses
+            , weights=events_num * np.exp2((timestamps - decay_timestamp) / self._half_life)
+            , minlength=len(self._decayed_counts)
+        )
+        self._decay_timestamp = decay_timestamp
+
+    def _reserve(self, courses_num):
+        if courses_num <= len(self._counts):
+            return
+        grow = courses_num - len(self._counts)
+        self._counts = np.concatenate([self._counts, np.zeros(grow, dtype=self._counts.dtype)])
+        self._bucket_counts = np.concatenate([self._bucket_counts, np.zeros((len(self._bucket_counts), grow), dtype=self._bucket_counts.dtype)], axis=1)
+        self._decayed_counts = np.concatenate([self._decayed_counts, np.zeros(grow, dtype=self._decayed_counts.dtype)])
+
+    def _rank(counts):
+        ranking = np.argsort(-counts, kind='stable')
+        return ranking[:np.count_nonzero(counts > 0)]
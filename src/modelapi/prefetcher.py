@@ -0,0 +1,72 @@
+import queue
+import threading
+import time
+
+
+class BlockPrefetcher():
+    """Iterates a block stream in a background thread, keeping up to queue_depth blocks ready.
+
+    If submit is given it is called on every block in the fetching thread, e.g. executor.submit
+    to start parsing early, and its results are yielded instead of the blocks, in stream order.
+    Errors of the stream are raised by the iteration.
+    """
+
+    def __init__(self, stream, queue_depth, submit=None) -> None:
+        self._stream = stream
+        self._submit = submit
+        self._queue = queue.Queue(maxsize=max(queue_depth, 1))
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._fetch, daemon=True)
+
+        self.fetch_seconds = 0
+        self.wait_seconds = 0
+        self.max_queue_size = 0
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._thread.join()
+
+    def __iter__(self):
+        while True:
+            start = time.perf_counter()
+            kind, value = self._queue.get()
+            self.wait_seconds += time.perf_counter() - start
+
+            if kind == 'end':
+                return
+            if kind == 'error':
+                raise value
+            yield value
+
+    def _fetch(self):
+        try:
+            blocks = iter(self._stream)
+            while not self._stopped.is_set():
+                start = time.perf_counter()
+                block = next(blocks, None)
+                self.fetch_seconds += time.perf_counter() - start
+                if block is None:
+                    break
+                self._put(('block', block if self._submit is None else self._submit(block)))
+        except Exception as e:
+            self._put(('error', e))
+            return
+        self._put(('end', None))
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                self.max_queue_size = max(self.max_queue_size, self._queue.qsize())
+                return
+            except queue.Full:
+                pass
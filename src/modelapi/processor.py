@@ -1,36 +1,87 @@
 import asyncio
 import time
 import logging
-import scipy
 import pickle
 import os.path
 import random
+import threading
 import numpy as np
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 
+from modelapi import metrics
+from modelapi.cold_start import FoldInCache, recommend_fallback
 from modelapi.content_models.cosine import CosineContent
 from modelapi.data_manager import DataManager
 from modelapi.hybrid_models.linear import LinearHybrid
+from modelapi.recommendation_cache import RecommendationCache
+from modelapi.similar_items import SimilarItemsTable
+from modelapi.training_worker import TrainingWorker
 from modelapi.config import config
 
 ModelType = LinearHybrid
 
 class Processor:
-    def __init__(self) -> None:
+    """Serves recommendations from a ServingSnapshot.
+
+    By default the processor also ingests updates and trains the model. Given a snapshot_publisher it
+    shares every new snapshot with the HTTP workers, given a snapshot_reader it is such a worker and
+    only serves the snapshots it attaches to.
+    """
+
+    def __init__(self, snapshot_publisher = None, snapshot_reader = None) -> None:
         self.__logger = logging.getLogger('processor')
+        self._recommendation_cache = RecommendationCache(
+              int(config['recommendation_cache']['size'])
+            , int(config['recommendation_cache']['ttl'])
+        )
+        self._fold_in_cache = FoldInCache(int(config['cold_start']['fold_in_cache_size']))
+        self._cold_start_interactions = int(config['cold_start']['min_interactions'])
+        self._fallback_similarity = None
+        self._fallback_similar_items = None
+        self._latency_lock = threading.Lock()
+        self._latency_stats = dict()
+        self._content_model = None
+
+        self._bottom_table_size = int(config['course_mixing']['bottom_table_size'])
+        self._similar_items_content_model = None
+        self._adv_similar_items = None
+        self._bottom_similar_items = None
+
+        self._retention_stats = dict()
+
+        self._snapshot_reader = snapshot_reader
+        self._snapshot_version = None
+        if snapshot_reader is not None:
+            self._data_manager = None
+            self._snapshot = None
+            return
+        self._snapshot_publisher = snapshot_publisher
+        self._publish_seconds = float(config['serving']['publish_seconds'])
+        self._snapshot_shared = False
+        self._shared_at = -self._publish_seconds
+
         self._model_path = config['paths']['saved_models']
-        self._content_model_path = config['paths']['saved_models'] + '/cosine.npz'
+        self._content_model_path = config['paths']['saved_models'] + 'cosine'
+        self._courses_features_path = config['paths']['temp'] + '/courses_features'
         self._processor_data_path = config['paths']['temp'] + '/processor_data.txt'
-        self._interactions_path = config['paths']['temp'] + '/interactions.npz'
 
         self._last_full_fit_timestemp = 0
         self._last_part_fit_timestemp = 0
         self._part_incoming_updates = 0
         self._full_incoming_updates = 0
+        self._retention_horizon = int(config['retention']['horizon'])
+        self._partial_fit_batch = int(config['models']['partial_fit_batch'])
+        self._jobs_lock = asyncio.Lock()
 
         self._data_manager = DataManager()
 
-        self._model = ModelType.load(self._model_path)
+        with metrics.stage_seconds.time(stage='model_load'):
+            self._model = ModelType.load(self._model_path)
+        self._training_worker = TrainingWorker(ModelType, self._model_path, int(config['models']['keep_versions']))
+        self._training_worker.start()
+
+        self._ingestion_executor = ThreadPoolExecutor(1, thread_name_prefix='ingestion')
+        self._snapshot = self._data_manager.make_snapshot(self._model)
 
         if os.path.exists(self._processor_data_path):
             with open(self._processor_data_path, 'rb') as f:
@@ -41,10 +92,19 @@ class Processor:
                 self._full_incoming_updates = data['full_incoming_updates']
 
     async def load_updates_and_retrain(self):
+        async with self._jobs_lock:
+            await self._load_updates_and_retrain()
+
+    async def _load_updates_and_retrain(self):
         self.__logger.info("Start load and retrain")
-        users_k = len(self._data_manager._changed_users)
-        self._data_manager.load_updates()
-        changed_users_k = len(self._data_manager._changed_users) - users_k
+        loop = asyncio.get_running_loop()
+        snapshot = await loop.run_in_executor(self._ingestion_executor, self._load_updates_to_snapshot)
+        self._publish_snapshot(snapshot, changed_users=self._data_manager._last_changed_users)
+        if self._data_manager.get_ingestion_stats()['rows']:
+            self._snapshot_shared = False
+        if not self._snapshot_shared and time.monotonic() >= self._shared_at + self._publish_seconds:
+            await self._share_snapshot()
+        changed_users_k = len(self._data_manager._last_changed_users)
         self._full_incoming_updates += changed_users_k
         self._part_incoming_updates += changed_users_k
 
@@ -63,64 +123,289 @@ class Processor:
             await self.fit_in_another_process(is_full_fit=False)
 
             self._last_part_fit_timestemp = time.time()
-            self._part_incoming_updates = 0
+            self._part_incoming_updates = len(self._data_manager._refit_queue)
         self.__logger.info("Finished load and retrain")
 
-    def recommend(self, userid: int, N: int = 10, adv_perc = 0, bottom_perc = 0):
-        interactions = self._data_manager.get_interaction_csr_matrix()
-        userid_in_csr = self._data_manager._users_id_converter.get_forward(userid)
-        userid_interactions = interactions.getrow(userid_in_csr)
+    async def evict_inactive_users(self):
+        """Evicts the users inactive for longer than the retention horizon and compacts the model to the new user ids.
+
+        Runs between ingestions and fits, the compacted state is published, shared and checkpointed at once.
+        The model is compacted first, the data manager only after it succeeded, so a failed compaction keeps both as they were.
+        """
+        async with self._jobs_lock:
+            self.__logger.info("Start evicting inactive users")
+            loop = asyncio.get_running_loop()
+            memory_before = self._data_manager.get_memory_usage()
+            users_num = self._data_manager._users_id_converter.get_count()
+            with metrics.stage_seconds.time(stage='eviction'):
+                kept_users = await loop.run_in_executor(self._ingestion_executor, self._data_manager.get_kept_users, self._retention_horizon)
+                if kept_users is not None:
+                    model = await loop.run_in_executor(None, self._training_worker.compact_users, kept_users)
+                    snapshot = await loop.run_in_executor(self._ingestion_executor, self._compact_to_snapshot, kept_users, model)
+                    self._model = model
+            if kept_users is not None:
+                self._publish_snapshot(snapshot, model_changed=True)
+                await self._share_snapshot()
+                await self.save_checkpoint()
+
+            memory_after = self._data_manager.get_memory_usage()
+            self._retention_stats = {
+                  'users_before': users_num
+                , 'users_after': self._data_manager._users_id_converter.get_count()
+                , 'memory_before': memory_before
+                , 'memory_after': memory_after
+            }
+            self.__logger.info(
+                  "Finished evicting inactive users: users " + str(users_num) + " -> " + str(self._retention_stats['users_after'])
+                + ", bytes " + str(sum(value for name, value in memory_before.items() if name != 'resident'))
+                + " -> " + str(sum(value for name, value in memory_after.items() if name != 'resident'))
+                + ", resident " + str(memory_before['resident']) + " -> " + str(memory_after['resident'])
+            )
+
+    def _compact_to_snapshot(self, kept_users, model):
+        self._data_manager.compact_users(kept_users)
+        return self._data_manager.make_snapshot(model)
+
+    def _load_updates_to_snapshot(self):
+        self._data_manager.load_updates()
+        return self._data_manager.make_snapshot(self._model)
+
+    def _publish_snapshot(self, snapshot, changed_users=(), model_changed=False):
+        """Swaps in the snapshot and invalidates the cached results it makes stale before anything else can run.
+
+        Requests read the cache versions before the snapshot, so results of the previous snapshot are not cached after the swap.
+        """
+        self._snapshot = self._with_fallback_similar_items(self._with_similar_items(snapshot._replace(model=self._model, content_model=self._content_model)))
+        if model_changed:
+            self._recommendation_cache.invalidate_model()
+            self._fold_in_cache.invalidate_model()
+        else:
+            self._recommendation_cache.invalidate_users(changed_users)
+            self._fold_in_cache.invalidate_users(changed_users)
+
+    def _with_similar_items(self, snapshot):
+        """Sets the adv and bottom similar items tables of the snapshot.
+
+        The adv table is built once per content model, the bottom table is updated for the current bottom courses.
+        """
+        content_model = snapshot.content_model
+        if content_model is None:
+            return snapshot
+
+        bottom = snapshot.popularity_index.bottom(self._bottom_table_size)
+        if content_model is not self._similar_items_content_model:
+            self._adv_similar_items = SimilarItemsTable(content_model.similarity, snapshot.adv_courses)
+            self._bottom_similar_items = SimilarItemsTable(content_model.similarity, bottom)
+            self._similar_items_content_model = content_model
+        else:
+            self._bottom_similar_items = self._bottom_similar_items.updated(bottom)
+        return snapshot._replace(adv_similar_items=self._adv_similar_items, bottom_similar_items=self._bottom_similar_items)
 
-        # TO DO FIX
-        if userid_in_csr not in self._data_manager._changed_users:
-            recommendation_in_csrids = self._model.recommend(userid=[userid_in_csr], user_items=userid_interactions, N=N, recalculate_user=False)[0][0]
+    def _with_fallback_similar_items(self, snapshot):
+        """Sets the table of courses similar by the content part of the model, padded with popular courses, see recommend_fallback."""
+        similarity = getattr(getattr(snapshot.model, 'model_content', None), 'similarity', None)
+        if similarity is None:
+            return snapshot
+
+        popular = snapshot.popularity_index.top(snapshot.courses_id_converter.get_count())
+        if similarity is not self._fallback_similarity:
+            self._fallback_similar_items = SimilarItemsTable(similarity, popular)
+            self._fallback_similarity = similarity
         else:
-            if userid_in_csr < interactions.shape[0]:
-                recommendation_in_csrids = self._model.recommend(userid=[userid_in_csr], user_items=userid_interactions, N=N, recalculate_user=True)[0][0]
+            self._fallback_similar_items = self._fallback_similar_items.updated(popular)
+        return snapshot._replace(fallback_similar_items=self._fallback_similar_items)
+
+    async def _share_snapshot(self):
+        """Publishes the current snapshot to the HTTP workers.
+
+        Ingested updates are published at most every publish_seconds, fits and evictions at once.
+        """
+        if self._snapshot_publisher is None:
+            return
+        snapshot = self._snapshot
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._ingestion_executor, self._write_shared_snapshot, snapshot)
+        self._snapshot_shared = True
+        self._shared_at = time.monotonic()
+
+    def _write_shared_snapshot(self, snapshot):
+        last_timestamps = self._data_manager.get_last_timestamps(snapshot.interactions)
+        self._snapshot_publisher.publish(snapshot, last_timestamps)
+
+    def get_snapshot(self):
+        if self._snapshot_reader is None:
+            return self._snapshot
+
+        snapshot = self._snapshot_reader.get_snapshot()
+        version = self._snapshot_reader.get_version()
+        if self._snapshot is None or version != self._snapshot_version:
+            self._snapshot_version = version
+            self._snapshot = snapshot
+            self._recommendation_cache.invalidate_model()
+            self._fold_in_cache.invalidate_model()
+        return self._snapshot
+
+    def recommend(self, userid: int, N: int = 10, adv_perc = 0, bottom_perc = 0):
+        return self.recommend_batch([userid], N, adv_perc, bottom_perc)[0]
+
+    def recommend_batch(self, userids, N: int = 10, adv_perc = 0, bottom_perc = 0):
+        cache_versions = (self._recommendation_cache.get_version(), self._fold_in_cache.get_version())
+        snapshot = self.get_snapshot()
+        userids_in_csr = snapshot.users_id_converter.forward_many(userids)
+        known = np.flatnonzero(userids_in_csr >= 0).tolist()
+
+        recommendations_in_csrids = self._recommend_in_csrids(snapshot, userids_in_csr[known].tolist(), N, cache_versions)
+        recommendations_in_csrids = self._mix_courses(snapshot, recommendations_in_csrids, N, adv_perc, bottom_perc)
+
+        recommendations = [None] * len(userids)
+        for i, recommendation_in_csrids in zip(known, recommendations_in_csrids):
+            recommendations[i] = snapshot.courses_id_converter.backward_many(recommendation_in_csrids).tolist()
+        return recommendations
+
+    def _recommend_in_csrids(self, snapshot, userids_in_csr, N, cache_versions):
+        """Recommends to every user by one of the branches, each timed in the latency stats:
+        cache hits, fallback lists for users with few interactions or without a fitted model,
+        the model factors, and factors folded in for the users changed since the last fit or added after it.
+
+        Results are cached only if no cache was invalidated since cache_versions were read, before the snapshot.
+        """
+        start = time.perf_counter()
+        recommendations_in_csrids = [self._recommendation_cache.get(userid_in_csr, N) for userid_in_csr in userids_in_csr]
+        missed = [i for i, recommendation in enumerate(recommendations_in_csrids) if recommendation is None]
+        self._record_latency('cache', len(userids_in_csr) - len(missed), time.perf_counter() - start)
+        if not missed:
+            return recommendations_in_csrids
+
+        interactions = snapshot.interactions
+        interactions_num = np.diff(interactions.indptr)
+        is_fitted = snapshot.model.model_collaborative.item_factors is not None
+        factors_num = len(snapshot.model.model_collaborative.user_factors) if is_fitted else 0
+        groups = {'fallback': list(), 'model': list(), 'fold_in': list()}
+        for i in missed:
+            if not is_fitted or interactions_num[userids_in_csr[i]] < self._cold_start_interactions:
+                groups['fallback'].append(i)
+            elif userids_in_csr[i] >= factors_num or userids_in_csr[i] in snapshot.changed_users:
+                groups['fold_in'].append(i)
+            else:
+                groups['model'].append(i)
+
+        for branch, group in groups.items():
+            if not group:
+                continue
+
+            start = time.perf_counter()
+            group_userids_in_csr = [userids_in_csr[i] for i in group]
+            user_items = interactions[group_userids_in_csr, :]
+            if branch == 'fallback':
+                popular = snapshot.popularity_index.top(N + self._cold_start_interactions)
+                recommendation_in_csrids = recommend_fallback(snapshot.fallback_similar_items, popular, user_items, N)
             else:
-                recommendation_in_csrids = self._model.recommend(userid=[None], user_items=userid_interactions, N=N, recalculate_user=True)[0][0]
+                recommendation_in_csrids = snapshot.model.recommend(
+                      userid=group_userids_in_csr
+                    , user_items=user_items
+                    , N=N
+                    , user_factors=self._fold_in(snapshot, group_userids_in_csr, user_items, cache_versions[1]) if branch == 'fold_in' else None
+                )[0]
+
+            for i, userid_in_csr, recommendation in zip(group, group_userids_in_csr, recommendation_in_csrids):
+                recommendation = recommendation[recommendation >= 0]
+                recommendations_in_csrids[i] = recommendation
+                self._recommendation_cache.put(userid_in_csr, N, recommendation, cache_versions[0])
+            self._record_latency(branch, len(group), time.perf_counter() - start)
+        return recommendations_in_csrids
+
+    def _fold_in(self, snapshot, userids_in_csr, user_items, cache_version):
+        """Returns the factors of the users solved from their interactions, cached until the user or the model changes."""
+        factors = self._fold_in_cache.get_many(userids_in_csr)
+        missed = [i for i, user_factors in enumerate(factors) if user_factors is None]
+        if missed:
+            model_collaborative = snapshot.model.model_collaborative
+            missed_userids = [userids_in_csr[i] for i in missed]
+            folded = model_collaborative.recalculate_user(missed_userids, user_items[missed, :len(model_collaborative.item_factors)])
+            for i, user_factors in zip(missed, folded):
+                factors[i] = user_factors
+            self._fold_in_cache.put_many(missed_userids, folded, cache_version)
+        return np.array(factors)
+
+    def _record_latency(self, branch, users_num, seconds):
+        if users_num == 0:
+            return
+        metrics.recommendation_seconds.observe(seconds, branch=branch)
+        metrics.recommended_users.inc(users_num, branch=branch)
+        with self._latency_lock:
+            stats = self._latency_stats.setdefault(branch, {"calls": 0, "users": 0, "seconds": 0.0, "max_seconds": 0.0})
+            stats["calls"] += 1
+            stats["users"] += users_num
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
 
-        courses_to_shuffle = set()
+    def _mix_courses(self, snapshot, recommendations_in_csrids, N, adv_perc, bottom_perc):
+        mixing = [i for i, recommendation in enumerate(recommendations_in_csrids) if len(recommendation)]
+        if not mixing or not (adv_perc or bottom_perc):
+            return recommendations_in_csrids
+
+        first_courses = [recommendations_in_csrids[i][0] for i in mixing]
+        courses_to_shuffle = [set() for _ in mixing]
         if bottom_perc:
-            bottom = self._data_manager._courses_top_list.most_common()[:-N-1:-1]
-            similar = self._content_model.similar_items([recommendation_in_csrids[0]],int(N * bottom_perc),items=bottom)[0][0]
-            courses_to_shuffle.update(set(similar))
+            bottom = snapshot.bottom_similar_items
+            if bottom is None or N > bottom.get_candidates_num():
+                bottom = snapshot.popularity_index.bottom(N)
+            similar = Processor._similar_courses(snapshot, bottom, first_courses, int(N * bottom_perc), N)
+            for courses, similar_courses in zip(courses_to_shuffle, similar):
+                courses.update(similar_courses)
         if adv_perc:
-            adv = np.array(self._data_manager._adv_courses)
-            similar = self._content_model.similar_items([recommendation_in_csrids[0]],int(N * adv_perc), items=adv)[0][0]
-            courses_to_shuffle.update(set(similar))
-
-        recommendation = [self._data_manager._courses_id_converter.get_backward(courseid) for courseid in recommendation_in_csrids]
-
-        if len(courses_to_shuffle):
-            courses_to_shuffle.difference_update(set(recommendation))
-            courses_to_shuffle = list(courses_to_shuffle)
-            random.shuffle(courses_to_shuffle)
-            courses_to_shuffle = [self._data_manager._courses_id_converter.get_backward(courseid) for courseid in courses_to_shuffle]
-            recommendation[-len(courses_to_shuffle):] = courses_to_shuffle
-            
-        return recommendation
+            adv = snapshot.adv_courses if snapshot.adv_similar_items is None else snapshot.adv_similar_items
+            similar = Processor._similar_courses(snapshot, adv, first_courses, int(N * adv_perc))
+            for courses, similar_courses in zip(courses_to_shuffle, similar):
+                courses.update(similar_courses)
+
+        mixed = list(recommendations_in_csrids)
+        for i, courses in zip(mixing, courses_to_shuffle):
+            courses = list(courses.difference(recommendations_in_csrids[i]))
+            if not courses:
+                continue
+            random.shuffle(courses)
+            mixed[i] = list(recommendations_in_csrids[i])
+            mixed[i][-len(courses):] = courses
+        return mixed
+
+    def _similar_courses(snapshot, candidates, courses, N, candidates_num=None):
+        """Returns up to N candidates similar to each course, candidates are a similar items table or an array of courses.
+
+        Without a table the content model is asked directly, without a content model nothing is mixed in.
+        """
+        if isinstance(candidates, SimilarItemsTable):
+            return candidates.lookup(courses, N, candidates_num)
+        if snapshot.content_model is None:
+            return [[] for _ in courses]
+        return snapshot.content_model.similar_items(courses, N, items=np.asarray(candidates))[0]
     
     async def load_cosine_model(self):
-        self._content_model = await CosineContent.load(self._data_manager, self._content_model_path)
+        with metrics.stage_seconds.time(stage='content_model_load'):
+            self._content_model = await CosineContent.load(self._data_manager, self._content_model_path, self._courses_features_path)
+        self._publish_snapshot(self._snapshot)
 
     async def fit_in_another_process(self, is_full_fit = True):
-        self.save_model()
-        self.__logger.info("Models and interactions was saved")
-
-        with ProcessPoolExecutor() as executor:
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(executor, Processor.fit_from_file_to_file, is_full_fit, list(self._data_manager._changed_users), self._interactions_path, self._model_path, self._model_path)
-            self.__logger.info("Finished fit from file to file")
-
-        self._model = ModelType.load(self._model_path)
-        self.__logger.info("Model was loaded")
+        self.save_processor_data()
 
-    def save_model(self):
-        self._model.save(self._model_path)
-        with open(self._interactions_path, 'wb') as f:
-            scipy.sparse.save_npz(f, self._data_manager.get_interaction_csr_matrix())
+        snapshot = self._snapshot
+        users, generation = self._data_manager.take_refit_users(None if is_full_fit else self._partial_fit_batch)
+        loop = asyncio.get_running_loop()
+        with metrics.stage_seconds.time(stage='full_fit' if is_full_fit else 'partial_fit'):
+            self._model = await loop.run_in_executor(
+                  None
+                , self._training_worker.fit
+                , self._model
+                , is_full_fit
+                , snapshot.interactions
+                , users
+            )
+        self._data_manager.commit_refit(None if is_full_fit else users, generation)
+        self._publish_snapshot(self._snapshot._replace(changed_users=self._data_manager.get_changed_users()), model_changed=True)
+        await self._share_snapshot()
+        self.__logger.info("Model was updated by the training worker")
 
+    def save_processor_data(self):
         with open(self._processor_data_path, 'wb') as f:
             pickle.dump({
                   "last_full_fit_timestemp": self._last_full_fit_timestemp 
@@ -129,40 +414,94 @@ class Processor:
                 , "full_incoming_updates": self._full_incoming_updates
             }, f)
 
-    def fit_from_file_to_file(is_full_fit, changed_users, interactions_path, model_path_from, model_path_to):
-        with open(interactions_path, 'rb') as f:
-            interactions = scipy.sparse.load_npz(f)
-        model = ModelType.load(model_path_from)
+    async def save_checkpoint(self):
+        loop = asyncio.get_running_loop()
+        state = await loop.run_in_executor(self._ingestion_executor, self._data_manager.get_checkpoint_state)
+        await loop.run_in_executor(None, DataManager.save_checkpoint, state, self._data_manager._checkpoint_path)
+        self.__logger.info("Data manager checkpoint was saved")
 
-        if is_full_fit:
-            model.fit(interactions, interactions)
-        else:
-            model.partial_fit(changed_users, interactions[changed_users, :])
-
-        model.save(model_path_to)
+    def close(self):
+        if self._data_manager is None:
+            return
+        self._ingestion_executor.shutdown()
+        DataManager.save_checkpoint(self._data_manager.get_checkpoint_state(), self._data_manager._checkpoint_path)
+        self._data_manager.close()
+        self._training_worker.stop()
 
     def fit(self):
         interactions = self._data_manager.get_interaction_csr_matrix()
+        users, generation = self._data_manager.take_refit_users()
         self._model.fit(interactions, interactions)
+        self._data_manager.commit_refit(None, generation)
 
     def partial_fit(self):
         interactions = self._data_manager.get_interaction_csr_matrix()
-        self._model.partial_fit(self._changed_users, interactions[self._changed_users, :])
+        users, generation = self._data_manager.take_refit_users(self._partial_fit_batch)
+        self._model.partial_fit(users, interactions[users, :])
+        self._data_manager.commit_refit(users, generation)
+
+    def get_recommendation_cache_stats(self):
+        return self._recommendation_cache.get_stats()
+
+    def get_ingestion_stats(self):
+        if self._data_manager is None:
+            return dict()
+        return self._data_manager.get_ingestion_stats()
+
+    def get_latency_stats(self):
+        """Returns the calls, users and seconds of every recommendation branch, see _recommend_in_csrids."""
+        with self._latency_lock:
+            return {
+                branch: {**stats, "mean_ms_per_user": 1000 * stats["seconds"] / stats["users"]}
+                for branch, stats in self._latency_stats.items()
+            }
+
+    def get_fold_in_cache_stats(self):
+        return self._fold_in_cache.get_stats()
+
+    def get_retention_stats(self):
+        return dict(self._retention_stats)
 
     def check_userid(self, userid: str):
-        return self._data_manager._users_id_converter.get_forward(userid) is None
+        return self.get_snapshot().users_id_converter.get_forward(userid) is None
+
+    def get_recently_viewed(self, userid, N):
+        if self._data_manager is not None:
+            return self._data_manager.get_recently_viewed(userid, N)
+
+        snapshot = self.get_snapshot()
+        userid_in_csr = snapshot.users_id_converter.get_forward(userid)
+        if userid_in_csr is None:
+            return None
+        start, end = snapshot.interactions.indptr[userid_in_csr:userid_in_csr + 2]
+        order = np.argsort(-snapshot.last_timestamps[start:end], kind='stable')
+        viewed = snapshot.courses_id_converter.backward_many(snapshot.interactions.indices[start:end][order])
+        return [courseid for courseid in viewed if courseid][:N]
+
+    def get_user_course_coefficient(self, userid, courseid):
+        if self._data_manager is not None:
+            return self._data_manager.get_user_course_coefficient(userid, courseid)
+
+        snapshot = self.get_snapshot()
+        userid_in_csr = snapshot.users_id_converter.get_forward(userid)
+        courseid_in_csr = snapshot.courses_id_converter.get_forward(courseid)
+        if userid_in_csr is None or courseid_in_csr is None:
+            return None
+        return float(snapshot.interactions[userid_in_csr, courseid_in_csr])
     
     def get_similar_items(self):
         pass
     
-    def get_top_courses(self, N: int = 10):
-        top = self._data_manager._courses_top_list.most_common(N)
-        return [self._data_manager._courses_id_converter.get_backward(courseid) for [courseid, _] in top]
+    def get_top_courses(self, N: int = 10, window_hours: int = 0, decayed: bool = False):
+        snapshot = self.get_snapshot()
+        top = snapshot.popularity_index.top(N, window_hours, decayed)
+        return snapshot.courses_id_converter.backward_many(top).tolist()
     
-    def get_bottom_courses(self, N: int = 10):
-        bottom = self._data_manager._courses_top_list.most_common()[:-N-1:-1]
-        return [self._data_manager._courses_id_converter.get_backward(courseid) for [courseid, _] in bottom]
+    def get_bottom_courses(self, N: int = 10, window_hours: int = 0, decayed: bool = False):
+        snapshot = self.get_snapshot()
+        bottom = snapshot.popularity_index.bottom(N, window_hours, decayed)
+        return snapshot.courses_id_converter.backward_many(bottom).tolist()
     
     def get_adv_courses(self):
-        adv = self._data_manager._adv_courses
-        return [self._data_manager._courses_id_converter.get_backward(courseid) for courseid in adv]
\ No newline at end of file
+        snapshot = self.get_snapshot()
+        return snapshot.courses_id_converter.backward_many(snapshot.adv_courses).tolist()
\ No newline at end of file
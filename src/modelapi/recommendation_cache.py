@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class RecommendationCache():
+    """LRU/TTL cache of ranked recommendation lists keyed by user, list size and model version.
+
+    Entries of a user are dropped when the user's interactions change, all entries are dropped
+    when a new model version is loaded. Every invalidation bumps the version, a put given the version
+    read before computing the recommendation is skipped if an invalidation happened meanwhile.
+    A size of 0 disables the cache.
+    """
+
+    def __init__(self, size, ttl) -> None:
+        self._size = size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+
+        self._entries = OrderedDict()
+        self._user_keys = dict()
+        self._model_version = 0
+        self._version = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, userid, N):
+        key = (self._model_version, userid, N)
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def get_version(self):
+        return self._version
+
+    def put(self, userid, N, recommendation, version = None):
+        if self._size <= 0:
+            return
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            key = (self._model_version, userid, N)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self._ttl, recommendation)
+            self._user_keys.setdefault(userid, set()).add(key)
+
+            while len(self._entries) > self._size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_users(self, userids):
+        if len(userids) == 0:
+            return
+        with self._lock:
+            self._version += 1
+            for userid in userids:
+                for key in self._user_keys.get(userid, set()).copy():
+                    self._remove(key)
+
+    def invalidate_model(self):
+        with self._lock:
+            self._version += 1
+            self._model_version += 1
+            self._evictions += len(self._entries)
+            self._entries.clear()
+            self._user_keys.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                  "size": len(self._entries)
+                , "max_size": self._size
+                , "model_version": self._model_version
+                , "hits": self._hits
+                , "misses": self._misses
+                , "evictions": self._evictions
+            }
+
+    def _remove(self, key):
+        del self._entries[key]
+        user_keys = self._user_keys[key[1]]
+        user_keys.discard(key)
+        if not user_keys:
+            del self._user_keys[key[1]]
+        self._evictions += 1
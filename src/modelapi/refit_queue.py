@@ -0,0 +1,80 @@
+import threading
+
+import numpy as np
+
+
+class RefitQueue():
+    """Users whose interactions changed since their factors were last fitted.
+
+    Every user is kept once with the timestamp of its latest changed interaction and the generation
+    it was last pushed in. take returns a batch of the most recently active users and starts a new
+    generation, commit removes the fitted users that were not pushed again after take, so changes
+    ingested while a fit runs stay queued for the next one.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._users = np.zeros(0, dtype=np.int64)
+        self._last_activity = np.zeros(0, dtype=np.int64)
+        self._generations = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._users)
+
+    def get_users(self):
+        return self._users
+
+    def push(self, users, last_activity):
+        users = np.asarray(users, dtype=np.int64)
+        if len(users) == 0:
+            return
+        with self._lock:
+            self._users, inverse = np.unique(np.concatenate([self._users, users]), return_inverse=True)
+            inverse = inverse.reshape(-1)
+            self._last_activity = RefitQueue._max_by(inverse, np.concatenate([self._last_activity, np.asarray(last_activity, dtype=np.int64)]))
+            self._generations = RefitQueue._max_by(inverse, np.concatenate([self._generations, np.full(len(users), self._generation, dtype=np.int64)]))
+
+    def take(self, batch_size = None):
+        """Returns up to batch_size sorted users, most recently active first to be taken, and the generation to commit them with."""
+        with self._lock:
+            order = np.argsort(-self._last_activity, kind='stable')
+            if batch_size is not None:
+                order = order[:batch_size]
+            generation = self._generation
+            self._generation += 1
+            return np.sort(self._users[order]), generation
+
+    def commit(self, users, generation):
+        """Removes the users taken in generation, or every user pushed up to it when users is None."""
+        with self._lock:
+            is_fitted = self._generations <= generation
+            if users is not None:
+                is_fitted &= np.isin(self._users, users)
+            self._users = self._users[~is_fitted]
+            self._last_activity = self._last_activity[~is_fitted]
+            self._generations = self._generations[~is_fitted]
+
+    def compact_users(self, new_users):
+        """Renumbers the users by new_users, a mapping of old ids with -1 for the evicted users."""
+        with self._lock:
+            users = new_users[self._users]
+            is_kept = users >= 0
+            self._users = users[is_kept]
+            self._last_activity = self._last_activity[is_kept]
+            self._generations = self._generations[is_kept]
+
+    def get_state(self):
+        return {'users': self._users, 'last_activity': self._last_activity}
+
+    def from_state(state):
+        queue = RefitQueue()
+        queue._users = np.array(state['users'], dtype=np.int64)
+        queue._last_activity = np.array(state['last_activity'], dtype=np.int64)
+        queue._generations = np.zeros(len(queue._users), dtype=np.int64)
+        return queue
+
+    def _max_by(inverse, values):
+        result = np.full(inverse.max(initial=-1) + 1, np.iinfo(np.int64).min, dtype=np.int64)
+        np.maximum.at(result, inverse, values)
+        return result
@@ -0,0 +1,196 @@
+import numpy as np
+
+
+class ExactIndex():
+    """Scores every item, the reference for approximate indexes.
+
+    Users are scored together by one matrix product per chunk of chunk_size scores.
+    """
+
+    kind = 'exact'
+    chunk_size = 1 << 24
+
+    def __init__(self, item_factors) -> None:
+        self._item_factors = item_factors
+
+    def search(self, user_factors, N, exclude=None, filter_items=None):
+        """Returns (users, N) arrays of the best items by inner product, padded with id -1 and score -inf.
+
+        exclude is a csr matrix with a row of items to skip per user, filter_items are skipped for all users.
+        """
+        users_num, items_num = len(user_factors), len(self._item_factors)
+        recs = np.full((users_num, N), -1, dtype=np.int32)
+        scores = np.full((users_num, N), -np.inf, dtype=np.float32)
+        top_num = min(N, items_num)
+        if top_num == 0:
+            return recs, scores
+        if filter_items is not None:
+            filter_items = np.asarray(filter_items, dtype=np.int64)
+            filter_items = filter_items[filter_items < items_num]
+
+        step = max(ExactIndex.chunk_size // items_num, 1)
+        for start in range(0, users_num, step):
+            end = min(start + step, users_num)
+            chunk_scores = np.asarray(user_factors[start:end] @ self._item_factors.T, dtype=np.float32)
+            if exclude is not None:
+                rows = exclude[start:end]
+                users = np.repeat(np.arange(end - start), np.diff(rows.indptr))
+                is_known = rows.indices < items_num
+                chunk_scores[users[is_known], rows.indices[is_known]] = -np.inf
+            if filter_items is not None:
+                chunk_scores[:, filter_items] = -np.inf
+
+            top = np.argpartition(-chunk_scores, top_num - 1, axis=1)[:, :top_num] if top_num < items_num else np.tile(np.arange(items_num), (end - start, 1))
+            top_scores = np.take_along_axis(chunk_scores, top, axis=1)
+            order = np.lexsort((top, -top_scores), axis=1)
+            top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+            is_found = top_scores > -np.inf
+            recs[start:end, :top_num] = np.where(is_found, top, -1)
+            scores[start:end, :top_num] = top_scores
+        return recs, scores
+
+    def get_state(self):
+        return {'kind': np.array(self.kind)}
+
+    def from_state(state, item_factors):
+        return ExactIndex(item_factors)
+
+    def matches(state, item_factors, **params):
+        """Tells if a saved state can be reused for params."""
+        return True
+
+
+class IVFIndex(ExactIndex):
+    """Inverted file index: items are clustered by k-means and only the items of the probes clusters
+    nearest to the user are scored exactly.
+
+    Items are stored ordered by cluster, so a probed cluster is scored as one contiguous block.
+    More probes raise recall and latency, probes == clusters_num scores every item.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, item_factors, clusters_num=32, probes=8, iterations=10, random_state=0) -> None:
+        super().__init__(item_factors)
+        clusters_num = max(min(clusters_num, len(item_factors)), 1)
+        self._probes = max(min(probes, clusters_num), 1)
+        self._centroids, assignment = IVFIndex._kmeans(np.asarray(item_factors, dtype=np.float32), clusters_num, iterations, random_state)
+        self._order = np.argsort(assignment, kind='stable')
+        self._offsets = np.searchsorted(assignment[self._order], np.arange(clusters_num + 1))
+        self._clustered_factors = np.ascontiguousarray(item_factors[self._order])
+
+    def set_probes(self, probes):
+        self._probes = max(min(probes, len(self._centroids)), 1)
+
+    def get_state(self):
+        return {
+              'kind': np.array(self.kind)
+            , 'probes': np.array(self._probes)
+            , 'centroids': self._centroids
+            , 'order': self._order
+            , 'offsets': self._offsets
+            , 'clustered_factors': self._clustered_factors
+        }
+
+    def from_state(state, item_factors):
+        index = object.__new__(IVFIndex)
+        index._item_factors = item_factors
+        index._probes = int(state['probes'])
+        index._centroids = state['centroids']
+        index._order = state['order']
+        index._offsets = state['offsets']
+        index._clustered_factors = state['clustered_factors']
+        return index
+
+    def search(self, user_factors, N, exclude=None, filter_items=None):
+        """Returns (users, N) arrays of the best probed items by inner product, padded with id -1 and score -inf, see ExactIndex.search."""
+        users_num = len(user_factors)
+        recs = np.full((users_num, N), -1, dtype=np.int32)
+        scores = np.full((users_num, N), -np.inf, dtype=np.float32)
+        for i in range(users_num):
+            candidates, candidate_scores = self._score(user_factors[i])
+            is_excluded = np.zeros(len(candidates), dtype=bool)
+            if exclude is not None:
+                is_excluded |= np.isin(candidates, exclude.indices[exclude.indptr[i]:exclude.indptr[i + 1]])
+            if filter_items is not None:
+                is_excluded |= np.isin(candidates, filter_items)
+            candidates, candidate_scores = candidates[~is_excluded], candidate_scores[~is_excluded]
+
+            top = np.argpartition(-candidate_scores, N - 1)[:N] if len(candidates) > N else np.arange(len(candidates))
+            top = top[np.argsort(-candidate_scores[top], kind='stable')]
+            recs[i, :len(top)] = candidates[top]
+            scores[i, :len(top)] = candidate_scores[top]
+        return recs, scores
+
+    def matches(state, item_factors, clusters_num=32, **params):
+        return len(state['centroids']) == max(min(clusters_num, len(item_factors)), 1)
+
+    def _score(self, user_factors):
+        centroid_scores = self._centroids[:, :-1] @ user_factors - 0.5 * (self._centroids ** 2).sum(axis=1)
+        probed = np.argpartition(-centroid_scores, self._probes - 1)[:self._probes]
+        blocks = [(self._offsets[cluster], self._offsets[cluster + 1]) for cluster in probed]
+        candidates = np.concatenate([self._order[start:end] for start, end in blocks])
+        return candidates, np.concatenate([self._clustered_factors[start:end] @ user_factors for start, end in blocks])
+
+    def _kmeans(points, clusters_num, iterations, random_state):
+        """Clusters the points extended by sqrt(max_norm^2 - norm^2), which turns the best inner products with
+        a user into the nearest extended points to the user extended by 0."""
+        squared_norms = (points ** 2).sum(axis=1)
+        points = np.hstack([points, np.sqrt(squared_norms.max() - squared_norms)[:, None]])
+
+        rng = np.random.default_rng(random_state)
+        centroids = points[rng.choice(len(points), clusters_num, replace=False)]
+        for _ in range(iterations + 1):
+            assignment = np.argmax(points @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+            sizes = np.bincount(assignment, minlength=clusters_num)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, points)
+            is_filled = sizes > 0
+            centroids[is_filled] = sums[is_filled] / sizes[is_filled, None]
+        return centroids, assignment
+
+
+_index_types = {index_type.kind: index_type for index_type in [ExactIndex, IVFIndex]}
+
+
+def make_retrieval_index(item_factors, params, state=None):
+    """Returns the index described by the RetrievalIndex params of a model params file, e.g. {"index": "ivf", "clusters_num": 32, "probes": 16}.
+
+    The params files have no index by default: implicit's recommend is faster than both indexes on a catalogue
+    of a few thousand courses. IVF pays off from tens of thousands of items when its recall at the chosen
+    probes is acceptable, the exact index is the recall reference. Measure both with benchmarks/retrieval_index.py.
+
+    A saved state of the same kind and clusters is reused instead of building the index, the probes of params
+    apply to it. None is returned for an unfitted model or without params, then the model scores every item itself.
+    """
+    if item_factors is None or params is None:
+        return None
+    params = dict(params)
+    index_type = _index_types[params.pop('index', ExactIndex.kind)]
+    if state and str(state['kind']) == index_type.kind and index_type.matches(state, item_factors, **params):
+        index = index_type.from_state(state, item_factors)
+        if 'probes' in params:
+            index.set_probes(params['probes'])
+        return index
+    return index_type(item_factors, **params)
+
+
+def recommend_collaborative(model_collaborative, retrieval_index, userid, user_items, N, filter_already_liked_items, filter_items, recalculate_user, items, user_factors=None):
+    """Recommends with the retrieval index, falls back to the model for what the index does not support.
+
+    Given user_factors, e.g. folded in with recalculate_user beforehand, they are searched instead of
+    the factors of userid, with an exact index when the model has none.
+    """
+    if user_factors is not None and items is None:
+        retrieval_index = ExactIndex(model_collaborative.item_factors) if retrieval_index is None else retrieval_index
+    elif retrieval_index is None or recalculate_user or items is not None:
+        return model_collaborative.recommend(userid, user_items, N, filter_already_liked_items, filter_items, recalculate_user, items)
+    else:
+        user_factors = model_collaborative.user_factors[np.atleast_1d(userid)]
+
+    return retrieval_index.search(
+          np.atleast_2d(user_factors)
+        , min(N, len(model_collaborative.item_factors))
+        , user_items if filter_already_liked_items else None
+        , filter_items
+    )
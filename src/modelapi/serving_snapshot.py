@@ -0,0 +1,32 @@
+from typing import NamedTuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from modelapi.helpers import IdConverterView
+from modelapi.popularity_index import PopularityIndex
+from modelapi.similar_items import SimilarItemsTable
+
+
+class ServingSnapshot(NamedTuple):
+    """State read by the request handlers.
+
+    A snapshot is never modified: ingestion builds a new one in its thread and the processor
+    publishes it by replacing a single reference, so a request sees one consistent state.
+    last_timestamps is only set in snapshots attached by a SnapshotReader, see shared_snapshot.
+    The similar items tables are set by the processor once the content model is loaded, the fallback
+    table of users with few interactions once the model has a content part. HTTP workers attach
+    the tables published with the snapshot instead of building them.
+    """
+    interactions: sp.csr_matrix
+    users_id_converter: IdConverterView
+    courses_id_converter: IdConverterView
+    popularity_index: PopularityIndex
+    changed_users: frozenset
+    adv_courses: list
+    model: object
+    content_model: object = None
+    last_timestamps: np.ndarray = None
+    adv_similar_items: SimilarItemsTable = None
+    bottom_similar_items: SimilarItemsTable = None
+    fallback_similar_items: SimilarItemsTable = None
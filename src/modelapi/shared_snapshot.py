@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+import logging
+import numpy as np
+import scipy.sparse as sp
+
+from modelapi import artifacts
+from modelapi.content_models.cosine import CosineContent
+from modelapi.helpers import IdConverter, csr_from_arrays, csr_to_arrays, with_prefix
+from modelapi.popularity_index import PopularityIndex
+from modelapi.retrieval_index import make_retrieval_index
+from modelapi.serving_snapshot import ServingSnapshot
+from modelapi.similar_items import SimilarItemsTable
+
+logger = logging.getLogger('shared_snapshot')
+
+SIMILAR_ITEMS_TABLES = ['adv_similar_items', 'bottom_similar_items', 'fallback_similar_items']
+
+
+def _converter_arrays(converter, prefix):
+    ids, kinds = converter.to_arrays()
+    sorted_keys, sorted_positions = converter.get_index()
+    return {prefix + 'ids': ids, prefix + 'kinds': kinds, prefix + 'sorted_keys': sorted_keys, prefix + 'sorted_positions': sorted_positions}
+
+
+def _converter_from_arrays(arrays, prefix):
+    return IdConverter.from_arrays(arrays[prefix + 'ids'], arrays[prefix + 'kinds'], arrays[prefix + 'sorted_keys'], arrays[prefix + 'sorted_positions'])
+
+
+class SnapshotPublisher():
+    """Writes serving snapshots as versioned directories of .npy files for SnapshotReader.
+
+    A version is complete before the 'current' pointer file is atomically replaced. Only the
+    newest keep_versions directories are kept: workers that still map an older version keep
+    their pages, the files are freed once the last mapping is closed. The model and similarity
+    files are linked from the previous version while their arrays are the same objects.
+    """
+
+    def __init__(self, directory, keep_versions) -> None:
+        self._directory = directory
+        self._keep_versions = keep_versions
+        self._version = None
+        self._published = dict()
+        os.makedirs(directory, exist_ok=True)
+
+    def publish(self, snapshot, last_timestamps):
+        """Writes the snapshot, last_timestamps holds the last event time of every nonzero of snapshot.interactions."""
+        arrays = {
+              **csr_to_arrays(snapshot.interactions, 'interactions_')
+            , 'interactions_last_timestamps': last_timestamps
+            , **_converter_arrays(snapshot.users_id_converter, 'users_')
+            , **_converter_arrays(snapshot.courses_id_converter, 'courses_')
+            , **{'popularity_' + name: array for name, array in snapshot.popularity_index.get_state().items()}
+            , 'changed_users': np.array(sorted(snapshot.changed_users), dtype=np.int64)
+            , 'adv_courses': np.array(snapshot.adv_courses, dtype=np.int64)
+        }
+        model = snapshot.model
+        content_similarity = None if snapshot.content_model is None else snapshot.content_model.similarity
+        groups = [
+              ('model', (model.model_collaborative.user_factors, model.model_collaborative.item_factors, getattr(model.model_content, 'similarity', None), model.retrieval_index), lambda: SnapshotPublisher._model_arrays(model))
+            , ('content', (content_similarity,), lambda: SnapshotPublisher._content_arrays(content_similarity))
+        ]
+        for name in SIMILAR_ITEMS_TABLES:
+            table = getattr(snapshot, name)
+            groups.append((name, (table,), lambda name=name, table=table: SnapshotPublisher._table_arrays(name, table)))
+        previous_exists = self._version is not None and os.path.isdir(os.path.join(self._directory, self._version))
+        published, reused = dict(), list()
+        for group, sources, make_arrays in groups:
+            previous_sources, names = self._published.get(group, ((), ()))
+            if previous_exists and len(sources) == len(previous_sources) and all(source is previous for source, previous in zip(sources, previous_sources)):
+                reused.extend(names)
+            else:
+                group_arrays = make_arrays()
+                arrays.update(group_arrays)
+                names = list(group_arrays)
+            published[group] = (sources, names)
+
+        version = artifacts.write_version(self._directory, arrays, previous=self._version, reused=reused)
+        self._version = version
+        self._published = published
+        artifacts.reclaim_versions(self._directory, self._keep_versions)
+        logger.info('Published serving snapshot ' + version + ', ' + str(len(reused)) + ' arrays reused')
+        return version
+
+    def _model_arrays(model):
+        arrays = dict()
+        if model.model_collaborative.user_factors is not None:
+            arrays['user_factors'] = model.model_collaborative.user_factors
+            arrays['item_factors'] = model.model_collaborative.item_factors
+            arrays.update(csr_to_arrays(model.model_content.similarity, 'similarity_'))
+        if model.retrieval_index is not None:
+            arrays.update({'retrieval_' + name: array for name, array in model.retrieval_index.get_state().items()})
+        return arrays
+
+    def _table_arrays(name, table):
+        if table is None:
+            return dict()
+        return {name + '_' + key: array for key, array in table.get_state().items()}
+
+    def _content_arrays(similarity):
+        if similarity is None:
+            return dict()
+        return csr_to_arrays(similarity, 'content_similarity_')
+
+
+class SnapshotReader():
+    """Attaches to the snapshots of a SnapshotPublisher.
+
+    Arrays are memory-mapped as described in artifacts.read_version.
+    The pointer file is checked at most every refresh_seconds.
+    """
+
+    def __init__(self, directory, model_type, refresh_seconds) -> None:
+        self._directory = directory
+        self._model_type = model_type
+        self._refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+
+        self._version = None
+        self._checked_at = 0
+        self._snapshot = SnapshotReader._empty_snapshot(model_type)
+
+    def get_snapshot(self):
+        if time.monotonic() - self._checked_at >= self._refresh_seconds:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self._refresh_seconds:
+                    self._refresh()
+                    self._checked_at = time.monotonic()
+        return self._snapshot
+
+    def get_version(self):
+        return self._version
+
+    def _refresh(self):
+        version = artifacts.get_current_version(self._directory)
+        if version is None or version == self._version:
+            return
+
+        arrays, _ = artifacts.read_version(self._directory, version)
+        self._snapshot = self._make_snapshot(arrays)
+        self._version = version
+        logger.info('Attached to serving snapshot ' + version)
+
+    def _make_snapshot(self, arrays):
+        model = self._model_type.load(None)
+        if 'user_factors' in arrays:
+            model.model_collaborative.user_factors = arrays['user_factors']
+            model.model_collaborative.item_factors = arrays['item_factors']
+            model.model_content.__setstate__(dict(model.model_content.__getstate__(), similarity=csr_from_arrays(arrays, 'similarity_')))
+            model.retrieval_index = make_retrieval_index(arrays['item_factors'], model.retrieval_params, with_prefix(arrays, 'retrieval_'))
+
+        content_model = None
+        if 'content_similarity_data' in arrays:
+            content_model = CosineContent.from_similarity(csr_from_arrays(arrays, 'content_similarity_'))
+
+        tables = {
+              name: SimilarItemsTable.from_state(with_prefix(arrays, name + '_'))
+            for name in SIMILAR_ITEMS_TABLES if name + '_candidates' in arrays
+        }
+
+        return ServingSnapshot(
+              interactions=csr_from_arrays(arrays, 'interactions_')
+            , users_id_converter=_converter_from_arrays(arrays, 'users_')
+            , courses_id_converter=_converter_from_arrays(arrays, 'courses_')
+            , popularity_index=PopularityIndex.from_state(with_prefix(arrays, 'popularity_'))
+            , changed_users=frozenset(arrays['changed_users'].tolist())
+            , adv_courses=arrays['adv_courses'].tolist()
+            , model=model
+            , content_model=content_model
+            , last_timestamps=arrays['interactions_last_timestamps']
+            , **tables
+        )
+
+    def _empty_snapshot(model_type):
+        return ServingSnapshot(
+              interactions=sp.csr_matrix((0, 0), dtype=np.float32)
+            , users_id_converter=IdConverter()
+            , courses_id_converter=IdConverter()
+            , popularity_index=PopularityIndex()
+            , changed_users=frozenset()
+            , adv_courses=list()
+            , model=model_type.load(None)
+            , content_model=None
+            , last_timestamps=np.zeros(0, dtype=np.int64)
+        )
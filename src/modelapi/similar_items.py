@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class SimilarItemsTable():
+    """Similar items of every course restricted to an ordered candidate set, precomputed from an item-item similarity.
+
+    Every row holds the candidates among the course neighbours, most similar first. lookup answers
+    like ItemItemRecommender.similar_items with items=candidates[:candidates_num]: candidates that are
+    not neighbours follow in candidate order. Tables are never modified, updated returns a new table
+    that shares the rows not affected by the change of candidates.
+    """
+
+    def __init__(self, similarity, candidates) -> None:
+        self._similarity = similarity.tocsr()
+        self._similarity_csc = self._similarity.tocsc()
+        self._set_candidates(candidates)
+        self._rows = [self._make_row(course) for course in range(self._similarity.shape[0])]
+
+    def get_candidates_num(self):
+        return len(self._candidates)
+
+    def lookup(self, courses, N, candidates_num=None):
+        """Returns up to N similar candidates for each course, only the first candidates_num candidates are used."""
+        candidates_num = len(self._candidates) if candidates_num is None else min(candidates_num, len(self._candidates))
+        similar = list()
+        for course in courses:
+            if course >= len(self._rows):
+                similar.append(np.zeros(0, dtype=np.int64))
+                continue
+
+            row = self._rows[course]
+            row = row[self._ranks[row] < candidates_num][:N]
+            if len(row) < N:
+                missing = self._candidates[:candidates_num]
+                missing = missing[~np.isin(missing, row)][:N - len(row)]
+                row = np.concatenate([row, missing])
+            similar.append(row)
+        return similar
+
+    def updated(self, candidates):
+        """Returns a table for new candidates, recomputing only the rows whose neighbours changed membership."""
+        candidates = np.asarray(candidates, dtype=np.int64)
+        changed = np.setxor1d(self._candidates, candidates)
+        changed = changed[changed < self._similarity.shape[1]]
+        if len(changed) == 0 and np.array_equal(candidates, self._candidates):
+            return self
+
+        table = object.__new__(SimilarItemsTable)
+        table._similarity = self._similarity
+        table._similarity_csc = self._similarity_csc
+        table._set_candidates(candidates)
+        table._rows = list(self._rows)
+        for course in np.unique(self._similarity_csc[:, changed].indices):
+            table._rows[course] = table._make_row(course)
+        return table
+
+    def get_state(self):
+        """Returns the arrays needed by lookup, see from_state."""
+        lengths = np.array([len(row) for row in self._rows], dtype=np.int64)
+        return {
+              'candidates': self._candidates
+            , 'ranks': self._ranks
+            , 'rows_indptr': np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+            , 'rows_indices': np.concatenate(self._rows).astype(np.int64) if self._rows else np.zeros(0, dtype=np.int64)
+        }
+
+    def from_state(state):
+        """Restores a table saved by get_state, e.g. from memory-mapped arrays. The restored table can not be updated."""
+        table = object.__new__(SimilarItemsTable)
+        table._similarity = None
+        table._similarity_csc = None
+        table._candidates = state['candidates']
+        table._ranks = state['ranks']
+        indptr, indices = state['rows_indptr'], state['rows_indices']
+        table._rows = [indices[indptr[course]:indptr[course + 1]] for course in range(len(indptr) - 1)]
+        return table
+
+    def _set_candidates(self, candidates):
+        self._candidates = np.asarray(candidates, dtype=np.int64)
+        self._ranks = np.full(self._similarity.shape[1], np.iinfo(np.int64).max, dtype=np.int64)
+        in_similarity = self._candidates < len(self._ranks)
+        self._ranks[self._candidates[in_similarity]] = np.flatnonzero(in_similarity)
+
+    def _make_row(self, course):
+        start, end = self._similarity.indptr[course], self._similarity.indptr[course + 1]
+        ids = self._similarity.indices[start:end]
+        scores = self._similarity.data[start:end]
+        is_candidate = self._ranks[ids] < len(self._candidates)
+        ids, scores = ids[is_candidate], scores[is_candidate]
+        return ids[np.argsort(-scores, kind='stable')].astype(np.int64)
@@ -0,0 +1,162 @@
+import logging
+import multiprocessing
+import threading
+import numpy as np
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from modelapi import metrics
+from modelapi.helpers import csr_from_arrays, csr_to_arrays
+
+
+def _share_arrays(arrays):
+    """Copies arrays into new shared memory blocks and returns their descriptions.
+
+    The receiving side takes ownership of the blocks, see _take_arrays.
+    """
+    description = dict()
+    try:
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            resource_tracker.unregister(block._name, 'shared_memory')
+            description[name] = (block.name, array.shape, array.dtype.str)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            block.close()
+    except BaseException:
+        _unlink_arrays(description)
+        raise
+    return description
+
+
+def _take_arrays(description):
+    arrays = dict()
+    for name, (block_name, shape, dtype) in description.items():
+        block = SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf).copy()
+        block.close()
+        block.unlink()
+    return arrays
+
+
+def _unlink_arrays(description):
+    """Frees the blocks of a description that were not taken, e.g. when the receiving side failed."""
+    for block_name, _, _ in description.values():
+        try:
+            block = SharedMemory(name=block_name)
+        except FileNotFoundError:
+            continue
+        block.close()
+        block.unlink()
+
+
+def _run(connection, model_type, model_path, keep_versions):
+    logger = logging.getLogger('training_worker')
+    model = model_type.load(model_path)
+
+    while True:
+        command, is_full_fit, description = connection.recv()
+        if command == 'stop':
+            model.save(model_path, keep_versions)
+            connection.send(('ok', None))
+            break
+
+        try:
+            arrays = _take_arrays(description)
+            if command == 'compact_users':
+                model.compact_users(arrays['users'])
+                model.save(model_path, keep_versions)
+                connection.send(('ok', None))
+                continue
+
+            interactions = csr_from_arrays(arrays, 'interactions_')
+
+            if is_full_fit:
+                model.fit(interactions, interactions)
+                model.save(model_path, keep_versions)
+                connection.send(('ok', None))
+            else:
+                model.partial_fit(arrays['users'], interactions)
+                model.save(model_path, keep_versions, users_only=True)
+                connection.send(('ok', None))
+        except Exception as e:
+            logger.exception('Fit failed')
+            _unlink_arrays(description)
+            if command == 'compact_users':
+                model = model_type.load(model_path)
+            connection.send(('error', repr(e)))
+
+
+class TrainingWorker():
+    """Long-lived process that keeps a warm copy of the model and fits it on request.
+
+    Interactions are sent to the worker through shared memory. After every fit and user compaction
+    the worker saves a new model version and the parent memory-maps it, so a restarted worker and a
+    restarted process start from the model that is served. Partial fits write the user factors only.
+    """
+
+    def __init__(self, model_type, model_path, keep_versions = 2) -> None:
+        self.__logger = logging.getLogger('training_worker')
+        self._model_type = model_type
+        self._model_path = model_path
+        self._keep_versions = keep_versions
+        self._lock = threading.Lock()
+        self._process = None
+        self._connection = None
+
+    def start(self):
+        parent_connection, child_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_run, args=(child_connection, self._model_type, self._model_path, self._keep_versions), daemon=True)
+        self._process.start()
+        self._connection = parent_connection
+        self.__logger.info('Training worker started')
+
+    def stop(self):
+        with self._lock:
+            if self._process is None:
+                return
+            if self._process.is_alive():
+                self._connection.send(('stop', None, None))
+                self._connection.recv()
+                self._process.join()
+            self._process = None
+            self.__logger.info('Training worker stopped')
+
+    def fit(self, model, is_full_fit, interactions, users):
+        """Fits the worker's model and returns its memory-mapped new version, model itself when there are no users to fit.
+
+        The version is on disk when this returns, so the fitted users can be drained from the refit queue.
+        """
+        if is_full_fit:
+            arrays = csr_to_arrays(interactions, 'interactions_')
+        else:
+            users = np.array(sorted(users), dtype=np.int64)
+            if len(users) == 0:
+                return model
+            arrays = {'users': users, **csr_to_arrays(interactions[users, :], 'interactions_')}
+
+        self._send('fit', is_full_fit, arrays)
+        with metrics.stage_seconds.time(stage='model_load'):
+            return self._model_type.load(self._model_path)
+
+    def compact_users(self, users):
+        """Compacts the user factors of the worker's model, see DataManager.evict_inactive_users, and returns the memory-mapped new version."""
+        self._send('compact_users', False, {'users': np.asarray(users, dtype=np.int64)})
+        with metrics.stage_seconds.time(stage='model_load'):
+            return self._model_type.load(self._model_path)
+
+    def _send(self, command, is_full_fit, arrays):
+        with self._lock:
+            if self._process is None or not self._process.is_alive():
+                self.start()
+            shared = _share_arrays(arrays)
+            try:
+                self._connection.send((command, is_full_fit, shared))
+                status, description = self._connection.recv()
+            except (EOFError, OSError) as e:
+                _unlink_arrays(shared)
+                self.__logger.exception('Training worker died')
+                raise RuntimeError('Training worker died: ' + repr(e))
+        if status != 'ok':
+            raise RuntimeError('Training worker failed: ' + description)
+        return status, description
@@ -1,5 +1,17 @@
+import multiprocessing
+
 import modelapi.api
+import modelapi.leader
 import uvicorn
+from modelapi.config import config
 
 if __name__ == "__main__":
-    uvicorn.run(modelapi.api.app, host="0.0.0.0", port=80, log_level="info")
\ No newline at end of file
+    workers = int(config["serving"]["workers"])
+    if workers > 1:
+        leader = multiprocessing.Process(target=modelapi.leader.run)
+        leader.start()
+        uvicorn.run("modelapi.api:app", host="0.0.0.0", port=80, log_level="info", workers=workers)
+        leader.terminate()
+        leader.join()
+    else:
+        uvicorn.run(modelapi.api.app, host="0.0.0.0", port=80, log_level="info")
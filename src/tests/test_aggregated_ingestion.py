@@ -0,0 +1,80 @@
+import contextlib
+
+import numpy as np
+import pytest
+
+chdb_session = pytest.importorskip('chdb.session')
+
+EDGE_ROWS = [
+    ['page_view', 'https://www.hse.ru/edu/dpo/1%23program', 'a|edge|b', 1669370000],
+    ['click', 'https://www.hse.ru/edu/dpo/1/#teachers?x=#y', 'a|edge|b', 1669373700],
+    ['submit_form', 'https://www.hse.ru/edu/dpo/1:~:text=price', 'a|edge|b', 1669373800],
+    ['fingerprint', 'https://www.hse.ru/edu/dpo/2/', 'a|edge|b', 1669373900],
+    ['page_view', 'https://www.hse.ru/edu/dpo/x#', 'a|edge|b', 1669374000],
+    ['page_view', 'https://www.hse.ru/about#a#b', 'a|edge|b', 1669374100],
+    ['page_view', 'https://www.hse.ru/edu/dpo/3', 'no_separator', 1669374200],
+    ['page_view', None, 'a|edge|b', 1669374300],
+    [None, 'https://www.hse.ru/edu/dpo/3', 'a|edge|b', 1669374400],
+    ['page_view', 'https://www.hse.ru/edu/dpo/3', None, 1669374500],
+]
+
+
+class LocalClickhouse():
+    """Stand-in for the clickhouse_connect client backed by an embedded ClickHouse."""
+
+    def __init__(self, rows) -> None:
+        self._session = chdb_session.Session()
+        self._session.query('''
+            CREATE TABLE raw_interactions (
+                event_name Nullable(String), current_location Nullable(String), user_id Nullable(String), event_timestamp DateTime
+            ) ENGINE = Memory
+        ''')
+        values = ', '.join(
+            '(' + ', '.join('NULL' if value is None else repr(value) for value in row) + ')'
+            for row in rows
+        )
+        self._session.query('INSERT INTO raw_interactions VALUES ' + values)
+
+    def query_np_stream(self, query):
+        return contextlib.nullcontext([self._session.query(query, 'DataFrame').to_numpy(dtype=object)])
+
+
+def interaction_state(data_manager):
+    store = data_manager._interactions
+    users = [data_manager._users_id_converter.get_backward(user) for user in store.column('users')]
+    courses = [data_manager._courses_id_converter.get_backward(course) for course in store.column('courses')]
+    columns = ['coefficient', 'events_num', 'anchors_num', 'has_submit_form_event', 'last_timestamp']
+    return {
+        (user, course): [store.column(name)[row] for name in columns]
+        for row, (user, course) in enumerate(zip(users, courses))
+    }
+
+
+def popularity_state(data_manager):
+    index = data_manager._popularity_index
+    return {
+        data_manager._courses_id_converter.get_backward(course): n
+        for course, n in zip(index.top(len(index._counts)), index.get_counts(index.top(len(index._counts))))
+    }
+
+
+def test_aggregated_mode_matches_raw_mode(make_data_manager, recorded_blocks):
+    client = LocalClickhouse([row for block in recorded_blocks for row in block] + EDGE_ROWS)
+    data_managers = list()
+    for mode in ['raw', 'aggregated']:
+        data_manager = make_data_manager()
+        data_manager._client = client
+        data_manager._ingestion_mode = mode
+        data_manager.load_updates()
+        data_managers.append(data_manager)
+    raw, aggregated = data_managers
+
+    assert len(raw._interactions) == len(aggregated._interactions) > 0
+    assert interaction_state(aggregated) == interaction_state(raw)
+    assert popularity_state(aggregated) == popularity_state(raw)
+    assert {raw._users_id_converter.get_backward(user) for user in raw.get_changed_users()} == \
+        {aggregated._users_id_converter.get_backward(user) for user in aggregated.get_changed_users()}
+    for data_manager in data_managers:
+        matrix = data_manager.get_interaction_csr_matrix()
+        store = data_manager._interactions
+        assert matrix[store.column('users'), store.column('courses')].tolist() == [store.column('coefficient').astype(np.float32).tolist()]
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from modelapi.api import app, courseid_to_link
+from modelapi.hybrid_models.linear import LinearHybrid
+from modelapi.processor import Processor
+from modelapi.shared_snapshot import SnapshotPublisher, SnapshotReader
+from modelapi.similar_items import SimilarItemsTable
+from tests.test_cold_start import make_raw_block
+
+
+@pytest.fixture
+def make_client(make_data_manager, fake_client, tmp_path, monkeypatch):
+    def make(with_content_model=True):
+        rng = np.random.default_rng(0)
+        data_manager = make_data_manager()
+        data_manager._client = fake_client([make_raw_block(rng, 400, 80, 12)])
+        data_manager.load_updates()
+
+        interactions = data_manager.get_interaction_csr_matrix()
+        model = LinearHybrid.load(None)
+        model.model_collaborative.iterations = 3
+        model.fit(interactions, interactions, show_progress=False)
+        snapshot = data_manager.make_snapshot(model)._replace(adv_courses=list(range(interactions.shape[1]))[-4:])
+        if with_content_model:
+            similarity = model.model_content.similarity
+            snapshot = snapshot._replace(
+                  content_model=model.model_content
+                , adv_similar_items=SimilarItemsTable(similarity, snapshot.adv_courses)
+                , bottom_similar_items=SimilarItemsTable(similarity, snapshot.popularity_index.bottom(10))
+            )
+
+        SnapshotPublisher(str(tmp_path), keep_versions=2).publish(snapshot, data_manager.get_last_timestamps(snapshot.interactions))
+        processor = Processor(snapshot_reader=SnapshotReader(str(tmp_path), LinearHybrid, refresh_seconds=0))
+        monkeypatch.setattr(app, 'processor', processor, raising=False)
+        return TestClient(app), processor
+    return make
+
+
+def test_batch_maps_unknown_users_to_null_and_returns_links(make_client):
+    client, processor = make_client()
+    userids = processor.get_snapshot().users_id_converter.backward_many([0, 1, 2]).tolist()
+
+    response = client.post('/recomendation/batch', json={'userids': [userids[0], 'unknown', *userids[1:]], 'fields_num': 5})
+    assert response.status_code == 200
+    recommendations = response.json()
+    assert recommendations['unknown'] is None
+    assert [recommendations[userid] for userid in userids] == [processor.recommend(userid, 5) for userid in userids]
+
+    response = client.post('/recomendation/batch', json={'userids': userids[:1] + ['unknown'], 'fields_num': 5, 'as_link': True})
+    assert response.json() == {userids[0]: [courseid_to_link(courseid) for courseid in recommendations[userids[0]]], 'unknown': None}
+
+
+@pytest.mark.parametrize('with_content_model', [True, False])
+def test_batch_mixes_adv_and_bottom_courses_like_recommend(make_client, with_content_model):
+    client, processor = make_client(with_content_model)
+    userids = processor.get_snapshot().users_id_converter.backward_many(list(range(10))).tolist()
+    request = {'userids': userids, 'fields_num': 6, 'adv_perc': 0.3, 'bottom_perc': 0.3}
+
+    recommendations = client.post('/recomendation/batch', json=request).json()
+    for userid in userids:
+        expected = processor.recommend(userid, 6, 0.3, 0.3)
+        assert len(recommendations[userid]) == len(expected)
+        assert sorted(recommendations[userid]) == sorted(expected)
+    if not with_content_model:
+        assert [recommendations[userid] for userid in userids] == processor.recommend_batch(userids, 6)
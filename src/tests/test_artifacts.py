@@ -0,0 +1,76 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from implicit.nearest_neighbours import CosineRecommender
+
+from modelapi import artifacts
+from modelapi.content_models.cosine import CosineContent
+from modelapi.hybrid_models.linear import LinearHybrid
+
+
+def test_version_round_trip_is_memory_mapped(tmp_path):
+    directory = str(tmp_path / 'model')
+    factors = np.arange(12, dtype=np.float32).reshape(4, 3)
+    version = artifacts.write_version(directory, {'factors': factors}, {'rows': 4})
+
+    assert artifacts.get_current_version(directory) == version
+    arrays, metadata = artifacts.read_version(directory, version)
+    assert isinstance(arrays['factors'], np.memmap)
+    assert np.array_equal(arrays['factors'], factors)
+    assert metadata == {'rows': 4}
+
+    arrays['factors'][0] = -1
+    assert np.array_equal(artifacts.read_version(directory, version)[0]['factors'], factors)
+
+
+def test_reclaim_keeps_newest_versions(tmp_path):
+    directory = str(tmp_path / 'model')
+    versions = []
+    for i in range(4):
+        versions.append(artifacts.write_version(directory, {'value': np.array([i])}))
+        time.sleep(0.001)
+
+    arrays, _ = artifacts.read_version(directory, versions[1])
+    artifacts.reclaim_versions(directory, 2)
+
+    assert sorted(name for name in os.listdir(directory) if name.isdigit()) == versions[2:]
+    assert artifacts.get_current_version(directory) == versions[-1]
+    assert arrays['value'][0] == 1
+
+
+def test_hybrid_model_save_and_load(tmp_path):
+    path = str(tmp_path) + '/'
+    assert LinearHybrid.load(path).model_collaborative.user_factors is None
+
+    rng = np.random.default_rng(0)
+    interactions = sp.random(30, 10, density=0.3, format='csr', dtype=np.float32, random_state=rng)
+    model = LinearHybrid.load(None)
+    model.model_collaborative.iterations = 3
+    model.fit(interactions, interactions, show_progress=False)
+    model.save(path)
+
+    loaded = LinearHybrid.load(path)
+    assert isinstance(loaded.model_collaborative.user_factors, np.memmap)
+    assert np.array_equal(loaded.model_collaborative.item_factors, model.model_collaborative.item_factors)
+    assert (loaded.model_content.similarity != model.model_content.similarity).nnz == 0
+
+    users = np.arange(5)
+    assert np.array_equal(
+          loaded.recommend(users, interactions[users], N=5)[0]
+        , model.recommend(users, interactions[users], N=5)[0]
+    )
+
+
+def test_legacy_cosine_model_is_loaded_without_a_version(tmp_path):
+    similarity = sp.random(10, 10, density=0.3, format='csr', dtype=np.float32, random_state=np.random.default_rng(0))
+    legacy = CosineRecommender(K=131)
+    legacy.__setstate__(dict(legacy.__getstate__(), similarity=similarity))
+    path = str(tmp_path / 'cosine')
+    with open(path + '.npz', 'wb') as f:
+        legacy.save(f)
+
+    model = asyncio.run(CosineContent.load(None, path, str(tmp_path / 'courses_features')))
+    assert (model.similarity != similarity).nnz == 0
@@ -0,0 +1,56 @@
+import contextlib
+import os
+
+import numpy as np
+
+from modelapi.data_manager import DataManager
+
+def load_blocks(data_manager, blocks, read_time):
+    def get_raw_updates_stream():
+        data_manager._last_read_time = read_time
+        return contextlib.nullcontext([np.array(block, dtype=object) for block in blocks])
+
+    data_manager._get_raw_updates_stream = get_raw_updates_stream
+    data_manager.load_updates()
+
+
+def assert_same_state(data_manager, expected, all_ids):
+    assert data_manager._last_read_time == expected._last_read_time
+    assert data_manager.get_changed_users() == expected.get_changed_users()
+    for name, array in data_manager._popularity_index.get_state().items():
+        assert array.tolist() == expected._popularity_index.get_state()[name].tolist()
+    assert all_ids(data_manager._users_id_converter) == all_ids(expected._users_id_converter)
+    assert all_ids(data_manager._courses_id_converter) == all_ids(expected._courses_id_converter)
+    assert all_ids(data_manager._interactions._anchors_id_converter) == all_ids(expected._interactions._anchors_id_converter)
+    for name in data_manager._interactions._columns:
+        assert data_manager._interactions.column(name).tolist() == expected._interactions.column(name).tolist()
+    assert (data_manager.get_interaction_csr_matrix() != expected.get_interaction_csr_matrix()).nnz == 0
+    assert data_manager.get_interaction_csr_matrix().shape == expected.get_interaction_csr_matrix().shape
+
+
+def test_checkpoint_restores_state_and_ingests_tail(make_data_manager, recorded_blocks, all_ids):
+    [first_block, second_block] = recorded_blocks
+    data_manager = make_data_manager()
+    data_manager._courses_id_converter.add(np.int32(12345))
+    load_blocks(data_manager, [first_block], read_time=100)
+
+    DataManager.save_checkpoint(data_manager.get_checkpoint_state(), data_manager._checkpoint_path)
+    assert not os.path.exists(data_manager._checkpoint_path + '.tmp')
+
+    restored = make_data_manager()
+    assert_same_state(restored, data_manager, all_ids)
+    assert restored._courses_id_converter.get_forward(12345) == data_manager._courses_id_converter.get_forward(np.int32(12345))
+
+    load_blocks(data_manager, [second_block], read_time=200)
+    load_blocks(restored, [second_block], read_time=200)
+    assert_same_state(restored, data_manager, all_ids)
+
+
+def test_checkpoint_without_refit_queue_restores_changed_users(make_data_manager, recorded_blocks):
+    data_manager = make_data_manager()
+    load_blocks(data_manager, recorded_blocks[:1], read_time=100)
+    state = {name: array for name, array in data_manager.get_checkpoint_state().items() if not name.startswith('refit_')}
+    state['changed_users'] = np.array(sorted(data_manager.get_changed_users()), dtype=np.int64)
+    DataManager.save_checkpoint(state, data_manager._checkpoint_path)
+
+    assert make_data_manager().get_changed_users() == data_manager.get_changed_users()
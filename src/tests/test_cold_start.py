@@ -0,0 +1,125 @@
+import numpy as np
+import scipy.sparse as sp
+
+from modelapi.cold_start import FoldInCache, recommend_fallback
+from modelapi.hybrid_models.linear import LinearHybrid
+from modelapi.processor import Processor
+from modelapi.shared_snapshot import SnapshotPublisher, SnapshotReader
+from modelapi.similar_items import SimilarItemsTable
+
+
+def make_raw_block(rng, size, users_num, courses_num):
+    return [
+        [
+              str(rng.choice(['page_view', 'click', 'submit_form']))
+            , 'https://www.hse.ru/edu/dpo/%d' % rng.integers(courses_num)
+            , 'a|%d|b' % rng.integers(users_num)
+            , int(timestamp)
+        ]
+        for timestamp in rng.permutation(size) + 1669366907
+    ]
+
+
+def test_fold_in_cache_is_invalidated_by_user_and_model():
+    cache = FoldInCache(size=2)
+    cache.put_many([1, 2], [np.ones(3), np.zeros(3)])
+    assert [factors is None for factors in cache.get_many([1, 2, 3])] == [False, False, True]
+
+    cache.put_many([3], [np.ones(3)])
+    assert [factors is None for factors in cache.get_many([1, 2, 3])] == [True, False, False]
+
+    cache.invalidate_users([2])
+    assert [factors is None for factors in cache.get_many([2, 3])] == [True, False]
+    cache.invalidate_model()
+    assert cache.get_many([3]) == [None]
+    assert cache.get_stats() == {"size": 0, "max_size": 2, "hits": 5, "misses": 4}
+
+
+def test_fold_in_cache_skips_puts_solved_before_an_invalidation():
+    cache = FoldInCache(size=2)
+    version = cache.get_version()
+    cache.invalidate_model()
+    cache.put_many([1], [np.ones(3)], version)
+    assert cache.get_many([1]) == [None]
+    cache.put_many([1], [np.ones(3)], cache.get_version())
+    assert cache.get_many([1])[0] is not None
+
+
+def test_fallback_takes_similar_courses_in_turn_then_popular():
+    similarity = sp.csr_matrix(np.array([
+          [1, 0.9, 0.5, 0, 0, 0]
+        , [0.9, 1, 0, 0, 0, 0]
+        , [0, 0, 1, 0, 0, 0]
+        , [0, 0, 0.2, 1, 0.8, 0]
+        , [0, 0, 0, 0, 1, 0]
+        , [0, 0, 0, 0, 0, 1]
+    ]))
+    popular = np.array([5, 4, 3, 2, 1, 0])
+    table = SimilarItemsTable(similarity, popular)
+    user_items = sp.csr_matrix(([1, 1, 1], ([0, 0, 2], [0, 3, 5])), shape=(3, 6))
+
+    recommendations = recommend_fallback(table, popular, user_items, 3)
+    assert [recommendation.tolist() for recommendation in recommendations] == [[1, 4, 2], [5, 4, 3], [4, 3, 2]]
+    assert recommend_fallback(None, popular[:2], user_items, 3)[0].tolist() == [5, 4]
+
+
+def test_processor_folds_in_changed_users_and_falls_back_for_cold_users(make_data_manager, fake_client, tmp_path):
+    rng = np.random.default_rng(0)
+    data_manager = make_data_manager()
+    data_manager._client = fake_client([make_raw_block(rng, 400, 80, 12)])
+    data_manager.load_updates()
+
+    interactions = data_manager.get_interaction_csr_matrix()
+    model = LinearHybrid.load(None)
+    model.model_collaborative.iterations = 3
+    model.fit(interactions, interactions, show_progress=False)
+    snapshot = data_manager.make_snapshot(model)
+
+    SnapshotPublisher(str(tmp_path), keep_versions=2).publish(snapshot, data_manager.get_last_timestamps(snapshot.interactions))
+    processor = Processor(snapshot_reader=SnapshotReader(str(tmp_path), LinearHybrid, refresh_seconds=0))
+    processor._cold_start_interactions = 4
+    shared = processor.get_snapshot()
+    interactions_num = np.diff(shared.interactions.indptr)
+    warm = [user for user in sorted(shared.changed_users) if interactions_num[user] >= 4][:5]
+    cold = np.flatnonzero(interactions_num < 4)[:3].tolist()
+    assert warm and cold
+
+    userids = shared.users_id_converter.backward_many(warm + cold).tolist()
+    recommendations = processor.recommend_batch(userids, N=5)
+    expected = model.recommend(warm, interactions[warm, :], N=5, recalculate_user=True)[0]
+    assert recommendations[:len(warm)] == [shared.courses_id_converter.backward_many(recommendation[recommendation >= 0]).tolist() for recommendation in expected]
+    for userid, recommendation in zip(warm + cold, recommendations):
+        assert len(recommendation) == 5
+        assert not set(recommendation) & set(data_manager.get_recently_viewed(shared.users_id_converter.get_backward(userid), 10))
+
+    processor._recommendation_cache.invalidate_model()
+    assert processor.recommend_batch(userids[:len(warm)], N=5) == recommendations[:len(warm)]
+    assert processor.get_fold_in_cache_stats()["hits"] == len(warm)
+    stats = processor.get_latency_stats()
+    assert stats["fold_in"]["users"] == 2 * len(warm)
+    assert stats["fallback"]["users"] == len(cold)
+
+
+def test_processor_folds_in_users_added_after_the_fit(make_data_manager, fake_client, tmp_path):
+    rng = np.random.default_rng(1)
+    data_manager = make_data_manager()
+    data_manager._client = fake_client([make_raw_block(rng, 400, 80, 12)])
+    data_manager.load_updates()
+
+    interactions = data_manager.get_interaction_csr_matrix()
+    fitted_num = interactions.shape[0] - 10
+    model = LinearHybrid.load(None)
+    model.model_collaborative.iterations = 3
+    model.fit(interactions[:fitted_num], interactions[:fitted_num], show_progress=False)
+    snapshot = data_manager.make_snapshot(model)._replace(changed_users=frozenset())
+
+    SnapshotPublisher(str(tmp_path), keep_versions=2).publish(snapshot, data_manager.get_last_timestamps(snapshot.interactions))
+    processor = Processor(snapshot_reader=SnapshotReader(str(tmp_path), LinearHybrid, refresh_seconds=0))
+    processor._cold_start_interactions = 1
+    shared = processor.get_snapshot()
+    added = list(range(fitted_num, interactions.shape[0]))
+
+    recommendations = processor.recommend_batch(shared.users_id_converter.backward_many(added).tolist(), N=5)
+    expected = model.recommend(added, interactions[added, :], N=5, recalculate_user=True)[0]
+    assert recommendations == [shared.courses_id_converter.backward_many(recommendation[recommendation >= 0]).tolist() for recommendation in expected]
+    assert processor.get_latency_stats()["fold_in"]["users"] == len(added)
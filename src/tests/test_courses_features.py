@@ -0,0 +1,62 @@
+import asyncio
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from implicit.nearest_neighbours import CosineRecommender
+
+from modelapi.content_models.cosine import CosineContent
+
+
+def write_features(path, ids, embeddings):
+    lines = ['index^course_id' + ''.join('^e%d' % i for i in range(embeddings.shape[1]))]
+    for index, (courseid, embedding) in enumerate(zip(ids, embeddings)):
+        lines.append('^'.join([str(index), str(courseid)] + [repr(float(value)) for value in embedding]))
+    path.write_text('\n'.join(lines) + '\n')
+
+
+@pytest.fixture
+def features(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    ids = rng.permutation(np.arange(100, 125))
+    embeddings = rng.random((25, 6)).astype(np.float32)
+    path = tmp_path / 'courses_features.csv'
+    write_features(path, ids, embeddings)
+    monkeypatch.setattr(CosineContent, 'features_path', str(path))
+    monkeypatch.setattr(CosineContent, '_chunk_rows', 7)
+    return path, ids, embeddings
+
+
+def test_features_are_converted_once(features, make_data_manager, tmp_path, monkeypatch):
+    path, ids, embeddings = features
+    cache_path = str(tmp_path / 'cache')
+    data_manager = make_data_manager()
+    first_id = data_manager._courses_id_converter.get_count()
+    version = CosineContent.load_courses_features(data_manager, cache_path)
+
+    parse_features = CosineContent._parse_features
+    def fail(path):
+        raise AssertionError('features were parsed again')
+    monkeypatch.setattr(CosineContent, '_parse_features', fail)
+    assert CosineContent.load_courses_features(data_manager, cache_path) == version
+    assert [data_manager._courses_id_converter.get_backward(first_id + i) for i in range(len(ids))] == ids.tolist()
+
+    monkeypatch.setattr(CosineContent, '_parse_features', parse_features)
+    write_features(path, ids[::-1], embeddings[::-1])
+    assert CosineContent.load_courses_features(make_data_manager(), cache_path) != version
+
+
+def test_parse_features_by_chunks(features):
+    path, ids, embeddings = features
+    parsed_ids, parsed_embeddings = CosineContent._parse_features(str(path))
+    assert np.array_equal(parsed_ids, ids)
+    assert np.array_equal(parsed_embeddings, embeddings)
+
+
+def test_load_trains_from_cached_features(features, make_data_manager, tmp_path):
+    path, ids, embeddings = features
+    model = asyncio.run(CosineContent.load(make_data_manager(), str(tmp_path / 'cosine'), str(tmp_path / 'cache')))
+
+    expected = CosineRecommender(K=131)
+    expected.fit(sp.csr_matrix(embeddings), show_progress=False)
+    assert np.allclose(model.similarity.toarray(), expected.similarity.toarray())
@@ -0,0 +1,94 @@
+import numpy as np
+import scipy.sparse as sp
+
+from modelapi.helpers import IdConverter, IdConverterView, update_csr_matrix
+
+
+def test_update_csr_matrix_matches_dense_updates():
+    rng = np.random.default_rng(0)
+    matrix = sp.csr_matrix((0, 0), dtype=np.float32)
+    expected = np.zeros((0, 0), dtype=np.float32)
+
+    for shape in [(3, 2), (3, 2), (10, 5), (40, 7), (40, 7), (100, 12)]:
+        expected = np.pad(expected, [(0, shape[0] - expected.shape[0]), (0, shape[1] - expected.shape[1])])
+        cells = np.unique(rng.integers(0, shape, size=(15, 2)), axis=0)
+        values = rng.random(len(cells)).astype(np.float32) + 0.1
+        expected[cells[:, 0], cells[:, 1]] = values
+
+        matrix = update_csr_matrix(matrix, cells[:, 0], cells[:, 1], values, shape)
+
+        assert matrix.shape == shape
+        assert matrix.has_sorted_indices
+        np.testing.assert_array_equal(matrix.toarray(), expected)
+
+
+def test_update_csr_matrix_without_updates_only_grows():
+    matrix = sp.csr_matrix(np.eye(2, dtype=np.float32))
+
+    matrix = update_csr_matrix(matrix, [], [], [], (4, 3))
+
+    assert matrix.shape == (4, 3)
+    assert matrix.nnz == 2
+
+
+def test_update_csr_matrix_keeps_the_old_matrix():
+    matrix = sp.csr_matrix(np.eye(2, dtype=np.float32))
+
+    updated = update_csr_matrix(matrix, [0, 1], [0, 0], [5, 6], (3, 2))
+
+    np.testing.assert_array_equal(matrix.toarray(), np.eye(2))
+    np.testing.assert_array_equal(updated.toarray(), [[5, 0], [6, 1], [0, 0]])
+
+
+def test_id_converter_bulk_methods_match_single_adds():
+    column = np.array(['a', 'bb', None, 'a', 5, '5', np.nan, 'long_user_id|1'], dtype=object)
+    converter = IdConverter()
+    single = [converter.add(None if id is not None and id != id else id) for id in column]
+
+    bulk = IdConverter()
+    assert bulk.add_many(column).tolist() == single
+    assert bulk.add_many(np.array([7, 5, 7])).tolist() == [6, 3, 6]
+    assert bulk.forward_many(['a', 'unknown', 5, '5', None]).tolist() == [0, -1, 3, 4, 2]
+    assert bulk.backward_many([0, 3, 4, 2, 6, -1, 7]).tolist() == ['a', 5, '5', None, 7, None, None]
+    assert [bulk.get_forward(id) for id in ['bb', 5, np.int32(7), 'unknown']] == [1, 3, 6, None]
+
+
+def test_id_converter_backward_bounds():
+    converter = IdConverter()
+    converter.add_many(['a', 'b'])
+
+    assert converter.get_backward(1) == 'b'
+    assert converter.get_backward(2) is None
+    assert converter.get_backward(-1) is None
+    assert IdConverter().get_backward(0) is None
+
+
+def test_id_converter_arrays_round_trip_without_copies():
+    converter = IdConverter()
+    converter.add_many(['a', 12, None, 'c'])
+    ids, kinds = converter.to_arrays()
+    restored = IdConverter.from_arrays(ids, kinds, *converter.get_index())
+
+    assert np.shares_memory(restored.to_arrays()[0], ids)
+    assert restored.backward_many(np.arange(4)).tolist() == ['a', 12, None, 'c']
+    assert IdConverter.from_arrays(ids, kinds).forward_many(['c', 12]).tolist() == [3, 1]
+    assert restored.add('d') == 4 and converter.get_count() == 4
+
+
+def test_id_converter_view_ignores_later_ids():
+    converter = IdConverter()
+    converter.add_many(['a', 'b'])
+    view = IdConverterView(converter, 2)
+    converter.add_many(['c' * 40, 'd'])
+
+    assert view.forward_many(['a', 'c' * 40]).tolist() == [0, -1]
+    assert view.backward_many([1, 2]).tolist() == ['b', None]
+    assert view.get_index()[1].tolist() == [0, 1]
+
+
+def test_update_csr_matrix_overwrites_cells_after_inserted_ones():
+    matrix = sp.csr_matrix(np.array([[0, 2, 0, 3], [4, 0, 0, 0]], dtype=np.float32))
+
+    updated = update_csr_matrix(matrix, [0, 0, 0, 1], [0, 1, 3, 0], [7, 8, 9, 5], (2, 4))
+
+    np.testing.assert_array_equal(updated.toarray(), [[7, 8, 0, 9], [5, 0, 0, 0]])
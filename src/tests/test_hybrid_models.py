@@ -0,0 +1,85 @@
+import operator
+from itertools import chain, zip_longest
+
+import numpy as np
+
+from modelapi.hybrid_models.linear import LinearHybrid
+from modelapi.hybrid_models.nfirst import NfirstHybrid
+
+
+def legacy_linear_fusion(a, collab_recs, collab_scores, content_recs, content_scores, N):
+    def get_new_dict(collab_dict, content_dict):
+        return {k: collab_dict.get(k, 0)*a + (1-a)*content_dict.get(k, 0) for k in set(collab_dict) | set(content_dict)}
+
+    recs, scores = list(), list()
+    for i in range(len(collab_recs)):
+        courses_dict = get_new_dict(dict(zip(collab_recs[i], collab_scores[i])), dict(zip(content_recs[i], content_scores[i])))
+        courses_dict = dict(sorted(courses_dict.items(), key=operator.itemgetter(1), reverse=True)[:N])
+        recs.append(list(courses_dict.keys()))
+        scores.append(list(courses_dict.values()))
+    return np.array(recs), np.array(scores)
+
+
+def legacy_nfirst_merge(collab_recs, collab_scores, content_recs, content_scores, content_num):
+    def get_unique_recs(recs_main, recs_score, recs_2, number_of_recs):
+        return [[item, recs_score[i]] for i, item in enumerate(recs_main) if item not in recs_2][:number_of_recs]
+
+    def merge_two_recs(collab, content):
+        return [*filter(lambda x: x != None, chain.from_iterable(zip_longest(collab, content)))]
+
+    content = [get_unique_recs(content_recs[i], content_scores[i], collab_recs[i], content_num) for i in range(len(content_recs))]
+    recs = [merge_two_recs(collab_recs[i], [item[0] for item in content[i]]) for i in range(len(content))]
+    scores = [merge_two_recs(collab_scores[i], [item[1] for item in content[i]]) for i in range(len(content))]
+    return recs, scores
+
+
+def make_candidates(rng, users_num, items_num, candidates_num):
+    recs = np.array([rng.choice(items_num, candidates_num, replace=False) for _ in range(users_num)], dtype=np.int32)
+    return recs, rng.normal(size=recs.shape)
+
+
+def test_linear_fusion_matches_legacy_dict_merge():
+    rng = np.random.default_rng(0)
+    collab_recs, collab_scores = make_candidates(rng, 50, 300, 40)
+    content_recs, content_scores = make_candidates(rng, 50, 300, 40)
+
+    expected_recs, expected_scores = legacy_linear_fusion(0.65, collab_recs, collab_scores, content_recs, content_scores, 10)
+    recs, scores = LinearHybrid.fuse_scores(0.65, collab_recs, collab_scores, content_recs, content_scores, 10)
+
+    np.testing.assert_array_equal(recs, expected_recs)
+    np.testing.assert_allclose(scores, expected_scores)
+
+
+def test_linear_fusion_pads_users_with_few_candidates():
+    collab_recs = np.array([[3, -1, -1], [0, 1, 2]], dtype=np.int32)
+    content_recs = np.array([[3, 4, -1], [2, -1, -1]], dtype=np.int32)
+    scores = np.array([[1.0, 0, 0], [0.5, 0.4, 0.3]])
+
+    recs, _ = LinearHybrid.fuse_scores(0.5, collab_recs, scores, content_recs, scores, 3)
+
+    assert recs.tolist() == [[3, 4, -1], [2, 0, 1]]
+
+
+def test_nfirst_merge_matches_legacy_interleave():
+    rng = np.random.default_rng(1)
+    collab_recs, collab_scores = make_candidates(rng, 200, 20, 3)
+    content_recs, content_scores = make_candidates(rng, 200, 20, 10)
+
+    expected_recs, expected_scores = legacy_nfirst_merge(collab_recs, collab_scores, content_recs, content_scores, 7)
+    recs, scores = NfirstHybrid.merge_recs(collab_recs, collab_scores, content_recs, content_scores, 7)
+
+    for i in range(len(recs)):
+        is_valid = recs[i] >= 0
+        assert recs[i][is_valid].tolist() == expected_recs[i]
+        np.testing.assert_allclose(scores[i][is_valid], expected_scores[i])
+        assert (recs[i][len(expected_recs[i]):] == -1).all()
+
+
+def test_nfirst_merge_with_short_content_list():
+    recs, _ = NfirstHybrid.merge_recs(
+          np.array([[1, 2, 3]]), np.ones((1, 3))
+        , np.array([[2, 5, -1]]), np.ones((1, 3))
+        , 3
+    )
+
+    assert recs.tolist() == [[1, 5, 2, 3, -1, -1]]
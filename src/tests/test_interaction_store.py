@@ -0,0 +1,101 @@
+import numpy as np
+
+from modelapi.data_manager import browser_events
+
+EVENTS = ['page_view', 'click', 'submit_form', 'form_submit', 'scroll'] + browser_events
+ANCHORS = [None, None, 'program', 'teachers', 'price', 'faq']
+
+
+def legacy_coefficients(blocks):
+    interaction_info = dict()
+    changed_users = set()
+    for block in blocks:
+        for [event, courseid, userid, anchor, _] in block:
+            info = interaction_info.get((userid, courseid), {'events_num': 0, 'anchors': set(), 'has_submit_form_event': False, 'coefficient': 0})
+            info['events_num'] += 1 if event not in browser_events else 0
+            if anchor is not None:
+                info['anchors'].add(anchor)
+            if 'submit_form' == event or 'form_submit' == event:
+                info['has_submit_form_event'] = True
+
+            coefficient = 0.08 + int(info['has_submit_form_event'])
+            coefficient += min(0.2, np.log(info['events_num'] + 1) * 0.4 / np.log(100000))
+            coefficient += min(0.4, np.log(len(info['anchors']) + 1) / np.log(1000))
+
+            if info['coefficient'] != coefficient:
+                info['coefficient'] = coefficient
+                changed_users.add(userid)
+                interaction_info[(userid, courseid)] = info
+    return {key: info['coefficient'] for key, info in interaction_info.items()}, changed_users
+
+
+def make_blocks(rng, blocks_num, block_size, users_num, courses_num):
+    blocks = list()
+    for _ in range(blocks_num):
+        block = np.empty((block_size, 5), dtype=object)
+        block[:, 0] = rng.choice(np.array(EVENTS, dtype=object), block_size)
+        block[:, 1] = rng.integers(0, courses_num, block_size)
+        block[:, 2] = rng.integers(0, users_num, block_size)
+        block[:, 3] = rng.choice(np.array(ANCHORS, dtype=object), block_size)
+        block[:, 4] = rng.integers(0, 1000, block_size)
+        blocks.append(block)
+    return blocks
+
+
+def test_store_coefficients_match_legacy_per_event_calculation(make_data_manager):
+    rng = np.random.default_rng(0)
+    blocks = make_blocks(rng, blocks_num=6, block_size=400, users_num=30, courses_num=8)
+    expected_coefficients, expected_changed_users = legacy_coefficients(blocks)
+
+    data_manager = make_data_manager()
+    for userid in range(30):
+        data_manager._users_id_converter.add(str(userid))
+    for courseid in range(8):
+        data_manager._courses_id_converter.add(str(courseid))
+    for block in blocks:
+        data_manager._recalculate_interactions(block)
+    data_manager._apply_interaction_updates()
+
+    store = data_manager._interactions
+    assert len(store) == len(expected_coefficients)
+    for (userid, courseid), coefficient in expected_coefficients.items():
+        [row] = store.find([userid], [courseid])
+        assert store.column('coefficient')[row] == coefficient
+        assert data_manager.get_interaction_csr_matrix()[userid, courseid] == np.float32(coefficient)
+    assert data_manager.get_changed_users() == expected_changed_users
+
+
+def test_store_counts_distinct_anchors_across_blocks(make_data_manager):
+    data_manager = make_data_manager()
+    block = np.array([
+        ['page_view', 0, 0, 'a', 10],
+        ['page_view', 0, 0, 'a', 11],
+        ['page_view', 0, 0, None, 12],
+        ['page_view', 1, 0, 'a', 13],
+    ], dtype=object)
+
+    data_manager._recalculate_interactions(block)
+    data_manager._recalculate_interactions(block[[0, 0]])
+    data_manager._recalculate_interactions(np.array([['click', 0, 0, 'b', 14]], dtype=object))
+
+    store = data_manager._interactions
+    assert store.column('anchors_num')[store.find([0, 0], [0, 1])].tolist() == [2, 1]
+    assert store.column('events_num')[store.find([0, 0], [0, 1])].tolist() == [6, 1]
+
+
+def test_recently_viewed_orders_courses_by_last_event(make_data_manager):
+    data_manager = make_data_manager()
+    block = np.array([
+        ['page_view', 'https://www.hse.ru/edu/dpo/1', 'a|user|b', 10],
+        ['page_view', 'https://www.hse.ru/edu/dpo/2', 'a|user|b', 30],
+        ['page_view', 'https://www.hse.ru/about', 'a|user|b', 40],
+        ['page_view', 'https://www.hse.ru/edu/dpo/3', 'a|user|b', 20],
+        ['page_view', 'https://www.hse.ru/edu/dpo/1', 'a|other|b', 50],
+    ], dtype=object)
+    data_manager._recalculate_interactions(data_manager._tranform_raw_data(block))
+    data_manager._recalculate_interactions(data_manager._tranform_raw_data(np.array([['click', 'https://www.hse.ru/edu/dpo/3', 'a|user|b', 35]], dtype=object)))
+
+    assert data_manager.get_recently_viewed('user', 10) == ['3', '2', '1']
+    assert data_manager.get_recently_viewed('user', 2) == ['3', '2']
+    assert data_manager.get_recently_viewed('other', 10) == ['1']
+    assert data_manager.get_recently_viewed('unknown', 10) is None
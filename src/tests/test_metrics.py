@@ -0,0 +1,69 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from modelapi import metrics
+from modelapi.api import app
+
+class FakeProcessor():
+    def get_top_courses(self, N, window_hours, decayed):
+        return ['1', '2'][:N]
+
+    def get_bottom_courses(self, N, window_hours, decayed):
+        raise RuntimeError('broken snapshot')
+
+
+@pytest.fixture
+def enabled_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, '_enabled', True)
+
+
+def test_registry_renders_counters_and_cumulative_histograms(enabled_metrics):
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter('test_events_total', 'Events', ['kind']))
+    histogram = registry.register(metrics.Histogram('test_seconds', 'Seconds', buckets=(0.1, 1)))
+    counter.inc(kind='a "b"')
+    counter.inc(2, kind='a "b"')
+    for value in [0.05, 0.5, 0.7, 3]:
+        histogram.observe(value)
+
+    assert registry.render().splitlines() == [
+          '# HELP test_events_total Events'
+        , '# TYPE test_events_total counter'
+        , 'test_events_total{kind="a \\"b\\""} 3.0'
+        , '# HELP test_seconds Seconds'
+        , '# TYPE test_seconds histogram'
+        , 'test_seconds_bucket{le="0.1"} 1.0'
+        , 'test_seconds_bucket{le="1.0"} 3.0'
+        , 'test_seconds_bucket{le="+Inf"} 4.0'
+        , 'test_seconds_sum 4.25'
+        , 'test_seconds_count 4.0'
+    ]
+
+
+def test_disabled_metrics_are_not_recorded(monkeypatch):
+    monkeypatch.setattr(metrics, '_enabled', False)
+    histogram = metrics.Histogram('test_seconds', 'Seconds', ['stage'])
+    with histogram.time(stage='fit'):
+        pass
+    histogram.observe(1, stage='fit')
+    assert histogram.collect() == []
+
+
+def test_ingestion_stages_and_requests_are_exposed(enabled_metrics, make_data_manager, fake_client, recorded_blocks, monkeypatch):
+    data_manager = make_data_manager()
+    data_manager._client = fake_client(recorded_blocks)
+    data_manager.load_updates()
+
+    monkeypatch.setattr(app, 'processor', FakeProcessor(), raising=False)
+    client = TestClient(app, raise_server_exceptions=False)
+    assert client.get('/top_courses/', params={'fields_num': 1}).json() == ['1']
+    assert client.get('/bottom_courses/').status_code == 500
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    samples = response.text.splitlines()
+    for stage in ['clickhouse_query', 'transform', 'recalculate_interactions', 'popularity_update', 'csr_build', 'load_updates']:
+        assert any(sample.startswith('modelapi_stage_seconds_count{stage="%s"}' % stage) for sample in samples)
+    assert any(sample.startswith('modelapi_request_seconds_count{method="GET",route="/top_courses/",status="200"}') for sample in samples)
+    assert any(sample.startswith('modelapi_request_seconds_count{method="GET",route="/bottom_courses/",status="500"}') for sample in samples)
@@ -0,0 +1,70 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from modelapi.popularity_index import PopularityIndex
+
+HOUR = 3600
+
+
+def test_top_and_bottom_match_counter():
+    rng = np.random.default_rng(0)
+    index = PopularityIndex()
+    counter = Counter()
+    for _ in range(5):
+        courses = rng.integers(0, 50, 300) ** 2 % 61
+        index.add(courses, np.zeros(len(courses), dtype=np.int64))
+        counter.update(courses.tolist())
+
+        ranking = sorted(counter.items(), key=lambda item: (-item[1], item[0]))
+        assert index.top(10).tolist() == [course for course, _ in ranking[:10]]
+        assert index.bottom(10).tolist() == [course for course, _ in ranking[::-1][:10]]
+        assert index.get_counts(index.top(100)).tolist() == [n for _, n in ranking]
+    assert len(index.top(1000)) == len(counter)
+
+
+def test_empty_block_is_ignored():
+    index = PopularityIndex()
+    index.add(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    assert index.top(10).tolist() == []
+    assert index.bottom(10).tolist() == []
+
+
+def test_window_counts_only_recent_hours():
+    index = PopularityIndex(window_hours=48)
+    index.add([0, 0, 0, 1], [0, HOUR, 2 * HOUR, 10 * HOUR])
+    index.add([2, 2], [30 * HOUR, 31 * HOUR])
+    index.add([1], [52 * HOUR])
+
+    assert index.top(10).tolist() == [0, 1, 2]
+    assert index.top(10, window_hours=48).tolist() == [1, 2]
+    assert index.top(10, window_hours=24).tolist() == [2, 1]
+    assert index.top(10, window_hours=1).tolist() == [1]
+    with pytest.raises(ValueError):
+        index.bottom(10, window_hours=49)
+
+
+def test_ranking_is_sorted_once_per_read_after_blocks(monkeypatch):
+    index = PopularityIndex()
+    rankings = list()
+    rank = PopularityIndex._rank
+    monkeypatch.setattr(PopularityIndex, '_rank', lambda counts: rankings.append(counts) or rank(counts))
+    for block in range(3):
+        index.add([block, block], [0, 0])
+    assert rankings == []
+
+    assert index.top(10).tolist() == [0, 1, 2]
+    assert index.bottom(2).tolist() == [2, 1]
+    assert index.copy().top(1).tolist() == [0]
+    assert len(rankings) == 1
+
+
+def test_decayed_counts_prefer_recent_events():
+    index = PopularityIndex(half_life=HOUR)
+    index.add([0, 0, 0], [0, 0, 0])
+    index.add([1], [3 * HOUR])
+
+    assert index.top(10).tolist() == [0, 1]
+    assert index.top(10, decayed=True).tolist() == [1, 0]
+    assert np.allclose(index._decayed_counts, [3 / 8, 1])
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from modelapi.data_manager import DataManager
+from modelapi.prefetcher import BlockPrefetcher
+
+def test_prefetcher_keeps_order_and_applies_submit():
+    with BlockPrefetcher(range(20), queue_depth=2, submit=lambda block: block * 10) as blocks:
+        assert list(blocks) == [block * 10 for block in range(20)]
+    assert blocks.max_queue_size <= 2
+
+
+def test_prefetcher_raises_stream_errors():
+    def stream():
+        yield 1
+        raise ValueError('broken stream')
+
+    with BlockPrefetcher(stream(), queue_depth=1) as blocks:
+        with pytest.raises(ValueError):
+            list(blocks)
+
+
+def test_prefetcher_stops_fetching_on_early_exit():
+    fetched = list()
+    def stream():
+        for block in range(1000):
+            fetched.append(block)
+            yield block
+
+    with BlockPrefetcher(stream(), queue_depth=2) as blocks:
+        for block in blocks:
+            break
+    assert len(fetched) < 10
+    assert not blocks._thread.is_alive()
+
+
+@pytest.mark.parametrize('parse_workers', [0, 2])
+def test_pipelined_load_updates_matches_sequential(make_data_manager, fake_client, recorded_blocks, all_ids, parse_workers):
+    blocks = recorded_blocks * 3
+    sequential = make_data_manager()
+    for block in blocks:
+        transformed_data = sequential._tranform_raw_data(np.array(block, dtype=object))
+        sequential._recalculate_interactions(transformed_data)
+        sequential._popularity_index.add(transformed_data[:, 1].astype(np.int64), transformed_data[:, 4].astype(np.int64))
+    sequential._apply_interaction_updates()
+
+    pipelined = make_data_manager()
+    pipelined._client = fake_client(blocks)
+    pipelined._queue_depth = 1
+    pipelined._parse_workers = parse_workers
+    pipelined.load_updates()
+    pipelined.close()
+
+    assert all_ids(pipelined._users_id_converter) == all_ids(sequential._users_id_converter)
+    assert all_ids(pipelined._courses_id_converter) == all_ids(sequential._courses_id_converter)
+    assert pipelined._interactions.column('coefficient').tolist() == sequential._interactions.column('coefficient').tolist()
+    assert pipelined._popularity_index.top(100).tolist() == sequential._popularity_index.top(100).tolist()
+
+    stats = pipelined.get_ingestion_stats()
+    assert stats['blocks'] == len(blocks)
+    assert stats['rows'] == sum(len(DataManager._parse_raw_data(np.array(block, dtype=object))) for block in blocks)
@@ -0,0 +1,93 @@
+import asyncio
+
+from modelapi import processor as processor_module
+from modelapi.config import config
+from modelapi.recommendation_cache import RecommendationCache
+
+
+def test_cache_counts_hits_misses_and_evicts_least_recently_used():
+    cache = RecommendationCache(size=2, ttl=600)
+
+    assert cache.get(1, 10) is None
+    cache.put(1, 10, [1, 2])
+    cache.put(2, 10, [3, 4])
+    assert cache.get(1, 10) == [1, 2]
+    cache.put(3, 10, [5, 6])
+
+    assert cache.get(2, 10) is None
+    assert cache.get(3, 10) == [5, 6]
+    assert cache.get_stats() == {"size": 2, "max_size": 2, "model_version": 0, "hits": 2, "misses": 2, "evictions": 1}
+
+
+def test_cache_invalidates_changed_users_and_model_swaps():
+    cache = RecommendationCache(size=10, ttl=600)
+    cache.put(1, 10, [1])
+    cache.put(1, 5, [1])
+    cache.put(2, 10, [2])
+
+    cache.invalidate_users({1, 3})
+    assert cache.get(1, 10) is None
+    assert cache.get(2, 10) == [2]
+
+    cache.invalidate_model()
+    assert cache.get(2, 10) is None
+    assert cache.get_stats()["evictions"] == 3
+
+
+def test_cache_expires_entries_and_can_be_disabled():
+    cache = RecommendationCache(size=10, ttl=-1)
+    cache.put(1, 10, [1])
+    assert cache.get(1, 10) is None
+
+    disabled_cache = RecommendationCache(size=0, ttl=600)
+    disabled_cache.put(1, 10, [1])
+    assert disabled_cache.get(1, 10) is None
+
+
+def test_put_is_skipped_after_an_invalidation():
+    cache = RecommendationCache(size=10, ttl=600)
+    version = cache.get_version()
+    cache.invalidate_users(set())
+    cache.put(1, 10, [1], version)
+    assert cache.get(1, 10) == [1]
+
+    version = cache.get_version()
+    cache.invalidate_users({2})
+    cache.put(1, 10, [2], version)
+    assert cache.get(1, 10) == [1]
+    cache.put(1, 10, [3], cache.get_version())
+    assert cache.get(1, 10) == [3]
+
+
+class CheckingPublisher():
+    def __init__(self, processor, userid_in_csr) -> None:
+        self.processor = processor
+        self.userid_in_csr = userid_in_csr
+        self.cached = list()
+
+    def publish(self, snapshot, last_timestamps):
+        self.cached.append(self.processor._recommendation_cache.get(self.userid_in_csr, 10))
+
+
+class UnchangedWorker():
+    def __init__(self, model_type, model_path, keep_versions = 2) -> None:
+        pass
+
+    def start(self):
+        pass
+
+    def fit(self, model, is_full_fit, interactions, users):
+        return model
+
+
+def test_changed_users_are_invalidated_before_the_snapshot_is_shared(make_data_manager, fake_client, recorded_blocks, monkeypatch, tmp_path):
+    monkeypatch.setattr(processor_module, 'TrainingWorker', UnchangedWorker)
+    monkeypatch.setitem(config['paths'], 'saved_models', str(tmp_path) + '/models/')
+    make_data_manager()
+    processor = processor_module.Processor()
+    processor._snapshot_publisher = CheckingPublisher(processor, 0)
+    processor._data_manager._client = fake_client(recorded_blocks)
+    processor._recommendation_cache.put(0, 10, [1])
+
+    asyncio.run(processor._load_updates_and_retrain())
+    assert processor._snapshot_publisher.cached[0] is None
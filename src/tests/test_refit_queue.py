@@ -0,0 +1,43 @@
+import numpy as np
+
+from modelapi.refit_queue import RefitQueue
+
+
+def test_take_prioritises_recently_active_users():
+    queue = RefitQueue()
+    queue.push([5, 1, 7], [100, 300, 200])
+    queue.push([5, 2], [400, 50])
+
+    users, _ = queue.take(batch_size=2)
+    assert users.tolist() == [1, 5]
+    users, _ = queue.take()
+    assert users.tolist() == [1, 2, 5, 7]
+
+
+def test_commit_keeps_users_changed_during_fit():
+    queue = RefitQueue()
+    queue.push([1, 2, 3], [10, 20, 30])
+    users, generation = queue.take(batch_size=2)
+    queue.push([3, 4], [40, 40])
+
+    queue.commit(users, generation)
+    assert queue.get_users().tolist() == [1, 3, 4]
+
+    queue.push([1], [50])
+    _, generation = queue.take()
+    queue.push([5], [60])
+    queue.commit(None, generation)
+    assert queue.get_users().tolist() == [5]
+
+
+def test_state_and_compaction_keep_last_activity():
+    queue = RefitQueue()
+    queue.push([0, 2, 3], [30, 10, 20])
+    queue.compact_users(np.array([0, -1, 1, -1]))
+    assert queue.get_users().tolist() == [0, 1]
+
+    restored = RefitQueue.from_state(queue.get_state())
+    users, generation = restored.take(batch_size=1)
+    assert users.tolist() == [0]
+    restored.commit(users, generation)
+    assert restored.get_users().tolist() == [1]
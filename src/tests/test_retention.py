@@ -0,0 +1,110 @@
+import asyncio
+
+import numpy as np
+import pytest
+from implicit.als import AlternatingLeastSquares as ALS
+
+from modelapi import processor as processor_module
+from modelapi.config import config
+from modelapi.hybrid_models.linear import LinearHybrid
+
+ANCHORS = ['', '#program', '#teachers', '#price']
+
+
+def make_raw_blocks(rng, blocks_num, block_size, users_num, courses_num):
+    blocks = list()
+    for i in range(blocks_num):
+        block = np.empty((block_size, 4), dtype=object)
+        block[:, 0] = rng.choice(np.array(['page_view', 'click', 'submit_form', 'dom_content_loaded'], dtype=object), block_size)
+        block[:, 1] = ['https://www.hse.ru/edu/dpo/%d%s' % (course, anchor) for course, anchor in zip(rng.integers(0, courses_num, block_size), rng.choice(ANCHORS, block_size))]
+        block[:, 2] = ['a|user%d|b' % user for user in rng.integers(0, users_num, block_size)]
+        block[:, 3] = np.sort(rng.integers(1000 * i, 1000 * (i + 1), block_size))
+        blocks.append(block)
+    return blocks
+
+
+def ingest(data_manager, blocks):
+    for block in blocks:
+        data_manager._recalculate_interactions(data_manager._tranform_raw_data(block.copy()))
+    data_manager._apply_interaction_updates()
+
+
+def make_manager(make_data_manager, courses_num):
+    data_manager = make_data_manager()
+    data_manager._courses_id_converter.add_many([str(course) for course in range(courses_num)])
+    return data_manager
+
+
+def assert_same_users(data_manager, expected, all_ids):
+    assert all_ids(data_manager._users_id_converter) == all_ids(expected._users_id_converter)
+    assert all_ids(data_manager._interactions._anchors_id_converter) == all_ids(expected._interactions._anchors_id_converter)
+    for name in data_manager._interactions._columns:
+        assert data_manager._interactions.column(name).tolist() == expected._interactions.column(name).tolist()
+    assert data_manager._interactions._anchor_keys.tolist() == expected._interactions._anchor_keys.tolist()
+    assert (data_manager.get_interaction_csr_matrix() != expected.get_interaction_csr_matrix()).nnz == 0
+    assert data_manager.get_interaction_csr_matrix().shape == expected.get_interaction_csr_matrix().shape
+    assert data_manager.get_changed_users() == expected.get_changed_users()
+
+
+def test_eviction_matches_ingesting_only_active_users(make_data_manager, all_ids):
+    rng = np.random.default_rng(0)
+    blocks = make_raw_blocks(rng, blocks_num=4, block_size=300, users_num=60, courses_num=8)
+    data_manager = make_manager(make_data_manager, 8)
+    ingest(data_manager, blocks[:3])
+    memory_before = data_manager.get_memory_usage()
+
+    kept_users = data_manager.evict_inactive_users(horizon=1000, now=3000)
+    active = {block[i, 2] for block in blocks[:3] for i in range(len(block)) if block[i, 3] >= 2000}
+    expected = make_manager(make_data_manager, 8)
+    ingest(expected, [block[np.isin(block[:, 2], list(active))] for block in blocks[:3]])
+
+    assert 0 < len(kept_users) < 60
+    assert_same_users(data_manager, expected, all_ids)
+    assert data_manager.get_memory_usage()['interactions'] < memory_before['interactions']
+    for userid in ['user0', 'user1', 'user2']:
+        assert data_manager.get_recently_viewed(userid, 3) == expected.get_recently_viewed(userid, 3)
+
+    ingest(data_manager, blocks[3:])
+    ingest(expected, blocks[3:])
+    assert_same_users(data_manager, expected, all_ids)
+    assert data_manager.evict_inactive_users(horizon=10000, now=4000) is None
+
+
+def test_compact_users_keeps_factors_of_kept_users():
+    model = LinearHybrid.load()
+    model.model_collaborative = ALS(factors=4)
+    model.model_collaborative.user_factors = np.arange(20, dtype=np.float32).reshape(5, 4)
+
+    model.compact_users(np.array([0, 2, 3, 7]))
+    assert model.model_collaborative.user_factors.tolist() == np.arange(20, dtype=np.float32).reshape(5, 4)[[0, 2, 3]].tolist()
+    assert model.model_collaborative.user_norms.shape == (3,)
+
+
+class FailingWorker():
+    def __init__(self, model_type, model_path, keep_versions = 2) -> None:
+        pass
+
+    def start(self):
+        pass
+
+    def compact_users(self, users):
+        raise RuntimeError('Training worker failed')
+
+
+def test_failed_model_compaction_keeps_processor_state(make_data_manager, all_ids, monkeypatch, tmp_path):
+    monkeypatch.setattr(processor_module, 'TrainingWorker', FailingWorker)
+    monkeypatch.setitem(config['paths'], 'saved_models', str(tmp_path) + '/models/')
+    make_data_manager()
+    processor = processor_module.Processor()
+    ingest(processor._data_manager, make_raw_blocks(np.random.default_rng(0), blocks_num=3, block_size=300, users_num=60, courses_num=8))
+    processor._retention_horizon = 1000
+    users = all_ids(processor._data_manager._users_id_converter)
+    interactions = processor._data_manager.get_interaction_csr_matrix()
+    snapshot, model = processor._snapshot, processor._model
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(processor.evict_inactive_users())
+
+    assert all_ids(processor._data_manager._users_id_converter) == users
+    assert (processor._data_manager.get_interaction_csr_matrix() != interactions).nnz == 0
+    assert processor._snapshot is snapshot and processor._model is model
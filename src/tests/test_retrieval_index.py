@@ -0,0 +1,70 @@
+import numpy as np
+import scipy.sparse as sp
+
+from modelapi.retrieval_index import ExactIndex, IVFIndex, make_retrieval_index
+
+
+def make_factors(rng, users_num, items_num, factors=32, topics_num=50):
+    """Returns user and item factors grouped around topics like ALS factors, items with varying norms."""
+    topics = rng.normal(size=(topics_num, factors))
+    item_factors = topics[rng.integers(topics_num, size=items_num)] + 0.5 * rng.normal(size=(items_num, factors))
+    item_factors *= rng.lognormal(sigma=0.5, size=(items_num, 1))
+    user_factors = topics[rng.integers(topics_num, size=users_num)] + 0.5 * rng.normal(size=(users_num, factors))
+    return user_factors.astype(np.float32), item_factors.astype(np.float32)
+
+
+def recall(recs, expected):
+    return np.mean([len(set(row) & set(expected_row)) / len(expected_row) for row, expected_row in zip(recs, expected)])
+
+
+def test_exact_index_matches_brute_force(monkeypatch):
+    rng = np.random.default_rng(0)
+    user_factors, item_factors = make_factors(rng, 20, 300)
+    liked = sp.random(20, 310, density=0.1, format='csr', random_state=rng)
+    monkeypatch.setattr(ExactIndex, 'chunk_size', 7 * 300)
+
+    recs, scores = ExactIndex(item_factors).search(user_factors, 10, liked, filter_items=np.array([0, 1, 2, 3, 4, 305]))
+
+    expected_scores = user_factors @ item_factors.T
+    expected_scores[liked[:, :300].nonzero()] = -np.inf
+    expected_scores[:, :5] = -np.inf
+    assert np.array_equal(recs, np.argsort(-expected_scores, axis=1, kind='stable')[:, :10])
+    assert np.allclose(scores, np.sort(expected_scores, axis=1)[:, ::-1][:, :10])
+
+    recs, scores = ExactIndex(item_factors[:3]).search(user_factors[:2], 5, liked[:2, :3] * 0, filter_items=[1])
+    assert (recs[:, 2:] == -1).all() and np.isinf(scores[:, 2:]).all()
+
+
+def test_ivf_index_recall():
+    rng = np.random.default_rng(1)
+    user_factors, item_factors = make_factors(rng, 100, 3000)
+    expected = ExactIndex(item_factors).search(user_factors, 20)[0]
+    index = IVFIndex(item_factors, clusters_num=32, probes=32)
+
+    assert recall(index.search(user_factors, 20)[0], expected) == 1
+    recalls = list()
+    for probes in [1, 4, 16]:
+        index.set_probes(probes)
+        recalls.append(recall(index.search(user_factors, 20)[0], expected))
+    assert recalls == sorted(recalls)
+    assert recalls[-1] > 0.9
+
+
+def test_index_state_round_trip():
+    rng = np.random.default_rng(2)
+    user_factors, item_factors = make_factors(rng, 10, 500)
+    params = {'index': 'ivf', 'clusters_num': 8, 'probes': 2}
+    index = make_retrieval_index(item_factors, params)
+    restored = make_retrieval_index(item_factors, params, index.get_state())
+
+    assert isinstance(restored, IVFIndex)
+    assert np.array_equal(restored.search(user_factors, 5)[0], index.search(user_factors, 5)[0])
+    assert isinstance(make_retrieval_index(item_factors, {'index': 'exact'}, index.get_state()), ExactIndex)
+    assert make_retrieval_index(None, params) is None
+
+    reconfigured = make_retrieval_index(item_factors, dict(params, probes=8), index.get_state())
+    assert reconfigured.get_state()['probes'] == 8
+    assert np.array_equal(reconfigured.get_state()['centroids'], index.get_state()['centroids'])
+    rebuilt = make_retrieval_index(item_factors, dict(params, clusters_num=4), index.get_state())
+    assert len(rebuilt.get_state()['centroids']) == 4
+    assert rebuilt.get_state()['probes'] == 2
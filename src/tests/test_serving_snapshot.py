@@ -0,0 +1,29 @@
+import numpy as np
+
+
+def test_snapshot_is_not_changed_by_later_updates(make_data_manager, fake_client, recorded_blocks):
+    [first_block, second_block] = recorded_blocks
+    data_manager = make_data_manager()
+    data_manager._client = fake_client([first_block])
+    data_manager.load_updates()
+
+    snapshot = data_manager.make_snapshot(model=None)
+    interactions = snapshot.interactions.toarray()
+    users_num = snapshot.users_id_converter.get_count()
+    top = snapshot.popularity_index.top(100).tolist()
+    changed_users = set(snapshot.changed_users)
+
+    shifted_block = [row[:3] + [row[3] + 3600] for row in first_block + second_block]
+    data_manager._client = fake_client([shifted_block])
+    data_manager.load_updates()
+
+    assert data_manager.get_interaction_csr_matrix().shape[0] > users_num
+    np.testing.assert_array_equal(snapshot.interactions.toarray(), interactions)
+    assert snapshot.users_id_converter.get_count() == users_num
+    assert snapshot.popularity_index.top(100).tolist() == top
+    assert snapshot.changed_users == changed_users
+
+    new_userid = data_manager._users_id_converter.get_backward(users_num)
+    assert snapshot.users_id_converter.get_forward(new_userid) is None
+    assert snapshot.users_id_converter.get_backward(users_num) is None
+    assert data_manager.make_snapshot(model=None).users_id_converter.get_forward(new_userid) == users_num
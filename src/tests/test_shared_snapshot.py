@@ -0,0 +1,143 @@
+import copy
+import os
+
+import numpy as np
+import pytest
+from implicit.nearest_neighbours import CosineRecommender
+
+from modelapi.hybrid_models.linear import LinearHybrid
+from modelapi.processor import Processor
+from modelapi.shared_snapshot import SnapshotPublisher, SnapshotReader
+from modelapi.similar_items import SimilarItemsTable
+
+
+def make_raw_block(rng, size, users_num, courses_num):
+    return [
+        [
+              str(rng.choice(['page_view', 'click', 'submit_form', 'start_session']))
+            , 'https://www.hse.ru/edu/dpo/%d%s' % (rng.integers(courses_num), rng.choice(['', '#program', '#price']))
+            , 'a|%d|b' % rng.integers(users_num)
+            , int(timestamp)
+        ]
+        for timestamp in rng.permutation(size) + 1669366907
+    ]
+
+
+@pytest.fixture
+def leader_state(make_data_manager, fake_client):
+    rng = np.random.default_rng(0)
+    data_manager = make_data_manager()
+    data_manager._client = fake_client([make_raw_block(rng, 600, 40, 12)])
+    data_manager.load_updates()
+
+    interactions = data_manager.get_interaction_csr_matrix()
+    model = LinearHybrid.load(None)
+    model.model_collaborative.iterations = 3
+    model.fit(interactions, interactions, show_progress=False)
+    content_model = CosineRecommender(K=131)
+    content_model.fit(interactions.T.tocsr(), show_progress=False)
+
+    snapshot = data_manager.make_snapshot(model)._replace(content_model=content_model)
+    return data_manager, snapshot
+
+
+def test_reader_serves_the_published_snapshot(leader_state, tmp_path):
+    data_manager, snapshot = leader_state
+    SnapshotPublisher(str(tmp_path), keep_versions=2).publish(snapshot, data_manager.get_last_timestamps(snapshot.interactions))
+    processor = Processor(snapshot_reader=SnapshotReader(str(tmp_path), LinearHybrid, refresh_seconds=0))
+    shared = processor.get_snapshot()
+
+    for converter, expected in [(shared.users_id_converter, snapshot.users_id_converter), (shared.courses_id_converter, snapshot.courses_id_converter)]:
+        assert converter.get_count() == expected.get_count()
+        ids = [expected.get_backward(id) for id in range(expected.get_count())]
+        assert [converter.get_backward(id) for id in range(converter.get_count())] == ids
+        assert [converter.get_forward(id) for id in ids] == list(range(len(ids)))
+        assert converter.get_forward('unknown') is None
+
+    assert (shared.interactions != snapshot.interactions).nnz == 0
+    assert shared.popularity_index.top(100).tolist() == snapshot.popularity_index.top(100).tolist()
+    users = np.arange(10)
+    for recs, expected in zip(shared.model.recommend(users, shared.interactions[users], N=5), snapshot.model.recommend(users, snapshot.interactions[users], N=5)):
+        np.testing.assert_array_equal(recs, expected)
+    np.testing.assert_array_equal(shared.content_model.similar_items([0, 1], N=3)[0], snapshot.content_model.similar_items([0, 1], N=3)[0])
+
+    for userid in ['0', '7', '39']:
+        assert processor.get_recently_viewed(userid, 5) == data_manager.get_recently_viewed(userid, 5)
+        assert processor.get_user_course_coefficient(userid, '3') == pytest.approx(data_manager.get_user_course_coefficient(userid, '3'), rel=1e-6)
+
+
+def test_publisher_reclaims_old_versions(leader_state, tmp_path):
+    data_manager, snapshot = leader_state
+    publisher = SnapshotPublisher(str(tmp_path), keep_versions=2)
+    reader = SnapshotReader(str(tmp_path), LinearHybrid, refresh_seconds=0)
+    last_timestamps = data_manager.get_last_timestamps(snapshot.interactions)
+
+    first_version = publisher.publish(snapshot, last_timestamps)
+    attached = reader.get_snapshot()
+    versions = [publisher.publish(snapshot, last_timestamps) for _ in range(3)]
+
+    assert sorted(name for name in os.listdir(tmp_path) if name != 'current') == versions[-2:]
+    assert first_version not in os.listdir(tmp_path)
+    assert attached.interactions.sum() == pytest.approx(snapshot.interactions.sum())
+    assert reader.get_snapshot() is not attached
+    assert reader.get_version() == versions[-1]
+
+
+def test_publisher_links_unchanged_model_files(leader_state, tmp_path):
+    data_manager, snapshot = leader_state
+    publisher = SnapshotPublisher(str(tmp_path), keep_versions=2)
+    last_timestamps = data_manager.get_last_timestamps(snapshot.interactions)
+    inode = lambda version, name: os.stat(os.path.join(tmp_path, version, name + '.npy')).st_ino
+
+    first_version = publisher.publish(snapshot, last_timestamps)
+    second_version = publisher.publish(snapshot, last_timestamps)
+    for name in ['user_factors', 'item_factors', 'similarity_data', 'content_similarity_data']:
+        assert inode(first_version, name) == inode(second_version, name)
+    assert inode(first_version, 'interactions_data') != inode(second_version, 'interactions_data')
+
+    model = copy.copy(snapshot.model)
+    model.model_collaborative = copy.copy(model.model_collaborative)
+    model.model_collaborative.user_factors = model.model_collaborative.user_factors * 2
+    third_version = publisher.publish(snapshot._replace(model=model), last_timestamps)
+    assert inode(second_version, 'user_factors') != inode(third_version, 'user_factors')
+    assert inode(second_version, 'content_similarity_data') == inode(third_version, 'content_similarity_data')
+
+    shared = SnapshotReader(str(tmp_path), LinearHybrid, refresh_seconds=0).get_snapshot()
+    np.testing.assert_array_equal(shared.model.model_collaborative.user_factors, model.model_collaborative.user_factors)
+    np.testing.assert_array_equal(shared.model.model_collaborative.item_factors, snapshot.model.model_collaborative.item_factors)
+
+
+def test_reader_serves_before_the_first_fit(make_data_manager, fake_client, tmp_path):
+    data_manager = make_data_manager()
+    data_manager._client = fake_client([make_raw_block(np.random.default_rng(0), 600, 40, 12)])
+    data_manager.load_updates()
+    snapshot = data_manager.make_snapshot(LinearHybrid.load(None))
+    SnapshotPublisher(str(tmp_path / 'serving'), keep_versions=2).publish(snapshot, data_manager.get_last_timestamps(snapshot.interactions))
+
+    processor = Processor(snapshot_reader=SnapshotReader(str(tmp_path / 'serving'), LinearHybrid, refresh_seconds=0))
+    assert len(processor.recommend_batch(['0', '7'], N=5)) == 2
+    empty = Processor(snapshot_reader=SnapshotReader(str(tmp_path / 'missing'), LinearHybrid, refresh_seconds=0))
+    assert empty.recommend_batch(['0'], N=5) == [None]
+
+
+def test_reader_attaches_published_similar_items_tables(leader_state, tmp_path):
+    data_manager, snapshot = leader_state
+    similarity = snapshot.content_model.similarity
+    snapshot = snapshot._replace(
+          adv_similar_items=SimilarItemsTable(similarity, [3, 5, 7])
+        , bottom_similar_items=SimilarItemsTable(similarity, snapshot.popularity_index.bottom(4))
+        , fallback_similar_items=SimilarItemsTable(snapshot.model.model_content.similarity, snapshot.popularity_index.top(12))
+    )
+    publisher = SnapshotPublisher(str(tmp_path), keep_versions=2)
+    last_timestamps = data_manager.get_last_timestamps(snapshot.interactions)
+    first_version = publisher.publish(snapshot, last_timestamps)
+    second_version = publisher.publish(snapshot, last_timestamps)
+    assert os.stat(os.path.join(tmp_path, first_version, 'adv_similar_items_rows_indices.npy')).st_ino == os.stat(os.path.join(tmp_path, second_version, 'adv_similar_items_rows_indices.npy')).st_ino
+
+    processor = Processor(snapshot_reader=SnapshotReader(str(tmp_path), LinearHybrid, refresh_seconds=0))
+    shared = processor.get_snapshot()
+    courses = list(range(snapshot.courses_id_converter.get_count())) + [100]
+    for name in ['adv_similar_items', 'bottom_similar_items', 'fallback_similar_items']:
+        expected = getattr(snapshot, name)
+        assert [row.tolist() for row in getattr(shared, name).lookup(courses, 3)] == [row.tolist() for row in expected.lookup(courses, 3)]
+    assert processor.get_snapshot() is shared
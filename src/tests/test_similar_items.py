@@ -0,0 +1,50 @@
+import numpy as np
+import scipy.sparse as sp
+from implicit.nearest_neighbours import CosineRecommender
+
+from modelapi.similar_items import SimilarItemsTable
+
+
+def make_content_model(rng, courses_num):
+    model = CosineRecommender(K=8)
+    model.fit(sp.csr_matrix(rng.random((5, courses_num)) ** 4), show_progress=False)
+    return model
+
+
+def similar_items(model, courses, N, items):
+    similar = model.similar_items(courses, N, items=items)[0]
+    return [set(row[row >= 0].tolist()) for row in similar]
+
+
+def test_lookup_matches_similar_items():
+    rng = np.random.default_rng(0)
+    model = make_content_model(rng, 40)
+    candidates = rng.permutation(40)[:15]
+    table = SimilarItemsTable(model.similarity, candidates)
+    courses = np.arange(40)
+
+    for N, candidates_num in [(3, 15), (2, 6), (10, 4)]:
+        expected = similar_items(model, courses, N, candidates[:candidates_num])
+        lookup = table.lookup(courses, N, candidates_num)
+        for course, row in zip(courses, lookup):
+            assert len(row) == len(expected[course])
+            # candidates that are not neighbours tie, so only the neighbours must match exactly
+            neighbours = [id for id in row if model.similarity[course, id] > 0]
+            assert set(neighbours) <= expected[course]
+            assert neighbours == sorted(neighbours, key=lambda id: -model.similarity[course, id])
+
+
+def test_updated_equals_rebuilt_table():
+    rng = np.random.default_rng(1)
+    model = make_content_model(rng, 50)
+    table = SimilarItemsTable(model.similarity, np.arange(10))
+
+    for _ in range(5):
+        candidates = rng.permutation(55)[:12]
+        updated = table.updated(candidates)
+        rebuilt = SimilarItemsTable(model.similarity, candidates)
+        courses = np.arange(55)
+        for a, b in zip(updated.lookup(courses, 6, 12), rebuilt.lookup(courses, 6, 12)):
+            assert np.array_equal(a, b)
+        assert table.updated(table._candidates) is table
+        table = updated
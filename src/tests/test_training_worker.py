@@ -0,0 +1,72 @@
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from modelapi.hybrid_models.linear import LinearHybrid
+from modelapi.training_worker import TrainingWorker, _share_arrays, _take_arrays
+
+
+class RunningProcess():
+    def is_alive(self):
+        return True
+
+
+class DeadConnection():
+    def __init__(self) -> None:
+        self.sent = None
+
+    def send(self, message):
+        self.sent = message
+
+    def recv(self):
+        raise EOFError()
+
+
+def test_fits_are_saved_before_they_are_returned_and_survive_restarts(tmp_path):
+    rng = np.random.default_rng(0)
+    interactions = sp.random(50, 12, density=0.3, format='csr', dtype=np.float32, random_state=rng)
+    path = str(tmp_path) + '/'
+    worker = TrainingWorker(LinearHybrid, path)
+    worker.start()
+    try:
+        model = worker.fit(LinearHybrid.load(path), True, interactions[:40], None)
+        served = np.array(model.model_collaborative.user_factors)
+        assert served.shape[0] == 40
+
+        partial = worker.fit(model, False, interactions, range(35, 50))
+        assert partial.model_collaborative.user_factors.shape[0] == 50
+        assert np.array_equal(model.model_collaborative.user_factors, served)
+        assert np.array_equal(partial.model_collaborative.user_factors[:35], served[:35])
+        assert np.array_equal(partial.model_collaborative.item_factors, model.model_collaborative.item_factors)
+        assert np.array_equal(LinearHybrid.load(path).model_collaborative.user_factors, partial.model_collaborative.user_factors)
+
+        worker._process.kill()
+        worker._process.join()
+        compacted = worker.compact_users(np.arange(50))
+        assert np.array_equal(compacted.model_collaborative.user_factors, partial.model_collaborative.user_factors)
+    finally:
+        worker.stop()
+    assert LinearHybrid.load(path).model_collaborative.user_factors.shape[0] == 50
+
+
+def test_shared_arrays_are_unlinked_when_worker_dies(tmp_path):
+    worker = TrainingWorker(LinearHybrid, str(tmp_path / 'model'))
+    worker._process = RunningProcess()
+    worker._connection = DeadConnection()
+
+    with pytest.raises(RuntimeError):
+        worker._send('fit', True, {'users': np.arange(3)})
+
+    _, _, description = worker._connection.sent
+    for block_name, _, _ in description.values():
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=block_name)
+
+
+def test_shared_arrays_are_taken_once():
+    description = _share_arrays({'users': np.arange(3)})
+    assert _take_arrays(description)['users'].tolist() == [0, 1, 2]
+    with pytest.raises(FileNotFoundError):
+        _take_arrays(description)
@@ -0,0 +1,108 @@
+import re
+
+import numpy as np
+import pytest
+
+from modelapi.data_manager import HOME_PAGE
+
+class LegacyIdConverter():
+    """The dict-based IdConverter the vectorized transform replaced, pinned as the reference."""
+
+    def __init__(self) -> None:
+        self.forward = dict()
+        self.backward = list()
+
+    def add(self, id):
+        if id not in self.forward:
+            self.forward[id] = len(self.backward)
+            self.backward.append(id)
+        return self.forward[id]
+
+
+def legacy_tranform_raw_data(users_id_converter, courses_id_converter, raw_data):
+    # Per-cell reference implementation. np.vectorize is pinned to object output here: with an
+    # inferred str dtype it truncated every cell to the width of the first one and turned None into 'None'.
+    def vectorize(function):
+        return np.vectorize(function, otypes=[object])
+
+    def clear_link(x):
+        x = x.split('?')[0]
+        x = x.split(':~:text')[0]
+        x = re.sub('/#', '#', x)
+        x = re.sub('[#/]$', '', x)
+        x = re.sub('%23', '#', x)
+        return x
+
+    def get_anchor(link):
+        arr = link.split(sep='#')
+        arr.append(None)
+        return arr[1]
+
+    def get_course_id_from_link(link: str):
+        if link.find(HOME_PAGE) != 0:
+            return None
+        start = len(HOME_PAGE)
+        end = start
+        while end != len(link) and link[end].isnumeric():
+            end += 1
+        return link[start:end]
+
+    raw_data = raw_data[:, :3]
+    raw_data[:, 1] = vectorize(clear_link)(raw_data[:, 1])
+    raw_data[:, 2] = vectorize(lambda x: x.split('|')[1])(raw_data[:, 2])
+    raw_data = raw_data[~np.any((raw_data == 'nan') | (raw_data == 'none') | (raw_data == None), axis=1)]
+
+    raw_data = np.concatenate((raw_data, vectorize(get_anchor)(raw_data[:, 1]).reshape(-1, 1)), axis=1)
+    raw_data[:, 1] = vectorize(get_course_id_from_link)(raw_data[:, 1])
+
+    raw_data[:, 2] = vectorize(users_id_converter.add)(raw_data[:, 2]).astype(np.int32)
+    raw_data[:, 1] = vectorize(courses_id_converter.add)(raw_data[:, 1]).astype(np.int16)
+
+    return raw_data
+
+
+def test_transform_matches_legacy_on_recorded_blocks(make_data_manager, recorded_blocks, all_ids):
+    legacy_users, legacy_courses = LegacyIdConverter(), LegacyIdConverter()
+    data_manager = make_data_manager()
+    for courseid in all_ids(data_manager._courses_id_converter):
+        legacy_courses.add(courseid)
+
+    for block in recorded_blocks:
+        expected = legacy_tranform_raw_data(legacy_users, legacy_courses, np.array(block, dtype=object))
+        transformed = data_manager._tranform_raw_data(np.array(block, dtype=object))
+
+        assert transformed[:, :4].shape == expected.shape
+        assert transformed[:, :4].tolist() == expected.tolist()
+
+    assert all_ids(data_manager._users_id_converter) == legacy_users.backward
+    assert all_ids(data_manager._courses_id_converter) == legacy_courses.backward
+
+
+@pytest.mark.parametrize('link, expected', [
+    ('https://www.hse.ru/edu/dpo/1?x=1#a', ['1', None]),
+    ('https://www.hse.ru/edu/dpo/1/#a/', ['1', 'a']),
+    ('https://www.hse.ru/edu/dpo/1%23a', ['1', 'a']),
+    ('https://www.hse.ru/edu/dpo/1#a#b', ['1', 'a']),
+    ('https://www.hse.ru/edu/dpo/x#', ['', None]),
+    ('https://www.hse.ru/about', [None, None]),
+])
+def test_transform_parses_course_and_anchor(make_data_manager, link, expected):
+    data_manager = make_data_manager()
+    transformed = data_manager._tranform_raw_data(np.array([['page_view', link, 'a|user|b', 0]], dtype=object))
+
+    [[_, courseid, _, anchor, _]] = transformed
+    assert [data_manager._courses_id_converter.get_backward(courseid), anchor] == expected
+
+
+def test_transform_empty_block(make_data_manager):
+    data_manager = make_data_manager()
+    assert data_manager._tranform_raw_data(np.empty((0, 4), dtype=object)).shape == (0, 5)
+
+
+def test_transform_keeps_event_timestamps(make_data_manager, recorded_blocks):
+    data_manager = make_data_manager()
+    [block, _] = recorded_blocks
+
+    transformed = data_manager._tranform_raw_data(np.array(block, dtype=object))
+
+    assert transformed[:, 4].tolist() == [row[3] for row in block if 'nan' not in row[2] and 'nan' != row[1] and 'none' != row[0]]